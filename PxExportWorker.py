@@ -1,33 +1,128 @@
-from PxParser import PxParser
+import multiprocessing
+import multiprocessing.connection
+import os
+import time
+from pxparser import PxParser, PxCancelToken, PxCancelled
 from PyQt5.QtCore import QThread, pyqtSignal
 
+PROGRESS_INTERVAL = 0.25  # Seconds between progress updates
+
+
+def _export(target, filename, options, conn, cancel_event):
+    """ Export one log in a child process, send progress and result through conn """
+
+    parser = PxParser()
+    parser.set_namespace(options['namespace'])
+    parser.set_time_msg(options['time_msg'])
+    parser.set_msg_ignore(options['msg_ignore'])
+    parser.set_output_file(filename, options['export_as'])
+    if options['use_interpolation']:
+        parser.enable_interpolation(options['interpolation_period'])
+    parser.set_msg_filter(options['filter'])
+    if options['collect_stats']:
+        parser.enable_stats()
+    parser.set_progress_callback(
+        lambda progress: conn.send(('progress', progress)), PROGRESS_INTERVAL)
+    parser.set_cancel_token(PxCancelToken(cancel_event))
+
+    try:
+        parser.process(target)
+    except PxCancelled:
+        conn.send(('cancelled', None))
+        return
+    except Exception as e:
+        conn.send(('error', "%s: %s" % (type(e).__name__, e)))
+        return
+    if parser.stats is not None:
+        conn.send(('stats', parser.stats))
+    conn.send(('done', None))
+
 
 class PxExportWorker(QThread):
     """
-    Class for threaded exportting
+    Class for threaded exporting. Export runs in its own process with its own
+    parser, the thread relays its progress as signals. Cancelling asks the parser
+    to stop, so it closes the output file properly
     """
 
-    finished = pyqtSignal()
+    progress = pyqtSignal(str, float, float, float)  # Target, percent, bytes/s, ETA in s or -1
 
-    parser = PxParser()
     target = ''
 
     def __init__(self, target, filename, namespace=dict(), filter=[], export_as='txt', time_msg="GPS_TimeUS",
-                 data_msg="MSG_Message", msg_ignore=[], use_interpolation=False) -> None:
+                 data_msg="MSG_Message", msg_ignore=[], use_interpolation=False,
+                 interpolation_period=100, collect_stats=False) -> None:
         super(self.__class__, self).__init__()
-        self.parser.set_namespace(namespace)
-        self.parser.set_time_msg(time_msg)
-        self.parser.set_msg_ignore(msg_ignore)
-        self.parser.set_output_file(filename, export_as)
-        if use_interpolation:
-            self.parser.enable_interpolation()
-        self.parser.set_msg_filter(filter)
         self.target = target
+        self.filename = filename
+        self.options = {'namespace': namespace, 'filter': filter, 'export_as': export_as,
+                        'time_msg': time_msg, 'msg_ignore': msg_ignore,
+                        'use_interpolation': use_interpolation,
+                        'interpolation_period': interpolation_period,
+                        'collect_stats': collect_stats}
+        self.succeeded = False
+        self.stats = None  # PxStats of finished export if collected
+        self.message = 'Queued'  # Result description, valid once finished
+        self.__process = None
+        self.__cancel_event = None
+        self.__cancelled = False
 
     def run(self):
-        self.parser.process(self.target)
-        self.finished.emit()
+        if self.__cancelled:
+            self.message = 'Cancelled'
+            return
+        context = multiprocessing.get_context('spawn')  # Don't fork Qt
+        reader, writer = context.Pipe(duplex=False)
+        self.__cancel_event = context.Event()
+        if self.__cancelled:  # Cancelled while starting
+            self.__cancel_event.set()
+        self.__process = context.Process(target=_export, daemon=True,
+                                         args=(self.target, self.filename, self.options, writer, self.__cancel_event))
+        start = time.monotonic()
+        try:
+            self.__process.start()
+        except Exception as e:
+            self.message = "Can't start export: %s" % e
+            return
+        finally:
+            writer.close()  # Child holds its own end
+        result = None
+        while result is None:
+            # Sleep until a message arrives or the process exits, no polling
+            ready = multiprocessing.connection.wait(
+                [reader, self.__process.sentinel])
+            if reader not in ready:
+                break  # Exited without result
+            try:
+                kind, value = reader.recv()
+            except EOFError:
+                break
+            if kind == 'progress':
+                self.progress.emit(self.target, value.percent, value.bytes_per_s,
+                                   -1 if value.eta is None else value.eta)
+            elif kind == 'stats':
+                self.stats = value
+            else:
+                result = kind, value
+        self.__process.join()
+        reader.close()
+
+        if result is None:
+            self.message = 'Export process exited with code %s' % self.__process.exitcode
+        elif result[0] == 'cancelled':
+            self.message = 'Cancelled'
+        elif result[0] == 'error':
+            self.message = result[1]
+        else:
+            elapsed = time.monotonic() - start
+            size = os.path.getsize(self.target)
+            self.succeeded = True
+            self.message = 'Done, %.1f MB/s' % (size / 1e6 / elapsed if elapsed else 0)
+            self.progress.emit(self.target, 100, 0, 0)
+
+    def cancel(self):
+        """ Ask export to stop, it closes its output file and exits """
 
-    def stop(self):
-        self.threadactive = False
-        self.terminate()
+        self.__cancelled = True
+        if self.__cancel_event is not None:
+            self.__cancel_event.set()
@@ -1,17 +1,18 @@
 # -*- coding: utf-8 -*-
 
 from PxExportWorker import PxExportWorker
+import os
 import sys
-import time
+from collections import deque
 from PxUILayout import PxUILayout
-from PyQt5 import QtCore, QtWidgets
+from pxcli import output_names
+from PyQt5 import QtCore, QtGui, QtWidgets
 
 
 class UIController(QtWidgets.QMainWindow, PxUILayout):
 
     __file_list = set()
-    progess = 0  # Export progress
-    __threads = []
+    max_workers = os.cpu_count() or 1  # Exports running at once
 
     filter = [('GPS', ['TimeUS', 'Lng', 'Lat', 'Spd']), ('BARO', ['Alt']),
               ('AHR2', ['Roll', 'Pitch', 'Yaw']), ('MSG', ['Message'])]
@@ -19,6 +20,7 @@ class UIController(QtWidgets.QMainWindow, PxUILayout):
                     'BARO_Alt': 'Высота', 'AHR2_Roll': 'Крен', 'AHR2_Pitch': 'Тангаж', 'AHR2_Yaw': 'Рысканье', 'MSG_Message': 'Статус'}
     en_namespace = {'GPS_TimeUS': 'Time', 'GPS_Lng': 'Longitude', 'GPS_Lat': 'Latitude', 'GPS_Spd': 'Speed',
                     'BARO_Alt': 'Altitude', 'AHR2_Roll': 'Roll', 'AHR2_Pitch': 'Pitch', 'AHR2_Yaw': 'Yaw', 'MSG_Message': 'Status'}
+    periods = [10, 50, 100, 1000]  # Interpolation periods in periodBox, ms
     def_namespace = {'GPS_TimeUS': 'GPS_TimeUS', 'GPS_Lng': 'GPS_Lng', 'GPS_Lat': 'GPS_Lat', 'GPS_Spd': 'GPS_Spd',
                      'BARO_Alt': 'BARO_Alt', 'AHR2_Roll': 'AHR2_Roll', 'AHR2_Pitch': 'AHR2_Pitch', 'AHR2_Yaw': 'AHR2_Yaw', 'MSG_Message': 'MSG_Message'}
 
@@ -26,6 +28,11 @@ class UIController(QtWidgets.QMainWindow, PxUILayout):
         """ Initialize UI """
 
         super().__init__()
+        self.__jobs = dict()  # File -> export worker
+        self.__queue = deque()  # Workers waiting to start
+        self.__running = []
+        self.__progress = dict()  # File -> percent
+        self.__rates = dict()  # File -> bytes/s of running exports
         self.setupUi(self)
         self.__setup_actions()
         self.__setup_buttons()
@@ -63,13 +70,25 @@ class UIController(QtWidgets.QMainWindow, PxUILayout):
         self.deleteButton.clicked.connect(self.__table_remove_selected_items)
         self.deleteButton.setStatusTip('Delete selected files')
 
+        self.cancelButton.clicked.connect(self.__cancel_selected)
+        self.cancelButton.setStatusTip('Cancel export of selected files')
+
+        self.statsButton.clicked.connect(self.__show_stats)
+        self.statsButton.setStatusTip('Show statistics of selected file export')
+        self.statsCheckBox.setStatusTip(
+            'Profile exports: time per stage and per message type')
+
     def __setup_table(self) -> None:
         """ Create file table, set header """
 
-        self.fileTable.setColumnCount(1)
+        self.fileTable.setColumnCount(3)
         header = self.fileTable.horizontalHeader()
         header.setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
-        self.fileTable.setHorizontalHeaderLabels(['File path'])
+        header.setSectionResizeMode(1, QtWidgets.QHeaderView.Fixed)
+        header.setSectionResizeMode(2, QtWidgets.QHeaderView.ResizeToContents)
+        self.fileTable.setColumnWidth(1, 100)
+        self.fileTable.setHorizontalHeaderLabels(
+            ['File path', 'Progress', 'Status'])
 
     def __table_add_item(self, item) -> None:
         """ Add item (file) to table, disable editing """
@@ -81,11 +100,15 @@ class UIController(QtWidgets.QMainWindow, PxUILayout):
                           QtCore.Qt.ItemIsEnabled)  # Set editing flags
         self.fileTable.setItem(
             rowPosition, 0, new_item)  # Insert item
+        status_item = QtWidgets.QTableWidgetItem('')
+        status_item.setFlags(QtCore.Qt.ItemIsSelectable |
+                             QtCore.Qt.ItemIsEnabled)
+        self.fileTable.setItem(rowPosition, 2, status_item)
 
     def __table_remove_selected_items(self) -> None:
         """ Remove selected items from table """
 
-        items_to_remove = self.fileTable.selectedItems()
+        items_to_remove = self.__table_get_selected_items()
         self.__table_remove_items(items_to_remove)
 
     def __table_remove_items(self, items_to_remove) -> None:
@@ -96,72 +119,184 @@ class UIController(QtWidgets.QMainWindow, PxUILayout):
             self.fileTable.removeRow(item.row())
 
     def __table_get_all_items(self) -> list:
-        """ Get all items from table """
+        """ Get all items (files) from table """
 
         items = list()
-        for col in range(self.fileTable.columnCount()):
-            for row in range(self.fileTable.rowCount()):
-                items.append(self.fileTable.item(row, col))
+        for row in range(self.fileTable.rowCount()):
+            items.append(self.fileTable.item(row, 0))
         return items
 
+    def __table_get_selected_items(self) -> list:
+        """ Get items (files) of selected rows """
+
+        rows = sorted({index.row()
+                      for index in self.fileTable.selectedIndexes()})
+        return [self.fileTable.item(row, 0) for row in rows]
+
+    def __table_find_row(self, file) -> int:
+        """ Get row of file in table, -1 if it's not there """
+
+        for row in range(self.fileTable.rowCount()):
+            if self.fileTable.item(row, 0).text() == file:
+                return row
+        return -1
+
+    def __table_set_status(self, file, status, progress=None) -> None:
+        """ Show export status and progress of file """
+
+        row = self.__table_find_row(file)
+        if row < 0:
+            return
+        self.fileTable.item(row, 2).setText(status)
+        if progress is not None:
+            bar = self.fileTable.cellWidget(row, 1)
+            if bar is None:
+                bar = QtWidgets.QProgressBar()
+                self.fileTable.setCellWidget(row, 1, bar)
+            bar.setValue(int(progress))
+
     def __get_file_path(self) -> str:
         """ Get path to file for importing """
 
         return QtWidgets.QFileDialog.getOpenFileName(self, 'Select file',
-                                                     '.', "Log files (*.bin *.ulg)")[0]
+                                                     '.', "Log files (*.bin *.ulg *.gz *.xz *.bz2)")[0]
 
     def __get_export_directory(self) -> str:
         """ Get path to directoty for exported files """
 
         return QtWidgets.QFileDialog.getExistingDirectory(self, 'Select directory')
 
-    def updateProgressbar(self, progress) -> None:
-        """ Add progress / len(file_list) to progressbar """
-
-        self.progess += int(progress) / len(self.__file_list)
-        self.progressBar.setValue(self.progess)
-
-    def __createThread(self, worker) -> PxExportWorker:
-        thread = worker
-        worker.finished.connect(worker.stop)
-        return thread
-
     def __export(self) -> None:
-        """ Export function. Exports all/selected files from table """
+        """ Export function. Queues all/selected files from table for export """
 
+        selected_items = self.__table_get_selected_items()
+        items_to_export = selected_items if selected_items else self.__table_get_all_items()
+        if not items_to_export:
+            return
+        files = [item.text() for item in items_to_export]
+        try:
+            names = output_names(files)  # Same file names from different folders get unique ones
+        except Exception as e:
+            QtWidgets.QMessageBox.warning(self, 'Export', str(e))
+            return
+        export_to = self.__get_export_directory()
+        if not export_to:  # Dialog was closed
+            return
         self.statusbar.showMessage('Exporting...')
         self.__disable_ui()
         time_msg = "GPS_TimeUS"
         interpolation = self.__get_interpolation()
+        period = self.__get_interpolation_period()
         namespace = self.__get_namespace()
         export_as = self.__get_selected_file_type()
-        selected_items = self.fileTable.selectedItems()
-        items_to_export = selected_items if selected_items else self.__table_get_all_items()
-        self.progess = 0
-        self.progressBar.setValue(self.progess)
+        self.__jobs.clear()
+        self.__progress.clear()
+        self.__rates.clear()
+        self.progressBar.setValue(0)
         self.progressBar.show()
-        self.__threads.clear()
-        export_to = self.__get_export_directory()
-        for item in items_to_export:
-            file = item.text()
-            output_file_name = export_to + '/' +\
-                file.split('/')[-1].split('.')[0] # Create full output file name
+        for file, name in zip(files, names):
+            output_file_name = export_to + '/' + name # Create full output file name
             worker = PxExportWorker(
                 file, output_file_name, namespace, self.filter, export_as,
-                time_msg, [time_msg], interpolation) # Create worker object
-            thread = self.__createThread(worker) # Create thread with worker
-            thread.start() # Start worker thread
-            self.__threads.append(thread) # Save thread to list
-            prev_progress = thread.parser.completed
-            while thread.isRunning(): # Update progress bar. Re-writing needed
-                curr_progress = thread.parser.completed
-                self.updateProgressbar(curr_progress - prev_progress)
-                prev_progress = curr_progress
-            self.updateProgressbar(10)
-            time.sleep(1)
-            self.progressBar.hide()
-        self.__table_remove_items(items_to_export) # Remove exported items
-        self.statusbar.showMessage("Export done")
+                time_msg, msg_ignore=[time_msg], use_interpolation=interpolation,
+                interpolation_period=period,
+                collect_stats=self.statsCheckBox.isChecked()) # Create worker object
+            worker.progress.connect(self.__update_progress)
+            worker.finished.connect(
+                lambda worker=worker: self.__export_finished(worker))
+            self.__jobs[file] = worker
+            self.__progress[file] = 0
+            self.__queue.append(worker) # Wait for a free slot
+            self.__table_set_status(file, 'Queued', 0)
+        self.__start_workers()
+
+    def __start_workers(self) -> None:
+        """ Start queued exports while there are free slots, finish when all are done """
+
+        while self.__queue and len(self.__running) < self.max_workers:
+            worker = self.__queue.popleft()
+            self.__running.append(worker)
+            self.__table_set_status(worker.target, 'Running')
+            worker.start()
+        if not self.__running:
+            self.__export_done()
+
+    def __update_progress(self, file, progress, rate, eta) -> None:
+        """ Update file row, overall progressbar and throughput """
+
+        self.__progress[file] = progress
+        self.__rates[file] = rate
+        status = 'Running, %.1f MB/s' % (rate / 1e6)
+        if eta >= 0:
+            status += ', %i s left' % round(eta)
+        self.__table_set_status(file, status, progress)
+        self.__update_total()
+
+    def __update_total(self) -> None:
+        """ Show overall progress and throughput of running exports """
+
+        self.progressBar.setValue(
+            int(sum(self.__progress.values()) / len(self.__progress)))
+        self.statusbar.showMessage('Exporting: %i running, %i queued, %.1f MB/s' % (
+            len(self.__running), len(self.__queue), sum(self.__rates.values()) / 1e6))
+
+    def __export_finished(self, worker) -> None:
+        """ Show result of finished export, start next one """
+
+        self.__running.remove(worker)
+        self.__rates.pop(worker.target, None)
+        self.__progress[worker.target] = 100
+        self.__table_set_status(worker.target, worker.message,
+                                100 if worker.succeeded else None)
+        self.__update_total()
+        self.__start_workers()
+
+    def __cancel_selected(self) -> None:
+        """ Cancel export of selected files """
+
+        for item in self.__table_get_selected_items():
+            worker = self.__jobs.get(item.text())
+            if worker is None or worker.isFinished():
+                continue
+            if worker in self.__queue:  # Not started yet, drop it
+                self.__queue.remove(worker)
+                self.__progress[worker.target] = 100
+                self.__table_set_status(worker.target, 'Cancelled')
+            else:
+                worker.cancel()
+        if not self.__running:
+            self.__export_done()
+
+    def __show_stats(self) -> None:
+        """ Show statistics of first selected file's export in a dialog """
+
+        selected_items = self.__table_get_selected_items()
+        worker = self.__jobs.get(
+            selected_items[0].text()) if selected_items else None
+        if worker is None or worker.stats is None:
+            self.statusbar.showMessage(
+                'No statistics, select a file exported with "Collect statistics" on')
+            return
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle('Statistics: ' + worker.target.split('/')[-1])
+        dialog.resize(520, 360)
+        text = QtWidgets.QPlainTextEdit(dialog)
+        text.setReadOnly(True)
+        text.setFont(QtGui.QFontDatabase.systemFont(
+            QtGui.QFontDatabase.FixedFont))
+        text.setPlainText(worker.stats.format())
+        layout = QtWidgets.QVBoxLayout(dialog)
+        layout.addWidget(text)
+        dialog.exec_()
+
+    def __export_done(self) -> None:
+        """ Restore UI after all exports finished """
+
+        succeeded = sum(
+            1 for worker in self.__jobs.values() if worker.succeeded)
+        self.progressBar.hide()
+        self.statusbar.showMessage("Export done: %i of %i files exported" % (
+            succeeded, len(self.__jobs)))
         self.__enable_ui()
 
     def __import_file(self) -> None:
@@ -189,6 +324,11 @@ class UIController(QtWidgets.QMainWindow, PxUILayout):
         elif self.OffButton.isChecked():
             return False
 
+    def __get_interpolation_period(self) -> int:
+        """ Get interpolation period in ms from UI """
+
+        return self.periods[self.periodBox.currentIndex()]
+
     def __get_namespace(self):
         if self.defaultButton.isChecked():
             return self.def_namespace
@@ -201,6 +341,8 @@ class UIController(QtWidgets.QMainWindow, PxUILayout):
         self.importButton.setEnabled(False)
         self.exportButton.setEnabled(False)
         self.deleteButton.setEnabled(False)
+        self.cancelButton.setEnabled(True)
+        self.statsCheckBox.setEnabled(False)
 
         self.txtButton.setEnabled(False)
         self.xlsxButton.setEnabled(False)
@@ -217,6 +359,7 @@ class UIController(QtWidgets.QMainWindow, PxUILayout):
 
         self.OnButton.setEnabled(False)
         self.OffButton.setEnabled(False)
+        self.periodBox.setEnabled(False)
 
         self.menuFile.setEnabled(False)
 
@@ -224,6 +367,8 @@ class UIController(QtWidgets.QMainWindow, PxUILayout):
         self.importButton.setEnabled(True)
         self.exportButton.setEnabled(True)
         self.deleteButton.setEnabled(True)
+        self.cancelButton.setEnabled(False)
+        self.statsCheckBox.setEnabled(True)
 
         self.txtButton.setEnabled(True)
         self.xlsxButton.setEnabled(True)
@@ -240,6 +385,7 @@ class UIController(QtWidgets.QMainWindow, PxUILayout):
 
         self.OnButton.setEnabled(True)
         self.OffButton.setEnabled(True)
+        self.periodBox.setEnabled(True)
 
         self.menuFile.setEnabled(True)
 
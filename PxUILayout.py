@@ -22,7 +22,7 @@ class PxUILayout(object):
         self.centralwidget = QtWidgets.QWidget(MainWindow)
         self.centralwidget.setObjectName("centralwidget")
         self.horizontalLayoutWidget = QtWidgets.QWidget(self.centralwidget)
-        self.horizontalLayoutWidget.setGeometry(QtCore.QRect(10, 260, 250, 40))
+        self.horizontalLayoutWidget.setGeometry(QtCore.QRect(10, 260, 430, 40))
         self.horizontalLayoutWidget.setObjectName("horizontalLayoutWidget")
         self.buttonsLayout = QtWidgets.QHBoxLayout(self.horizontalLayoutWidget)
         self.buttonsLayout.setContentsMargins(0, 0, 0, 0)
@@ -36,6 +36,13 @@ class PxUILayout(object):
         self.deleteButton = QtWidgets.QPushButton(self.horizontalLayoutWidget)
         self.importButton.setObjectName("deleteButton")
         self.buttonsLayout.addWidget(self.deleteButton)
+        self.cancelButton = QtWidgets.QPushButton(self.horizontalLayoutWidget)
+        self.cancelButton.setObjectName("cancelButton")
+        self.cancelButton.setEnabled(False)
+        self.buttonsLayout.addWidget(self.cancelButton)
+        self.statsButton = QtWidgets.QPushButton(self.horizontalLayoutWidget)
+        self.statsButton.setObjectName("statsButton")
+        self.buttonsLayout.addWidget(self.statsButton)
         self.fileTable = QtWidgets.QTableWidget(self.centralwidget)
         self.fileTable.setGeometry(QtCore.QRect(0, 1, 541, 251))
         self.fileTable.setObjectName("fileTable")
@@ -114,15 +121,24 @@ class PxUILayout(object):
         self.line_3.setFrameShadow(QtWidgets.QFrame.Sunken)
         self.line_3.setObjectName("line_3")
         self.interpolLayout.addWidget(self.line_3)
+        self.interpolButtonsLayout = QtWidgets.QHBoxLayout()
+        self.interpolButtonsLayout.setObjectName("interpolButtonsLayout")
         self.OnButton = QtWidgets.QRadioButton(
             self.verticalLayoutWidget_3)
         self.OnButton.setObjectName("OnButton")
-        self.interpolLayout.addWidget(self.OnButton)
+        self.interpolButtonsLayout.addWidget(self.OnButton)
         self.OffButton = QtWidgets.QRadioButton(
             self.verticalLayoutWidget_3)
         self.OffButton.setChecked(True)
         self.OffButton.setObjectName("OffButton")
-        self.interpolLayout.addWidget(self.OffButton)
+        self.interpolButtonsLayout.addWidget(self.OffButton)
+        self.periodBox = QtWidgets.QComboBox(self.verticalLayoutWidget_3)
+        self.periodBox.setObjectName("periodBox")
+        self.interpolButtonsLayout.addWidget(self.periodBox)
+        self.interpolLayout.addLayout(self.interpolButtonsLayout)
+        self.statsCheckBox = QtWidgets.QCheckBox(self.centralwidget)
+        self.statsCheckBox.setGeometry(QtCore.QRect(550, 272, 201, 25))
+        self.statsCheckBox.setObjectName("statsCheckBox")
         MainWindow.setCentralWidget(self.centralwidget)
         self.menubar = QtWidgets.QMenuBar(MainWindow)
         self.menubar.setGeometry(QtCore.QRect(0, 0, 755, 32))
@@ -163,6 +179,10 @@ class PxUILayout(object):
         self.importButton.setText(_translate("MainWindow", "Import"))
         self.exportButton.setText(_translate("MainWindow", "Export"))
         self.deleteButton.setText(_translate("MainWindow", "Delete"))
+        self.cancelButton.setText(_translate("MainWindow", "Cancel"))
+        self.statsButton.setText(_translate("MainWindow", "Stats"))
+        self.statsCheckBox.setText(
+            _translate("MainWindow", "Collect statistics"))
         self.ExportTypeLabel.setText(
             _translate("MainWindow", "Export file type"))
         self.txtButton.setText(_translate("MainWindow", ".txt"))
@@ -182,3 +202,7 @@ class PxUILayout(object):
             _translate("MainWindow", "Interpolation"))
         self.OnButton.setText(_translate("MainWindow", "On"))
         self.OffButton.setText(_translate("MainWindow", "Off"))
+        self.periodBox.clear()
+        for period in ("10 ms", "50 ms", "100 ms", "1 s"):
+            self.periodBox.addItem(_translate("MainWindow", period))
+        self.periodBox.setCurrentIndex(2)
@@ -0,0 +1,217 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import pxparser
+from pxgen import PxLogGenerator, PxULogGenerator
+from pxparser import PxParser
+
+""" Reproducible PxParser benchmarks on synthetic logs. Results are saved as JSON and can be compared """
+
+FILTER = [('GPS', ['TimeUS', 'Lng', 'Lat', 'Spd']), ('BARO', ['Alt']),
+          ('AHR2', ['Roll', 'Pitch', 'Yaw']), ('MSG', ['Message'])]
+TIME_MSG = 'GPS_TimeUS'
+ULOG_FILTER = [('vehicle_gps_position', ['timestamp', 'lat', 'lon', 'vel_m_s']), ('sensor_baro', ['pressure']),
+               ('vehicle_attitude', ['q[0]', 'q[1]', 'q[2]', 'q[3]'])]
+ULOG_TIME_MSG = 'vehicle_gps_position_timestamp'
+FORMATS = ('txt', 'csv', 'xlsx')
+CORRUPTION = 0.001  # Probability of corrupting a message in error correction case
+
+
+def _cases(formats):
+    """ List of (name, file type, filtered, interpolation, corrupted log, ULog log) """
+
+    cases = []
+    for file_type in formats:
+        for filtered in (True, False):
+            for interpolation in (False, True):
+                if interpolation and pxparser.np is None:
+                    continue  # NumPy isn't installed
+                cases.append(("%s-%s%s" % (file_type, 'filtered' if filtered else 'all',
+                                           '-interp' if interpolation else ''),
+                              file_type, filtered, interpolation, False, False))
+        cases.append(("%s-filtered-correct" % file_type,
+                      file_type, True, False, True, False))
+        for filtered in (True, False):
+            cases.append(("%s-ulog-%s" % (file_type, 'filtered' if filtered else 'all'),
+                          file_type, filtered, False, False, True))
+    return cases
+
+
+def _make_log(work_dir, duration, seed, corruption, ulog=False):
+    """ Generate log, return (file name, size, data messages) """
+
+    generator = (PxULogGenerator if ulog else PxLogGenerator)(
+        duration=duration, seed=seed, corruption=corruption)
+    fn = os.path.join(work_dir, "bench-%i-%i%s.%s" %
+                      (duration, seed, '-corrupt' if corruption else '', 'ulg' if ulog else 'bin'))
+    size = generator.write(fn)
+    return fn, size, generator.msg_count
+
+
+def _run(fn, out_base, file_type, filtered, interpolation, correct, ulog):
+    """ Convert log once, return seconds taken """
+
+    parser = PxParser()
+    parser.set_time_msg(ULOG_TIME_MSG if ulog else TIME_MSG)
+    parser.set_msg_ignore([ULOG_TIME_MSG if ulog else TIME_MSG])
+    if filtered:
+        parser.set_msg_filter(ULOG_FILTER if ulog else FILTER)
+    if interpolation:
+        parser.enable_interpolation()
+    if correct:
+        parser.enable_err_correct()
+    parser.set_output_file(out_base, file_type)
+    start = time.perf_counter()
+    parser.process(fn)
+    return time.perf_counter() - start
+
+
+def _check_window(work_dir, duration, seed):
+    """
+    Check that windowed exports, with and without index, equal the slice of full
+    export in every layout. MODE is logged at start and end only, so its column must
+    be carried over from far before the window. Return number of mismatching exports
+    """
+
+    generator = PxLogGenerator(duration=duration, seed=seed)
+    generator.set_rate('MODE', 1.0 / duration)
+    fn = os.path.join(work_dir, "check-%i-%i.bin" % (duration, seed))
+    generator.write(fn)
+    window = (duration * 0.5e6, duration * 0.6e6)  # In TimeUS
+    mismatches = 0
+    for layout in PxParser.LAYOUTS:
+        exports = []
+        for name, indexed, time_window in (('full', False, None), ('window', False, window),
+                                           ('window-index', True, window)):
+            parser = PxParser()
+            parser.set_time_msg(TIME_MSG)
+            parser.set_msg_ignore([TIME_MSG])
+            parser.set_output_layout(layout)
+            if indexed:
+                parser.enable_index()
+            if time_window is not None:
+                parser.set_time_window(*time_window)
+            out_base = os.path.join(work_dir, "check-%s-%s" % (layout, name))
+            parser.set_output_file(out_base, 'csv')
+            parser.process(fn)
+            tables = dict()  # File name suffix -> rows
+            for file_name in os.listdir(work_dir):
+                if file_name.startswith(os.path.basename(out_base)) and file_name.endswith('.csv'):
+                    with open(os.path.join(work_dir, file_name), newline='', encoding='utf-8') as f:
+                        tables[file_name[len(os.path.basename(out_base)):]] = list(csv.reader(f))
+            exports.append(("%s-%s" % (layout, name), tables))
+        expected = dict()
+        for suffix, rows in exports[0][1].items():  # Rows are stamped by time in first column of narrow tables
+            time_column = rows[0].index(TIME_MSG) if layout == PxParser.LAYOUT_WIDE else 0
+            sliced = [row for row in rows[1:] if window[0] <= float(row[time_column]) <= window[1]]
+            if sliced:
+                expected[suffix] = rows[:1] + sliced
+        for name, tables in exports[1:]:
+            differ = 0
+            for suffix in sorted(set(expected) | set(tables)):
+                rows = tables.get(suffix, [])
+                expected_rows = expected.get(suffix, [])
+                differ += sum(1 for i in range(max(len(rows), len(expected_rows)))
+                              if i >= len(rows) or i >= len(expected_rows) or rows[i] != expected_rows[i])
+            total = sum(len(rows) for rows in expected.values())
+            if differ:
+                mismatches += 1
+                print("%-28s %i of %i rows differ from full export" % (name, differ, total))
+            else:
+                print("%-28s %i rows in %i tables equal full export" % (name, total, len(expected)))
+    return mismatches
+
+
+def _environment():
+    """ Describe machine and code the results were taken on """
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'machine': platform.machine(), 'cpus': os.cpu_count(), 'commit': commit,
+            'numpy': pxparser.np.__version__ if pxparser.np is not None else None}
+
+
+def _compare(results, baseline_fn):
+    """ Print speed of every case relative to baseline results """
+
+    with open(baseline_fn, encoding='utf-8') as f:
+        baseline = {case['name']: case for case in json.load(f)['cases']}
+    print("\n%-28s %10s %10s %8s" % ("case", "MB/s", "base MB/s", "ratio"))
+    for case in results['cases']:
+        base = baseline.get(case['name'])
+        if base is None:
+            continue
+        print("%-28s %10.2f %10.2f %7.2fx" % (case['name'], case['mb_s'], base['mb_s'],
+                                              case['mb_s'] / base['mb_s'] if base['mb_s'] else 0))
+
+
+def _main():
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark PxParser.process on synthetic logs")
+    arg_parser.add_argument('-d', '--duration', type=float, default=600,
+                            help="duration of generated flight in seconds (default 600)")
+    arg_parser.add_argument('-s', '--seed', type=int, default=0,
+                            help="random seed of generated logs (default 0)")
+    arg_parser.add_argument('-r', '--repeat', type=int, default=3,
+                            help="runs per case, best one is reported (default 3)")
+    arg_parser.add_argument('-f', '--format', action='append', choices=FORMATS,
+                            help="benchmark only these output formats, may be repeated")
+    arg_parser.add_argument('-k', '--filter', metavar='TEXT',
+                            help="run only cases with TEXT in their name")
+    arg_parser.add_argument('-o', '--output',
+                            help="save results to JSON file")
+    arg_parser.add_argument('-c', '--compare', metavar='JSON',
+                            help="compare with results saved earlier")
+    arg_parser.add_argument('-w', '--check-window', action='store_true',
+                            help="check that windowed exports equal the slice of full export, don't benchmark")
+    args = arg_parser.parse_args()
+
+    if args.check_window:
+        with tempfile.TemporaryDirectory(prefix='pxbench') as work_dir:
+            return 1 if _check_window(work_dir, args.duration, args.seed) else 0
+
+    cases = [case for case in _cases(args.format or FORMATS)
+             if not args.filter or args.filter in case[0]]
+    results = {'environment': _environment(), 'duration': args.duration, 'seed': args.seed,
+               'repeat': args.repeat, 'cases': []}
+    with tempfile.TemporaryDirectory(prefix='pxbench') as work_dir:
+        logs = dict()  # (corrupted, ULog) -> log
+        for name, file_type, filtered, interpolation, corrupted, ulog in cases:
+            if (corrupted, ulog) not in logs:
+                logs[corrupted, ulog] = _make_log(work_dir, args.duration, args.seed,
+                                                  CORRUPTION if corrupted else 0.0, ulog)
+        print("%-28s %10s %12s %10s" % ("case", "MB/s", "messages/s", "best s"))
+        for name, file_type, filtered, interpolation, corrupted, ulog in cases:
+            fn, size, msg_count = logs[corrupted, ulog]
+            out_base = os.path.join(work_dir, name)
+            best = min(_run(fn, out_base, file_type, filtered, interpolation, corrupted, ulog)
+                       for i in range(args.repeat))
+            case = {'name': name, 'format': file_type, 'filtered': filtered,
+                    'interpolation': interpolation, 'corrupted': corrupted, 'ulog': ulog,
+                    'size': size, 'messages': msg_count, 'seconds': best,
+                    'mb_s': size / 1e6 / best, 'msg_s': msg_count / best}
+            results['cases'].append(case)
+            print("%-28s %10.2f %12.0f %10.3f" %
+                  (name, case['mb_s'], case['msg_s'], best))
+            sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        _compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -1,94 +1,264 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
 import sys
-from PxParser import PxParser
+import time
+from pathlib import Path
+from pxcompress import PxDecompressReader
+from pxparser import PxParser
 
-""" Legacy cli interface. For gebug purposes. Do not use! """
+""" Headless batch converter. Converts many logs in parallel, one process per log """
+
+LOG_SUFFIXES = ('.bin', '.log', '.ulg')  # Picked up when a directory is given
+
+DEFAULT_CONFIG = {
+    'filter': [('GPS', ['TimeUS', 'Lng', 'Lat', 'Spd']), ('BARO', ['Alt']),
+               ('AHR2', ['Roll', 'Pitch', 'Yaw']), ('MSG', ['Message'])],
+    'namespace': 'def',
+    'time_msg': 'GPS_TimeUS',
+    'msg_ignore': ['GPS_TimeUS'],
+    'null_char': '',
+    'float_format': None,
+    'interpolation': None,  # Period in ms, or None to disable
+}
+
+NAMESPACES = {
+    'def': {'GPS_TimeUS': 'GPS_TimeUS', 'GPS_Lng': 'GPS_Lng', 'GPS_Lat': 'GPS_Lat', 'GPS_Spd': 'GPS_Spd',
+            'BARO_Alt': 'BARO_Alt', 'AHR2_Roll': 'AHR2_Roll', 'AHR2_Pitch': 'AHR2_Pitch', 'AHR2_Yaw': 'AHR2_Yaw', 'MSG_Message': 'MSG_Message'},
+    'rus': {'GPS_TimeUS': 'Время', 'GPS_Lng': 'Долгота', 'GPS_Lat': 'Широта', 'GPS_Spd': 'Скорость',
+            'BARO_Alt': 'Высота', 'AHR2_Roll': 'Крен', 'AHR2_Pitch': 'Тангаж', 'AHR2_Yaw': 'Рысканье', 'MSG_Message': 'Статус'},
+    'eng': {'GPS_TimeUS': 'Time', 'GPS_Lng': 'Longitude', 'GPS_Lat': 'Latitude', 'GPS_Spd': 'Speed',
+            'BARO_Alt': 'Altitude', 'AHR2_Roll': 'Roll', 'AHR2_Pitch': 'Pitch', 'AHR2_Yaw': 'Yaw', 'MSG_Message': 'Status'},
+}
+
+
+def _load_config(args):
+    """ Merge defaults, config file and command line options """
+
+    config = dict(DEFAULT_CONFIG)
+    if args.config:
+        with open(args.config, encoding='utf-8') as f:
+            config.update(json.load(f))
+    if isinstance(config['filter'], dict):  # {"GPS": ["TimeUS", ...], ...}
+        config['filter'] = list(config['filter'].items())
+    if args.msg:
+        config['filter'] = []
+        for arg in args.msg:  # MSG[.field1,field2,...]
+            msg_name, _, fields = arg.partition('.')
+            config['filter'].append(
+                (msg_name, fields.split(',') if fields else '*'))
+    if args.time_msg:
+        config['time_msg'] = args.time_msg
+    if args.namespace:
+        config['namespace'] = args.namespace
+    if isinstance(config['namespace'], str):
+        config['namespace'] = NAMESPACES[config['namespace']]
+    if args.interpolate is not None:
+        config['interpolation'] = args.interpolate
+    if args.float_format:
+        config['float_format'] = args.float_format
+    config['format'] = args.format
+    config['compression'] = args.compress
+    config['layout'] = args.layout
+    config['correct_errors'] = args.correct_errors
+    config['index'] = args.index
+    config['stats'] = args.stats
+    config['window'] = (args.start, args.end)
+    config['summary'] = args.summary
+    config['follow'] = args.follow
+    return config
+
+
+def _find_logs(paths):
+    """ Expand directories and globs to list of log files """
+
+    logs = []
+    for path in paths:
+        if os.path.isdir(path):
+            logs.extend(sorted(str(p) for p in Path(path).iterdir()
+                               if p.suffix.lower() in LOG_SUFFIXES or
+                               p.suffix.lower() in PxDecompressReader.SUFFIXES and
+                               Path(p.stem).suffix.lower() in LOG_SUFFIXES))  # E.g. .bin.gz
+        else:
+            logs.extend(sorted(glob.glob(path, recursive=True)) or [path])
+    return list(dict.fromkeys(logs))  # Drop duplicates, keep order
+
+
+def output_names(logs):
+    """
+    Get output base name of every log: its file name without suffixes. Logs
+    whose names collide are named after their path relative to the common
+    directory of the colliding ones instead, e.g. day1_a_bin and day2_a_bin.
+    Raises if names still collide
+    """
+
+    names = [Path(fn).name.split('.')[0] for fn in logs]
+    groups = dict()
+    for i, name in enumerate(names):
+        groups.setdefault(name.lower(), []).append(i)  # Case-insensitive file systems
+    for indexes in groups.values():
+        if len(indexes) < 2:
+            continue
+        paths = [os.path.abspath(logs[i]) for i in indexes]
+        root = os.path.commonpath([os.path.dirname(path) for path in paths])
+        for i, path in zip(indexes, paths):
+            names[i] = os.path.relpath(path, root).replace(os.sep, '_').replace('.', '_')
+    taken = dict()
+    for fn, name in zip(logs, names):
+        if name.lower() in taken:
+            raise Exception("%s and %s would be exported to the same file %s" % (
+                taken[name.lower()], fn, name))
+        taken[name.lower()] = fn
+    return names
+
+
+def _convert(job):
+    """
+    Convert one log, or only summarize its fields if enabled. Returns (log, ok,
+    size, seconds, error, skipped ranges, PxStats or None, PxSummary or None)
+    """
+
+    fn, out_base, config = job
+    start = time.perf_counter()
+    try:
+        size = os.path.getsize(fn)
+        parser = PxParser()
+        parser.set_null_char(config['null_char'])
+        parser.set_msg_filter([(msg_name, fields)
+                              for msg_name, fields in config['filter']])
+        parser.set_time_msg(config['time_msg'])
+        parser.set_msg_ignore(list(config['msg_ignore']))
+        parser.set_namespace(config['namespace'])
+        if config['correct_errors']:
+            parser.enable_err_correct()
+        if config['interpolation']:
+            parser.enable_interpolation(config['interpolation'])
+        if config['index']:
+            parser.enable_index()
+        if config.get('parallel'):
+            parser.enable_parallel(config['parallel'])
+        if config['stats']:
+            parser.enable_stats()
+        parser.set_time_window(*config['window'])
+        if config['summary']:
+            summary = parser.summarize(fn, [msg_name for msg_name, fields in config['filter']] or None,
+                                       dict(config['filter']))
+            return (fn, True, size, time.perf_counter() - start, None, parser.skipped, None, summary)
+        parser.set_output_layout(config['layout'])
+        parser.set_output_file(
+            out_base, config['format'], config['float_format'], config['compression'])
+        if config['follow']:
+            try:
+                parser.follow(fn, config['follow'])
+            except KeyboardInterrupt:
+                pass  # Ctrl+C ends following, output is closed properly
+            size = os.path.getsize(fn)  # Log grew meanwhile
+        else:
+            parser.process(fn)
+    except Exception as e:
+        return (fn, False, 0, time.perf_counter() - start, "%s: %s" % (type(e).__name__, e), [], None, None)
+    return (fn, True, size, time.perf_counter() - start, None, parser.skipped, parser.stats, None)
 
 
 def _main():
-    if len(sys.argv) < 2:
-        print(
-            "Usage: python px4parser.py <log.bin> [-v] [-e] [-d delimiter] [-def] [-eng] [-rus] [-c] [-m MSG[.field1,field2,...]] [-t TIME_MSG_NAME]\n")
-        print("\t-v\tUse plain debug output instead of TXT.\n")
-        print("\t-e\tRecover from errors.\n")
-        print("\t-d\tUse \"delimiter\" in output. Default is TAB.\n")
-        print("\t-def\tUse default namespace.\n")
-        print("\t-eng\tUse customized English namespace.\n")
-        print("\t-rus\tUse customized Russian namespace.\n")
-        print("\t-c\tUse constant clock.\n")
-        print("\t-m MSG[.field1,field2,...]\n\t\tDump only messages of specified type, and only specified fields.\n\t\tMultiple -m options allowed.\n")
-        print("\t-t\tSpecify TIME message name to group data messages by time\n")
-        print("\t-f\tPrint to file instead of stdout")
-        return
-    fn = sys.argv[1]
-
-    ### Settings ###
-    debug_out = False
-    correct_errors = False
-    file_name = None
-    constant_clock = True
-    custom_namespace = None
-    null_char = ""
-    time_msg = "GPS_TimeUS"
-    data_msg = "MSG_Message"
-    msg_ignore = [time_msg, data_msg]
-    msg_filter = [('GPS', ['TimeUS', 'Lng', 'Lat', 'Spd']), ('BARO', [
-        'Alt']), ('AHR2', ['Roll', 'Pitch', 'Yaw']), ('MSG', ['Message'])]
-    default_namespace = {'GPS_TimeUS': 'GPS_TimeUS', 'GPS_Lng': 'GPS_Lng', 'GPS_Lat': 'GPS_Lat', 'GPS_Spd': 'GPS_Spd',
-                         'BARO_Alt': 'BARO_Alt', 'AHR2_Roll': 'AHR2_Roll', 'AHR2_Pitch': 'AHR2_Pitch', 'AHR2_Yaw': 'AHR2_Yaw', 'MSG_Message': 'MSG_Message'}
-    custom_rus_namespace = {'GPS_TimeUS': 'Время', 'GPS_Lng': 'Долгота', 'GPS_Lat': 'Широта', 'GPS_Spd': 'Скорость',
-                            'BARO_Alt': 'Высота', 'AHR2_Roll': 'Крен', 'AHR2_Pitch': 'Тангаж', 'AHR2_Yaw': 'Рысканье', 'MSG_Message': 'Статус'}
-    custom_eng_namespace = {'GPS_TimeUS': 'Time', 'GPS_Lng': 'Longitude', 'GPS_Lat': 'Latitude', 'GPS_Spd': 'Speed',
-                            'BARO_Alt': 'Altitude', 'AHR2_Roll': 'Roll', 'AHR2_Pitch': 'Pitch', 'AHR2_Yaw': 'Yaw', 'MSG_Message': 'Status'}
-
-    opt = None
-    for arg in sys.argv[2:]:
-        if opt != None:
-            if opt == "d":
-                delim_char = arg
-            elif opt == "t":
-                time_msg = arg
-            elif opt == "n":
-                custom_namespace = arg
-            elif opt == "f":
-                file_name = arg
+    arg_parser = argparse.ArgumentParser(
+        description="Convert ArduPilot .bin and PX4 .ulg logs to txt/csv/xlsx in parallel")
+    arg_parser.add_argument('paths', nargs='+',
+                            help="log files, directories or glob patterns")
+    arg_parser.add_argument('-o', '--output-dir', default='.',
+                            help="directory for exported files")
+    arg_parser.add_argument('-f', '--format', choices=('txt', 'csv', 'xlsx'), default='csv',
+                            help="export file type")
+    arg_parser.add_argument('-c', '--config',
+                            help="JSON file with filter, namespace, time_msg, msg_ignore, null_char, float_format, interpolation")
+    arg_parser.add_argument('-m', '--msg', action='append',
+                            help="MSG[.field1,field2,...] export only these messages and fields, may be repeated")
+    arg_parser.add_argument('-t', '--time-msg',
+                            help="time column to group data messages by")
+    arg_parser.add_argument('-n', '--namespace', choices=sorted(NAMESPACES),
+                            help="column header namespace")
+    arg_parser.add_argument('-i', '--interpolate', type=int, nargs='?', const=100, metavar='PERIOD',
+                            help="resample to constant clock, period in ms (default 100)")
+    arg_parser.add_argument('-l', '--layout', choices=PxParser.LAYOUTS, default=PxParser.LAYOUT_WIDE,
+                            help="wide table, a table (file or sheet) per message type, or long (time, message, field, value) rows")
+    arg_parser.add_argument('-z', '--compress', choices=('gzip', 'xz'),
+                            help="compress txt/csv output on a separate thread, adds .gz or .xz")
+    arg_parser.add_argument('--float-format',
+                            help="%%-style float format for txt/csv, e.g. %%.6f")
+    arg_parser.add_argument('-e', '--correct-errors', action='store_true',
+                            help="recover from corrupted messages")
+    arg_parser.add_argument('--index', action='store_true',
+                            help="use/create .pxidx sidecar index")
+    arg_parser.add_argument('--start', type=float,
+                            help="export rows from this time on, in time message units")
+    arg_parser.add_argument('--end', type=float,
+                            help="export rows up to this time, in time message units")
+    arg_parser.add_argument('--stats', action='store_true',
+                            help="print time per stage and per message type of every log")
+    arg_parser.add_argument('--summary', action='store_true',
+                            help="print count, min, max, mean, std and quantiles of numeric fields instead of exporting")
+    arg_parser.add_argument('--follow', type=float, nargs='?', const=1.0, metavar='INTERVAL',
+                            help="keep exporting rows appended to a log being written until Ctrl+C, poll interval in s (default 1)")
+    arg_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                            help="number of worker processes (default: all cores)")
+    args = arg_parser.parse_args()
+
+    config = _load_config(args)
+    logs = _find_logs(args.paths)
+    if not logs:
+        print("No log files found", file=sys.stderr)
+        return 2
+    if args.follow and len(logs) > 1:
+        print("--follow takes a single log", file=sys.stderr)
+        return 2
+    if args.compress and args.format == 'xlsx':
+        print("--compress takes txt or csv output", file=sys.stderr)
+        return 2
+    try:
+        names = output_names(logs)
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return 2
+    if not args.summary:
+        os.makedirs(args.output_dir, exist_ok=True)
+    jobs = [(fn, os.path.join(args.output_dir, name), config)
+            for fn, name in zip(logs, names)]
+
+    start = time.perf_counter()
+    failed = 0
+    total_size = 0
+    if len(jobs) == 1:  # Single log, split it between worker processes instead
+        config['parallel'] = args.jobs
+        results = map(_convert, jobs)
+    else:
+        # Decoding is CPU bound, so logs are spread over processes, not threads
+        pool = multiprocessing.Pool(min(args.jobs, len(jobs)))
+        results = pool.imap_unordered(_convert, jobs)
+    for fn, ok, size, seconds, error, skipped, stats, summary in results:
+        if ok:
+            total_size += size
+            print("OK    %s (%.1f MB in %.2f s, %.1f MB/s)" % (
+                fn, size / 1e6, seconds, size / 1e6 / seconds if seconds else 0))
+            if skipped:
+                print("      %i corrupted ranges skipped, %i bytes lost, first at %i (0x%X)" % (
+                    len(skipped), sum(length for offset, length in skipped), skipped[0][0], skipped[0][0]))
+            if stats is not None:
+                print("      " + stats.format().replace("\n", "\n      "))
+            if summary is not None:
+                print("      " + summary.format().replace("\n", "\n      "))
         else:
-            if arg == "-v":
-                debug_out = True
-            elif arg == "-e":
-                correct_errors = True
-            elif arg == "-d":
-                opt = "d"
-            elif arg == "-def":
-                custom_namespace = "def"
-            elif arg == "-eng":
-                custom_namespace = "eng"
-            elif arg == "-rus":
-                custom_namespace = "rus"
-            elif arg == "-c":
-                constant_clock = True
-            elif arg == "-t":
-                opt = "t"
-            elif arg == "-f":
-                opt = "f"
-
-    parser = PxParser()
-    parser.set_null_char(null_char)
-    parser.set_msg_filter(msg_filter)
-    parser.set_time_msg(time_msg)
-    parser.set_data_msg(data_msg)
-    parser.set_output_file('test', 'xlsx')
-    parser.set_debug_flag(False)
-    parser.set_constant_clock_flag(constant_clock)
-    parser.set_error_corr_flag(correct_errors)
-    if custom_namespace == "def":
-        parser.set_namespace(default_namespace)
-    elif custom_namespace == "rus":
-        parser.set_namespace(custom_rus_namespace)
-    elif custom_namespace == "eng":
-        parser.set_namespace(custom_eng_namespace)
-    parser.set_msg_ignore(msg_ignore)
-    parser.process(fn)
+            failed += 1
+            print("FAIL  %s: %s" % (fn, error), file=sys.stderr)
+    if len(jobs) > 1:
+        pool.close()
+        pool.join()
+    elapsed = time.perf_counter() - start
+    print("%i of %i files converted, %.1f MB in %.2f s (%.1f MB/s)" % (
+        len(jobs) - failed, len(jobs), total_size / 1e6, elapsed, total_size / 1e6 / elapsed if elapsed else 0))
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
-    _main()
+    sys.exit(_main())
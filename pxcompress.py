@@ -0,0 +1,241 @@
+import bz2
+import io
+import lzma
+import queue
+import threading
+import zlib
+
+
+class PxDecompressReader:
+    """
+    Read-only stream of a compressed log. A background thread reads and
+    decompresses the file ahead of the reader, blocks are handed over through a
+    bounded queue, so decompression overlaps decoding. Concatenated streams are
+    read one after another, a truncated stream ends the data like a truncated log
+    """
+
+    MAGICS = ((b"\x1f\x8b", "gzip"), (b"\xfd7zXZ\x00", "xz"), (b"BZh", "bz2"))
+    SUFFIXES = ('.gz', '.xz', '.bz2')
+    CHUNK_SIZE = 262144  # Compressed bytes read at once
+    QUEUE_BLOCKS = 8  # Decompressed blocks kept ahead of the reader
+    PUT_TIMEOUT = 0.1  # Seconds between checks of closing while queue is full
+
+    @classmethod
+    def detect(cls, f):
+        """ Get compression of buffered file from its magic, None if it isn't compressed. Position is kept """
+
+        head = f.peek(max(len(magic) for magic, compression in cls.MAGICS))
+        for magic, compression in cls.MAGICS:
+            if head[:len(magic)] == magic:
+                return compression
+        return None
+
+    def __init__(self, f, compression):
+        if compression not in [name for magic, name in self.MAGICS]:
+            raise Exception("Unknown compression %s" % compression)
+        self.compression = compression
+        self.bytes_in = 0  # Compressed bytes behind data read so far
+        self.__f = f
+        self.__queue = queue.Queue(self.QUEUE_BLOCKS)
+        self.__closing = threading.Event()
+        self.__block = memoryview(b"")
+        self.__done = False
+        self.__thread = threading.Thread(
+            target=self.__run, name="PxDecompressReader", daemon=True)
+        self.__thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read(self, size=-1):
+        """ Read up to size decompressed bytes, all that's left if size is negative. Empty at the end of data """
+
+        parts = []
+        while size < 0 or size > 0:
+            if not len(self.__block):
+                if self.__done:
+                    break
+                item = self.__queue.get()
+                if item is None:  # End of data
+                    self.__done = True
+                    break
+                if isinstance(item, Exception):
+                    self.__done = True
+                    raise item
+                data, self.bytes_in = item
+                self.__block = memoryview(data)
+            part = self.__block if size < 0 else self.__block[:size]
+            self.__block = self.__block[len(part):]
+            parts.append(part)
+            if size > 0:
+                size -= len(part)
+                if not len(self.__block) and self.__queue.empty():
+                    break  # Don't wait for more while some data is ready
+        return b"".join(parts)
+
+    def close(self):
+        """ Stop decompressing, the file stays open """
+
+        self.__closing.set()
+        self.__done = True
+        self.__thread.join()
+        self.__block = memoryview(b"")
+
+    def __decompressor(self):
+        """ Get decompressor of a new stream """
+
+        if self.compression == "gzip":
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self.compression == "xz":
+            return lzma.LZMADecompressor(lzma.FORMAT_XZ)
+        return bz2.BZ2Decompressor()
+
+    def __run(self):
+        """ Decompress the file block by block into queue, end with None """
+
+        consumed = 0
+        try:
+            decompressor = self.__decompressor()
+            fresh = False  # Between streams, gzip members may be padded with zeros
+            while not self.__closing.is_set():
+                chunk = self.__f.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                consumed += len(chunk)
+                while chunk:
+                    if fresh and self.compression == "gzip":
+                        chunk = chunk.lstrip(b"\0")
+                        if not chunk:
+                            break
+                    fresh = False
+                    data = decompressor.decompress(chunk)
+                    chunk = b""
+                    if decompressor.eof:  # Next stream of concatenated file
+                        chunk = decompressor.unused_data
+                        decompressor = self.__decompressor()
+                        fresh = True
+                    if data and not self.__put((data, consumed)):
+                        return
+        except (zlib.error, lzma.LZMAError, OSError, EOFError) as e:
+            self.__put(Exception("Can't decompress %s log at %i: %s" %
+                                 (self.compression, consumed, e)))
+            return
+        self.__put(None)
+
+    def __put(self, item):
+        """ Queue item, return False if reader is closing """
+
+        while not self.__closing.is_set():
+            try:
+                self.__queue.put(item, timeout=self.PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+class PxCompressWriter(io.RawIOBase):
+    """
+    Binary output stream compressed on a background thread. Writes are handed
+    over through a bounded queue, so the writer only waits when compression falls
+    behind, and memory stays bounded by QUEUE_BLOCKS writes. flush() waits until
+    everything written so far is compressed and readable from the file
+    """
+
+    SUFFIXES = {"gzip": ".gz", "xz": ".xz"}
+    GZIP_LEVEL = 6
+    XZ_PRESET = 1  # Faster presets keep up with decoding, text compresses well anyway
+    QUEUE_BLOCKS = 8  # Writes waiting for compression at most
+    FLUSH = object()  # Queue marker of flush()
+
+    def __init__(self, f, compression):
+        """ Compress into binary file f, it's closed with the stream """
+
+        super().__init__()
+        if compression not in self.SUFFIXES:
+            raise Exception("Unknown compression %s" % compression)
+        self.compression = compression
+        self.__f = f
+        self.__queue = queue.Queue(self.QUEUE_BLOCKS)
+        self.__error = None
+        self.__thread = threading.Thread(
+            target=self.__run, name="PxCompressWriter", daemon=True)
+        self.__thread.start()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.__check()
+        size = len(data)
+        if size:
+            self.__queue.put(bytes(data))
+        return size
+
+    def flush(self):
+        if self.closed:
+            return
+        self.__check()
+        self.__queue.put(self.FLUSH)
+        self.__queue.join()
+        self.__check()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super().close()  # Flushes first
+        finally:
+            self.__queue.put(None)
+            self.__thread.join()
+            self.__f.close()
+        self.__check()
+
+    def __check(self):
+        """ Raise error of compression thread """
+
+        if self.__error is not None:
+            error, self.__error = self.__error, None
+            raise error
+
+    def __compressor(self):
+        """ Get compressor of a new stream """
+
+        if self.compression == "gzip":
+            return zlib.compressobj(self.GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return lzma.LZMACompressor(lzma.FORMAT_XZ, preset=self.XZ_PRESET)
+
+    def __run(self):
+        """ Compress queued writes into file until None arrives """
+
+        compressor = self.__compressor()
+        while True:
+            item = self.__queue.get()
+            try:
+                if self.__error is not None:
+                    pass  # Drop data after an error, writer raises it
+                elif item is None:
+                    if compressor is not None:
+                        self.__f.write(compressor.flush())
+                elif item is self.FLUSH:
+                    if compressor is None:
+                        pass  # Nothing written since last flush
+                    elif self.compression == "gzip":
+                        self.__f.write(compressor.flush(zlib.Z_SYNC_FLUSH))
+                    else:  # xz has no sync flush, finish stream, next one is concatenated
+                        self.__f.write(compressor.flush())
+                        compressor = None
+                    self.__f.flush()
+                else:
+                    if compressor is None:
+                        compressor = self.__compressor()
+                    self.__f.write(compressor.compress(item))
+            except (OSError, zlib.error, lzma.LZMAError) as e:
+                self.__error = e
+            finally:
+                self.__queue.task_done()
+            if item is None:
+                return
@@ -0,0 +1,403 @@
+import argparse
+import heapq
+import math
+import random
+import struct
+import sys
+
+""" Synthetic log generators. Write valid DataFlash logs with FMT and data messages, or PX4 ULog logs """
+
+MSG_HEAD = b"\xa3\x95"
+MSG_TYPE_FORMAT = 0x80
+MSG_FORMAT_STRUCT = "<BBBBB4s16s64s"
+
+FORMAT_TO_STRUCT = {"b": "b", "B": "B", "h": "h", "H": "H", "i": "i", "I": "I", "f": "f", "d": "d",
+                    "n": "4s", "N": "16s", "Z": "64s", "c": "h", "C": "H", "e": "i", "E": "I",
+                    "L": "i", "M": "b", "q": "q", "Q": "Q"}
+
+# name, format, labels, rate in Hz. Field names match ArduPilot logs
+DEFAULT_MESSAGES = [
+    ("GPS", "QBIHBcLLeffffB", "TimeUS,Status,GMS,GWk,NSats,HDop,Lat,Lng,Alt,Spd,GCrs,VZ,Yaw,U", 10),
+    ("BARO", "QffcfIf", "TimeUS,Alt,Press,Temp,CRt,SMS,Offset", 20),
+    ("AHR2", "QccCfLLffff", "TimeUS,Roll,Pitch,Yaw,Alt,Lat,Lng,Q1,Q2,Q3,Q4", 10),
+    ("ATT", "QccccCCCC", "TimeUS,DesRoll,Roll,DesPitch,Pitch,DesYaw,Yaw,ErrRP,ErrYaw", 25),
+    ("IMU", "QffffffIIfBBHH", "TimeUS,GyrX,GyrY,GyrZ,AccX,AccY,AccZ,EG,EA,T,GH,AH,GHz,AHz", 50),
+    ("MODE", "QMBB", "TimeUS,Mode,ModeNum,Rsn", 0.05),
+    ("MSG", "QZ", "TimeUS,Message", 0.2),
+    ("PARM", "QNf", "TimeUS,Name,Value", 0.5),
+]
+
+ULOG_MAGIC = b"ULog\x01\x12\x35"
+ULOG_SYNC_MAGIC = b"\x2F\x73\x13\x20\x25\x0C\xBB\x12"
+ULOG_TYPE_TO_STRUCT = {"int8_t": "b", "uint8_t": "B", "int16_t": "h", "uint16_t": "H", "int32_t": "i",
+                       "uint32_t": "I", "int64_t": "q", "uint64_t": "Q", "float": "f", "double": "d",
+                       "bool": "?", "char": "c"}
+
+# Formats used by topics, not logged on their own
+ULOG_NESTED_FORMATS = [
+    ("esc_report", "uint64_t timestamp;float esc_rpm;float esc_voltage"),
+]
+
+# name, fields, rate in Hz, instances. Trailing padding isn't logged, like in PX4
+ULOG_DEFAULT_TOPICS = [
+    ("vehicle_gps_position", "uint64_t timestamp;int32_t lat;int32_t lon;float alt;float vel_m_s;"
+     "uint8_t fix_type;bool vel_ned_valid;uint8_t[6] _padding0", 10, 1),
+    ("sensor_baro", "uint64_t timestamp;float pressure;float temperature", 20, 1),
+    ("vehicle_attitude", "uint64_t timestamp;float[4] q", 50, 1),
+    ("sensor_accel", "uint64_t timestamp;float x;float y;float z;float temperature", 100, 2),
+    ("esc_status", "uint64_t timestamp;uint8_t esc_count;uint8_t[7] _padding0;esc_report[2] esc", 10, 1),
+    ("vehicle_status", "uint64_t timestamp;uint8_t nav_state;bool armed;char[6] mode", 1, 1),
+]
+
+MESSAGE_TEXTS = ["ArduCopter V4.0.7", "Frame: QUAD", "EKF2 IMU0 is using GPS", "Mode changed",
+                 "GPS 1: detected as u-blox", "PreArm: Check fence", "Throttle armed", "Disarming motors"]
+PARAM_NAMES = ["ANGLE_MAX", "ATC_RAT_RLL_P", "BATT_CAPACITY", "FENCE_ENABLE", "WPNAV_SPEED"]
+
+
+class PxLogGenerator:
+    """
+    Generates a log of message types sampled at their own rates. Values follow
+    slow sine waves plus noise, time is in microseconds, output is reproducible
+    for the same seed. Corruption injects garbage, truncated messages and broken
+    headers with the given probability per message
+    """
+
+    FIRST_TYPE = 1  # Type ids are assigned in order starting here
+
+    def __init__(self, messages=None, duration=60, seed=0, corruption=0.0):
+        """ messages is a list of (name, format, labels, rate), duration is in seconds """
+
+        self.messages = []
+        self.duration = duration
+        self.seed = seed
+        self.corruption = corruption
+        self.msg_count = 0  # Data messages written by last write()
+        self.corrupt_count = 0  # Corruptions injected by last write()
+        for msg in DEFAULT_MESSAGES if messages is None else messages:
+            self.add_message(*msg)
+
+    def add_message(self, name, msg_format, labels, rate):
+        """ Add message type, rate is in Hz """
+
+        msg_struct = struct.Struct(
+            "<" + "".join(FORMAT_TO_STRUCT[c] for c in msg_format))
+        msg_type = self.FIRST_TYPE + len(self.messages)
+        if msg_type >= MSG_TYPE_FORMAT:
+            raise Exception("Too many message types")
+        if len(labels.split(",")) != len(msg_format):
+            raise Exception("Message %s has %i labels for %i fields" % (
+                name, len(labels.split(",")), len(msg_format)))
+        self.messages.append(
+            (msg_type, name, msg_format, labels, rate, msg_struct))
+
+    def set_rate(self, name, rate):
+        """ Change rate of message type """
+
+        for i, msg in enumerate(self.messages):
+            if msg[1] == name:
+                self.messages[i] = msg[:4] + (rate,) + msg[5:]
+                return
+        raise Exception("Unknown message: %s" % name)
+
+    def write(self, fn):
+        """ Write log to file, return its size """
+
+        rnd = random.Random(self.seed)
+        self.msg_count = 0
+        self.corrupt_count = 0
+        size = 0
+        with open(fn, "wb") as f:
+            chunk = bytearray(self.__fmtFormat())
+            for msg_type, name, msg_format, labels, rate, msg_struct in self.messages:
+                chunk += self.__fmtMessage(msg_type, name, msg_format, labels, msg_struct)
+            end_us = int(self.duration * 1000000)
+            queue = [(0, i) for i, msg in enumerate(self.messages) if msg[4] > 0]
+            heapq.heapify(queue)
+            while queue:
+                time_us, i = heapq.heappop(queue)
+                if time_us > end_us:
+                    continue  # Message type is done
+                msg_type, name, msg_format, labels, rate, msg_struct = self.messages[i]
+                values = self.__values(rnd, msg_format, time_us, i)
+                msg = MSG_HEAD + bytes((msg_type,)) + msg_struct.pack(*values)
+                if self.corruption and rnd.random() < self.corruption:
+                    msg = self.__corrupt(rnd, msg)
+                    self.corrupt_count += 1
+                chunk += msg
+                self.msg_count += 1
+                heapq.heappush(queue, (time_us + int(1000000 / rate), i))
+                if len(chunk) >= 1048576:
+                    f.write(chunk)
+                    size += len(chunk)
+                    chunk = bytearray()
+            f.write(chunk)
+            size += len(chunk)
+        return size
+
+    def __fmtFormat(self):
+        """ FMT message describing FMT message itself """
+
+        return struct.pack(MSG_FORMAT_STRUCT, 0xA3, 0x95, MSG_TYPE_FORMAT, MSG_TYPE_FORMAT, 89,
+                           b"FMT", b"BBnNZ", b"Type,Length,Name,Format,Columns")
+
+    def __fmtMessage(self, msg_type, name, msg_format, labels, msg_struct):
+        """ FMT message of message type """
+
+        return struct.pack(MSG_FORMAT_STRUCT, 0xA3, 0x95, MSG_TYPE_FORMAT, msg_type, 3 + msg_struct.size,
+                           name.encode(), msg_format.encode(), labels.encode())
+
+    def __values(self, rnd, msg_format, time_us, seed):
+        """ Field values of one message """
+
+        t = time_us / 1000000
+        values = []
+        for i, c in enumerate(msg_format):
+            if i == 0 and c == "Q":
+                values.append(time_us)
+                continue
+            wave = math.sin(t / (5 + i + seed) + i) + rnd.gauss(0, 0.02)
+            wave = min(max(wave, -1), 1)  # Keep integer fields in range
+            if c in "fd":
+                values.append(wave * 100)
+            elif c == "L":  # Coordinates around a fixed point
+                values.append(int((55.75 + i + wave * 0.001) * 10000000))
+            elif c in "cC":  # Angles in centidegrees
+                values.append(int(wave * 9000) if c == "c" else int((wave + 1) * 18000))
+            elif c in "eE":
+                values.append(int(wave * 100000) if c == "e" else int((wave + 1) * 100000))
+            elif c in "bM":
+                values.append(int(wave * 100))
+            elif c == "B":
+                values.append(int((wave + 1) * 100))
+            elif c == "h":
+                values.append(int(wave * 20000))
+            elif c == "H":
+                values.append(int((wave + 1) * 30000))
+            elif c in "iq":
+                values.append(int(wave * 1000000))
+            elif c in "IQ":
+                values.append(int((wave + 1) * 1000000))
+            elif c == "n":
+                values.append(b"GPS%i" % rnd.randrange(2))
+            elif c == "N":
+                values.append(rnd.choice(PARAM_NAMES).encode())
+            elif c == "Z":
+                values.append(rnd.choice(MESSAGE_TEXTS).encode())
+        return values
+
+    def __corrupt(self, rnd, msg):
+        """ Garbage burst before message, truncated message or broken header """
+
+        kind = rnd.randrange(3)
+        if kind == 0:
+            return bytes(rnd.randrange(256) for i in range(rnd.randrange(1, 512))) + msg
+        elif kind == 1:
+            return msg[:rnd.randrange(1, len(msg))]
+        return bytes((msg[0] ^ 0xFF,)) + msg[1:]
+
+
+class PxULogGenerator:
+    """
+    Generates a PX4 ULog log: file header, flag bits, info, parameters and formats,
+    then subscriptions, data messages of topics sampled at their own rates, logged
+    strings and sync messages. Corruption injects garbage and broken messages,
+    parsers recover at the next sync message
+    """
+
+    SYNC_INTERVAL = 256  # Data messages between sync messages
+
+    def __init__(self, topics=None, duration=60, seed=0, corruption=0.0):
+        """ topics is a list of (name, fields, rate, instances), duration is in seconds """
+
+        self.formats = dict(ULOG_NESTED_FORMATS)
+        self.topics = []
+        self.duration = duration
+        self.seed = seed
+        self.corruption = corruption
+        self.msg_count = 0  # Data messages written by last write()
+        self.corrupt_count = 0  # Corruptions injected by last write()
+        for topic in ULOG_DEFAULT_TOPICS if topics is None else topics:
+            self.add_topic(*topic)
+
+    def add_topic(self, name, fields, rate, instances=1):
+        """ Add topic, fields are "type name;type name;...", rate is in Hz """
+
+        self.formats[name] = fields
+        self.topics.append((name, rate, instances))
+
+    def set_rate(self, name, rate):
+        """ Change rate of topic """
+
+        for i, topic in enumerate(self.topics):
+            if topic[0] == name:
+                self.topics[i] = (name, rate, topic[2])
+                return
+        raise Exception("Unknown topic: %s" % name)
+
+    def write(self, fn):
+        """ Write log to file, return its size """
+
+        rnd = random.Random(self.seed)
+        self.msg_count = 0
+        self.corrupt_count = 0
+        size = 0
+        with open(fn, "wb") as f:
+            chunk = bytearray(ULOG_MAGIC + b"\x01" + struct.pack("<Q", 0))
+            chunk += self.__message("B", bytes(16) + bytes(24))  # No flags, no appended data
+            chunk += self.__info("char[%i] sys_name" % len("PX4"), b"PX4")
+            chunk += self.__info("char[%i] ver_hw" % len("PXGEN"), b"PXGEN")
+            for name, fields in self.formats.items():
+                chunk += self.__message("F", ("%s:%s;" % (name, fields)).encode())
+            for i, param in enumerate(PARAM_NAMES):
+                chunk += self.__message("P", bytes((len("float ") + len(param),)) +
+                                        b"float " + param.encode() + struct.pack("<f", i))
+            instances = []  # (msg id, struct, codes) per topic instance
+            for name, rate, count in self.topics:
+                msg_struct, codes = self.__struct(name)
+                for multi_id in range(count):
+                    msg_id = len(instances)
+                    chunk += self.__message("A", struct.pack("<BH", multi_id, msg_id) + name.encode())
+                    instances.append((msg_id, rate, msg_struct, codes))
+            end_us = int(self.duration * 1000000)
+            queue = [(0, i) for i, instance in enumerate(instances) if instance[1] > 0]
+            heapq.heapify(queue)
+            while queue:
+                time_us, i = heapq.heappop(queue)
+                if time_us > end_us:
+                    continue  # Topic is done
+                msg_id, rate, msg_struct, codes = instances[i]
+                msg = self.__message("D", struct.pack("<H", msg_id) + msg_struct.pack(
+                    *self.__values(rnd, codes, time_us, i)))
+                if self.corruption and rnd.random() < self.corruption:
+                    msg = self.__corrupt(rnd, msg)
+                    self.corrupt_count += 1
+                chunk += msg
+                self.msg_count += 1
+                if self.msg_count % self.SYNC_INTERVAL == 0:
+                    chunk += self.__message("S", ULOG_SYNC_MAGIC)
+                if rnd.random() < 0.001:
+                    chunk += self.__message("L", b"6" + struct.pack("<Q", time_us) +
+                                            rnd.choice(MESSAGE_TEXTS).encode())
+                heapq.heappush(queue, (time_us + int(1000000 / rate), i))
+                if len(chunk) >= 1048576:
+                    f.write(chunk)
+                    size += len(chunk)
+                    chunk = bytearray()
+            f.write(chunk)
+            size += len(chunk)
+        return size
+
+    def __message(self, msg_type, payload):
+        """ ULog message with header """
+
+        return struct.pack("<HB", len(payload), ord(msg_type)) + payload
+
+    def __info(self, key, value):
+        """ Info message """
+
+        return self.__message("I", bytes((len(key),)) + key.encode() + value)
+
+    def __struct(self, name):
+        """ Struct of logged part of topic and field codes, "x" for padding """
+
+        codes = self.__codes(name)
+        while codes and codes[-1][-1] == "x":  # Trailing padding isn't logged
+            codes.pop()
+        return struct.Struct("<" + "".join(codes)), codes
+
+    def __codes(self, name):
+        """ Struct codes of format, nested formats flattened """
+
+        codes = []
+        for field in self.formats[name].split(";"):
+            field_type, field_name = field.split()
+            count = None
+            if field_type.endswith("]"):
+                field_type, _, count = field_type[:-1].partition("[")
+                count = int(count)
+            if field_type in self.formats:
+                for i in range(count or 1):
+                    codes += self.__codes(field_type)
+            elif field_name.startswith("_padding"):
+                codes.append("%ix" % (struct.calcsize(ULOG_TYPE_TO_STRUCT[field_type]) * (count or 1)))
+            elif field_type == "char" and count is not None:
+                codes.append("%is" % count)
+            else:
+                codes += [ULOG_TYPE_TO_STRUCT[field_type]] * (count or 1)
+        return codes
+
+    def __values(self, rnd, codes, time_us, seed):
+        """ Field values of one message, first uint64 field is the timestamp """
+
+        t = time_us / 1000000
+        values = []
+        for i, code in enumerate(codes):
+            if code[-1] == "x":
+                continue
+            if code == "Q" and not values:
+                values.append(time_us)
+                continue
+            wave = math.sin(t / (5 + i + seed) + i) + rnd.gauss(0, 0.02)
+            wave = min(max(wave, -1), 1)  # Keep integer fields in range
+            if code in "fd":
+                values.append(wave * 100)
+            elif code == "i":
+                values.append(int((47.4 + i + wave * 0.001) * 10000000))
+            elif code in "bh":
+                values.append(int(wave * 100))
+            elif code in "BH":
+                values.append(int((wave + 1) * 100))
+            elif code in "IqQ":
+                values.append(int((wave + 1) * 1000000))
+            elif code == "?":
+                values.append(wave > 0)
+            elif code == "c":
+                values.append(b"A")
+            else:  # String
+                values.append(rnd.choice(["MANUAL", "POSCTL", "AUTO"]).encode())
+        return values
+
+    def __corrupt(self, rnd, msg):
+        """ Garbage burst before message, truncated message or broken header """
+
+        kind = rnd.randrange(3)
+        if kind == 0:
+            return bytes(rnd.randrange(256) for i in range(rnd.randrange(1, 512))) + msg
+        elif kind == 1:
+            return msg[:rnd.randrange(1, len(msg))]
+        return msg[:2] + bytes((rnd.randrange(256),)) + msg[3:]
+
+
+def _main():
+    arg_parser = argparse.ArgumentParser(
+        description="Write synthetic DataFlash .bin or PX4 .ulg log")
+    arg_parser.add_argument('output', help="log file to write")
+    arg_parser.add_argument('-d', '--duration', type=float, default=60,
+                            help="flight duration in seconds (default 60)")
+    arg_parser.add_argument('-r', '--rate', action='append', default=[], metavar='MSG=HZ',
+                            help="change message rate, may be repeated")
+    arg_parser.add_argument('-s', '--seed', type=int, default=0,
+                            help="random seed (default 0)")
+    arg_parser.add_argument('-c', '--corrupt', type=float, default=0.0, metavar='P',
+                            help="probability of corrupting a message (default 0)")
+    arg_parser.add_argument('-u', '--ulog', action='store_true',
+                            help="write PX4 ULog log instead of DataFlash (default if output ends with .ulg)")
+    args = arg_parser.parse_args()
+
+    if args.ulog or args.output.lower().endswith('.ulg'):
+        generator = PxULogGenerator(
+            duration=args.duration, seed=args.seed, corruption=args.corrupt)
+    else:
+        generator = PxLogGenerator(
+            duration=args.duration, seed=args.seed, corruption=args.corrupt)
+    for arg in args.rate:
+        name, _, rate = arg.partition('=')
+        generator.set_rate(name, float(rate))
+    size = generator.write(args.output)
+    print("%s: %.1f MB, %i messages, %i corrupted" % (
+        args.output, size / 1e6, generator.msg_count, generator.corrupt_count))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,160 @@
+import bisect
+import hashlib
+import struct
+import sys
+from array import array
+from pathlib import Path
+
+
+class PxIndex:
+    """
+    Message offset index of a log file, stored next to it in a .pxidx sidecar
+    """
+
+    SUFFIX = ".pxidx"
+    MAGIC = b"PXIDX\x02"
+    KEY_STRUCT = "<Qq32s"  # File size, mtime (ns), content hash
+    HASH_BLOCK_SIZE = 65536
+    FMT_RECORD_LEN = 89
+
+    def __init__(self, log_fn, time_msg=None, key=None):
+        self.log_fn = str(log_fn)
+        self.time_msg = time_msg or ""
+        self.key = key or self.file_key(log_fn)
+        self.fmt_records = list()  # Raw FMT messages, in file order
+        self.fmt_offsets = array('Q')  # Offsets of FMT messages
+        self.offsets = dict()  # Message type -> array of message offsets
+        self.time_values = array('d')  # Sparse time index: time values...
+        self.time_offsets = array('Q')  # ...and offsets of their messages
+
+    @classmethod
+    def sidecar_path(cls, log_fn):
+        """ Get path of index file for log file """
+
+        return Path(str(log_fn) + cls.SUFFIX)
+
+    @classmethod
+    def file_key(cls, log_fn):
+        """ Get (size, mtime, hash) key identifying log file contents """
+
+        stat = Path(log_fn).stat()
+        digest = hashlib.sha256(struct.pack("<Q", stat.st_size))
+        with open(log_fn, "rb") as f:  # Hash head and tail of the file
+            digest.update(f.read(cls.HASH_BLOCK_SIZE))
+            if stat.st_size > cls.HASH_BLOCK_SIZE:
+                f.seek(max(cls.HASH_BLOCK_SIZE,
+                       stat.st_size - cls.HASH_BLOCK_SIZE))
+                digest.update(f.read(cls.HASH_BLOCK_SIZE))
+        return (stat.st_size, stat.st_mtime_ns, digest.digest())
+
+    @classmethod
+    def load(cls, log_fn, time_msg=None):
+        """ Load index of log file, return None if it's missing or out of date """
+
+        try:
+            data = cls.sidecar_path(log_fn).read_bytes()
+            key = cls.file_key(log_fn)
+        except OSError:
+            return None
+        index = cls(log_fn, time_msg, key)
+        try:
+            if index.__unpack(data) != key:
+                return None
+        except (struct.error, ValueError, UnicodeDecodeError):
+            return None  # Truncated or corrupted index file
+        if index.time_msg != (time_msg or ""):
+            return None  # Time index was built for another time message
+        return index
+
+    def save(self):
+        """ Write index to sidecar file, return False if it can't be written """
+
+        try:
+            self.sidecar_path(self.log_fn).write_bytes(self.__pack())
+        except OSError:
+            return False
+        return True
+
+    def add_time(self, time_value, offset):
+        """ Add entry to sparse time index """
+
+        self.time_values.append(time_value)
+        self.time_offsets.append(offset)
+
+    def seek_time(self, time_value):
+        """ Get offset of last indexed time message before time_value, 0 if there's none """
+
+        i = bisect.bisect_left(self.time_values, time_value)
+        return self.time_offsets[i - 1] if i else 0
+
+    def __pack(self):
+        """ Serialize index, little-endian """
+
+        time_msg = self.time_msg.encode()
+        out = [self.MAGIC, struct.pack(self.KEY_STRUCT, *self.key),
+               struct.pack("<H", len(time_msg)), time_msg,
+               struct.pack("<I", len(self.fmt_records))]
+        out.extend(self.fmt_records)
+        out.append(self.__to_le(self.fmt_offsets))
+        out.append(struct.pack("<I", len(self.offsets)))
+        for msg_type, offsets in self.offsets.items():
+            out.append(struct.pack("<BQ", msg_type, len(offsets)))
+            out.append(self.__to_le(offsets))
+        out.append(struct.pack("<Q", len(self.time_values)))
+        out.append(self.__to_le(self.time_values))
+        out.append(self.__to_le(self.time_offsets))
+        return b"".join(out)
+
+    def __unpack(self, data):
+        """ Deserialize index, return key it was built for """
+
+        if not data.startswith(self.MAGIC):
+            raise ValueError("Not an index file")
+        pos = len(self.MAGIC)
+        key = struct.unpack_from(self.KEY_STRUCT, data, pos)
+        pos += struct.calcsize(self.KEY_STRUCT)
+        length, = struct.unpack_from("<H", data, pos)
+        self.time_msg = data[pos + 2:pos + 2 + length].decode()
+        pos += 2 + length
+        count, = struct.unpack_from("<I", data, pos)
+        pos += 4
+        for _ in range(count):
+            record = data[pos:pos + self.FMT_RECORD_LEN]
+            if len(record) != self.FMT_RECORD_LEN:
+                raise ValueError("Truncated FMT table")
+            self.fmt_records.append(record)
+            pos += self.FMT_RECORD_LEN
+        self.fmt_offsets, pos = self.__from_le('Q', data, pos, count)
+        count, = struct.unpack_from("<I", data, pos)
+        pos += 4
+        for _ in range(count):
+            msg_type, length = struct.unpack_from("<BQ", data, pos)
+            pos += 9
+            self.offsets[msg_type], pos = self.__from_le('Q', data, pos, length)
+        length, = struct.unpack_from("<Q", data, pos)
+        pos += 8
+        self.time_values, pos = self.__from_le('d', data, pos, length)
+        self.time_offsets, pos = self.__from_le('Q', data, pos, length)
+        return key
+
+    @staticmethod
+    def __to_le(values):
+        """ Get bytes of array in little-endian order """
+
+        if sys.byteorder == "big":
+            values = array(values.typecode, values)
+            values.byteswap()
+        return values.tobytes()
+
+    @staticmethod
+    def __from_le(typecode, data, pos, length):
+        """ Read little-endian array from data, return it and new position """
+
+        values = array(typecode)
+        end = pos + length * values.itemsize
+        if end > len(data):
+            raise ValueError("Truncated index file")
+        values.frombytes(data[pos:end])
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values, end
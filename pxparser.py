@@ -1,18 +1,196 @@
+import bisect
+import copy
+import heapq
+import mmap
+import multiprocessing
+import os
 import struct
-import xlsxwriter
-from io import TextIOWrapper
-from xlsxwriter.worksheet import Worksheet
-from pathlib import Path
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from io import UnsupportedOperation
+from itertools import islice
+from pxcompress import PxCompressWriter, PxDecompressReader
+from pxindex import PxIndex
+from pxstats import PxStats
+from pxsummary import PxSummary
+from pxwriters import PxCallbackWriter, PxTextWriter, PxXlsxWriter
+
+try:
+    import numpy as np
+    from pxresample import PxResampler
+except ImportError:  # NumPy is only needed for to_arrays() and interpolation
+    np = None
+
+
+PxProgress = namedtuple("PxProgress", [
+    "bytes_done", "bytes_total", "percent", "bytes_per_s", "msgs_per_s", "rows_per_s", "eta"])
+PxProgress.__doc__ = """
+Progress of running process(). msgs_per_s counts decoded data messages, rows_per_s
+output rows. eta is in seconds, None if it's unknown
+"""
+
+
+class PxCancelled(Exception):
+    """ Raised by process() when its cancel token is set. Output written so far is closed properly """
+
+
+class PxWindowEnd(Exception):
+    """ Raised inside process() by first row past end of time window, ends the run """
+
+
+class PxCancelToken:
+    """
+    Cancels process() runs it's passed to, they stop at the next block. Built on
+    threading.Event by default, pass a multiprocessing Event to cancel a run in
+    another process
+    """
+
+    def __init__(self, event=None):
+        self.__event = threading.Event() if event is None else event
+
+    def cancel(self):
+        """ Ask runs to stop """
+
+        self.__event.set()
+
+    def is_cancelled(self):
+        return self.__event.is_set()
+
+
+class PxCache:
+    """
+    Least recently used cache of bounded size, shared by parsers in parallel
+    threads. Evicted entries are just built again when needed
+    """
+
+    def __init__(self, size):
+        self.__size = size
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        """ Get entry, None if it isn't cached """
+
+        with self.__lock:
+            value = self.__entries.get(key)
+            if value is not None:
+                self.__entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """ Cache entry, drop least recently used one if full. Returns value """
+
+        with self.__lock:
+            self.__entries[key] = value
+            self.__entries.move_to_end(key)
+            if len(self.__entries) > self.__size:
+                self.__entries.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+class PxContext:
+    """
+    State of a single PxParser run: input buffer, FMT table of the log,
+    output columns and rows waiting to be written
+    """
+
+    def __init__(self, writer=None):
+        self.buffer = bytearray()
+        self.pointer = 0
+        self.msg_descrs = dict()
+        self.msg_lengths = {PxParser.MSG_TYPE_FORMAT: PxParser.MSG_FORMAT_PACKET_LEN}
+        self.msg_plans = dict()
+        self.msg_labels = dict()
+        self.msg_names = list()
+        self.msg_filter = list()
+        self.msg_filter_map = dict()
+        self.txt_columns = list()
+        self.txt_slots = dict()  # Full label -> slot of its column in values
+        self.values = list()  # Latest value of every column by slot, then a scratch slot for fields without column
+        self.msg_id_ignore = set()
+        self.time_msg_id = 0
+        self.time_msg_name = ""
+        self.output_ready = False
+        self.resampler = None
+        self.writer = writer
+        self.rows = list()
+        self.raw_rows = None  # Collects undecorated rows in parallel workers
+        self.layout = None  # Narrow output layout, None for wide table
+        self.headers = list()  # Column headers, namespace applied
+        self.msg_slots = dict()  # Message name -> (first slot, end slot, labels, time slot) of its columns
+        self.tables = dict()  # Message name -> [table writer, rows] in tables layout
+        self.clock_started = False  # Time column is set, narrow rows can be output
+        self.window = None  # (start, end) time window of rows, None for whole log
+        self.ulog_formats = None  # ULog message formats by name, None for DataFlash logs
+        self.ulog_topics = dict()  # ULog msg id -> topic name
+        self.ulog_lost = False  # Corrupted ULog data, skipping to next sync message
+        self.stats = None  # PxStats if stats are collected
+        self.file_size = 0  # Compressed size for compressed logs, progress is reported against it
+        self.source = None  # PxDecompressReader of compressed log
+        self.started = time.monotonic()
+        self.reported_time = self.started  # Last progress report
+        self.reported_bytes = 0
+        self.msgs_decoded = 0  # Data messages walked, indexed runs visit wanted ones only
+        self.sync_limit = None  # Resync doesn't search past it, parallel ranges end on a message
 
 
 class PxParser:
+    """
+    Converts DataFlash logs. Settings live in the parser, state of every run in
+    its own PxContext, so separate parsers can run in parallel threads (see
+    process_many). Compiled FMT descriptions and decode plans are shared
+    read-only between all parsers
+    """
+
     BLOCK_SIZE = 8192
+    MAPPED_BLOCK_SIZE = 1048576
+    TIME_INDEX_STEP = 64  # Time messages per sparse time index entry
+    GATHER_BLOCK_SIZE = 65536  # Messages gathered at once by to_arrays()
+    SCAN_BLOCK_SIZE = 16777216  # Bytes searched for message headers at once by vectorized index scan
+    WRITE_BATCH_SIZE = 4096  # Rows passed to writer at once
+    LAYOUT_WIDE = "wide"  # One table, a row per time message with latest values of all columns
+    LAYOUT_TABLES = "tables"  # Table per message type, a row per message
+    LAYOUT_LONG = "long"  # One table, a (time, message, field, value) row per field of every message
+    LAYOUTS = (LAYOUT_WIDE, LAYOUT_TABLES, LAYOUT_LONG)
+    SUMMARY_BATCH_SIZE = 4096  # Records of a type gathered by summarize() before folding them in
+    PARALLEL_RANGE_SIZE = 8388608  # Bytes of log decoded by one parallel task
+    SYNC_CHECK_MSGS = 16  # Messages chained to accept a range boundary
+    SEEK_MARGIN = 262144  # Bytes decoded ahead of time window
     MSG_HEADER_LEN = 3
     MSG_HEAD1 = 0xA3
     MSG_HEAD2 = 0x95
     MSG_FORMAT_PACKET_LEN = 89
     MSG_FORMAT_STRUCT = "BB4s16s64s"
     MSG_TYPE_FORMAT = 0x80
+    ULOG_MAGIC = b"ULog\x01\x12\x35"
+    ULOG_HEADER_LEN = 16  # Magic, version, start timestamp
+    ULOG_MSG_HEADER_LEN = 3  # Payload size, type
+    ULOG_SYNC_MAGIC = b"\x2F\x73\x13\x20\x25\x0C\xBB\x12"
+    ULOG_MSG_FORMAT = ord("F")
+    ULOG_MSG_ADD_LOGGED = ord("A")
+    ULOG_MSG_REMOVE_LOGGED = ord("R")
+    ULOG_MSG_DATA = ord("D")
+    ULOG_MSG_TYPES = frozenset(b"BFIMPQARDLCSO")  # Known message types
+    ULOG_TYPE_TO_STRUCT = {
+        "int8_t": "b",
+        "uint8_t": "B",
+        "int16_t": "h",
+        "uint16_t": "H",
+        "int32_t": "i",
+        "uint32_t": "I",
+        "int64_t": "q",
+        "uint64_t": "Q",
+        "float": "f",
+        "double": "d",
+        "bool": "B",
+        "char": "c",
+    }
     FORMAT_TO_STRUCT = {
         "a": ("a", None),
         "b": ("b", None),
@@ -36,32 +214,40 @@ class PxParser:
         "Q": ("Q", None),
     }
 
-    __msg_filter = list()
-    __msg_ignore = list()
-    __msg_labels = dict()
-    __msg_descrs = dict()
-    __msg_names = list()
-    __msg_filter_map = dict()
-    __txt_columns = list()
-    __txt_data = dict()
-    __namespace = dict()
-    __prev_data = list()
-    __next_data = list()
-    __buffer = bytearray()
-    __msg_id_ignore = set()
-    __pointer = 0
-    __delim_char = '\t'
-    __null_char = ''
-    __time_msg = ""
-    __file = ""
-    __txt_updated = False
-    __time_msg_id = 0
-    __debug_out = False
-    __correct_errors = False
-    __interpolation = False
-    __workbook = None
-    completed = 0
-    msg_count = 0
+    CACHE_SIZE = 512  # Entries kept by each cache shared between parsers
+    __descr_cache = PxCache(CACHE_SIZE)  # FMT message -> message description
+    __plan_cache = PxCache(CACHE_SIZE)  # (FMT message, fields) -> decode plan
+    __decoder_factories = PxCache(CACHE_SIZE)  # Field kinds -> generated decoder factory
+    __record_classes = PxCache(CACHE_SIZE)  # (message name, labels) -> record class
+
+    def __init__(self):
+        self.__msg_filter = list()
+        self.__msg_ignore = list()
+        self.__namespace = dict()
+        self.__delim_char = '\t'
+        self.__null_char = ''
+        self.__time_msg = ""
+        self.__writer = None
+        self.__debug_out = False
+        self.__correct_errors = False
+        self.__use_mmap = True
+        self.__use_index = False
+        self.__interpolation = False
+        self.__interp_period = 100
+        self.__interp_method = "linear"
+        self.__interp_methods = dict()
+        self.__parallel = 0  # Worker processes of one log, 0 to decode serially
+        self.__collect_stats = False
+        self.__progress_callback = None
+        self.__progress_interval = 0.25
+        self.__progress_step = None
+        self.__cancel_token = None
+        self.__window = None  # (start, end) in time message units
+        self.__layout = self.LAYOUT_WIDE
+        self.completed = 0
+        self.msg_count = 0
+        self.skipped = list()  # (offset, length) of corrupted ranges skipped by last run
+        self.stats = None  # PxStats of last run if enabled
 
     def set_namespace(self, namespace):
         """ Set custom names for column headers """
@@ -92,285 +278,2106 @@ class PxParser:
     def enable_err_correct(self):
         self.__correct_errors = True
 
-    def enable_interpolation(self):  # Set a constant clock flag
+    def enable_interpolation(self, period=100, method="linear", column_methods=None):
+        """
+        Resample rows to a constant clock of period ms. Fill method is "linear"
+        or "previous"; column_methods maps column labels to their own method
+        """
+
+        if np is None:
+            raise Exception("NumPy is required for interpolation")
         self.__interpolation = True
+        self.__interp_period = period
+        self.__interp_method = method
+        self.__interp_methods = column_methods or dict()
+
+    def disable_mmap(self):
+        """ Always read input in BLOCK_SIZE chunks instead of mapping it """
+
+        self.__use_mmap = False
+
+    def enable_index(self):
+        """ Read only wanted messages using .pxidx sidecar index, build it if needed """
+
+        self.__use_index = True
+
+    def enable_parallel(self, workers=None):
+        """ Split mapped log files into byte ranges, decode them in worker processes """
+
+        self.__parallel = workers or os.cpu_count()
+
+    def enable_stats(self):
+        """ Profile runs: time per stage and per message type, see PxStats. Available in stats after process() """
+
+        self.__collect_stats = True
+
+    def set_progress_callback(self, callback, interval=0.25, step=None):
+        """
+        Call callback(PxProgress) while processing, at most once per interval
+        seconds, or once per step bytes if step is set, and once when it's done
+        """
+
+        self.__progress_callback = callback
+        self.__progress_interval = interval
+        self.__progress_step = step
+
+    def set_cancel_token(self, token):
+        """ Stop processing with PxCancelled once PxCancelToken is cancelled """
+
+        self.__cancel_token = token
+
+    def set_time_window(self, start=None, end=None):
+        """
+        Limit process() and iter_messages() to time messages from start to end, in
+        units of time message, e.g. GPS_TimeUS. Mapped logs are sought close to
+        start and left right after end. Rows of narrow layouts are kept by their own
+        time stamp. None leaves window open on that side
+        """
+
+        self.__window = None if start is None and end is None else (start, end)
+
+    def set_output_layout(self, layout):
+        """
+        Set layout of output. LAYOUT_WIDE is one table with a row per time message.
+        LAYOUT_TABLES writes every message at its own rate as row of its type's
+        table, LAYOUT_LONG as (time, message, field, value) rows. Narrow layouts
+        start with the first time message and stamp rows with the message's own time
+        field, e.g. BARO_TimeUS, or with the time column if the message has none
+        """
+
+        if layout not in self.LAYOUTS:
+            raise Exception("Unknown layout %s, must be one of %s" % (layout, ", ".join(self.LAYOUTS)))
+        self.__layout = layout
 
     # Set a list of messages to ignore during processing
     def set_msg_ignore(self, msg_ignore):
         self.__msg_ignore = msg_ignore
 
-    def set_output_file(self, file_name, file_type):
-        """ Creates output file with provided file type and name """
+    def set_output_file(self, file_name, file_type, float_format=None, compression=None):
+        """
+        Creates output file with provided file type and name. float_format is
+        %-style, txt/csv only. compression is "gzip" or "xz", txt/csv only, it adds
+        .gz or .xz to the file name
+        """
 
         if file_type == 'txt' or file_type == 'csv':
-            self.__file = open(file_name + '.' + file_type, "w+")
             self.__delim_char = ',' if file_type == 'csv' else '\t'
+            suffix = PxCompressWriter.SUFFIXES.get(compression, '')
+            self.__writer = PxTextWriter(
+                file_name + '.' + file_type + suffix, self.__delim_char, float_format, compression)
         elif file_type == 'xlsx':
-            self.__workbook = xlsxwriter.Workbook(
-                file_name + '.' + file_type, {'nan_inf_to_errors': True})
-            self.__file = self.__workbook.add_worksheet()
+            if compression is not None:
+                raise Exception("Compression is available for txt/csv output only")
+            self.__writer = PxXlsxWriter(file_name + '.' + file_type)
+
+    def set_writer(self, writer):
+        """ Set custom output backend, a PxWriter """
+
+        self.__writer = writer
 
     # Convert Cstring to string object
     def __to_utf8(self, cstr):
         """ Convert ASCII to UTF-8 """
 
-        return str(cstr, 'ascii').split('\0')[0]
+        return str(cstr, 'ascii', 'replace').split('\0')[0]
 
     def process(self, fn):
         """ Main function. Converts provided .bin file to human-readable text format """
 
-        file_size = Path(fn).stat().st_size  # Get file size
-        if self.__debug_out:
-            for msg_name, show_fields in self.__msg_filter:
-                self.__msg_filter_map[msg_name] = show_fields
-        first_data_msg = True
-        f = open(fn, "rb")  # Open log file
+        ctx = PxContext(self.__writer)
+        self.__writer = None  # Writer belongs to this run now
+        self.completed = 0
+        self.msg_count = 0
+        self.skipped = list()
+        self.stats = None
+        self.__initFilter(ctx)
+        if self.__window is not None:
+            if not self.__time_msg:
+                raise Exception("Time window requires time message")
+            ctx.window = self.__window
+        if self.__interpolation and self.__layout != self.LAYOUT_WIDE:
+            raise Exception("Interpolation requires wide layout")
+        if self.__collect_stats:
+            ctx.stats = PxStats()
+            ctx.stats.start(PxStats.READ)
+            start = time.perf_counter()
+        try:
+            with open(fn, "rb") as f:  # Open log file
+                ctx.file_size = os.fstat(f.fileno()).st_size
+                compression = PxDecompressReader.detect(f)
+                if compression is not None:  # Decompressed on a background thread, read as a stream
+                    ctx.source = PxDecompressReader(f, compression)
+                mapped = self.__mapFile(f) if (self.__use_mmap or self.__use_index) and ctx.source is None else None
+                if ctx.stats is not None:
+                    ctx.stats.file_size = ctx.file_size
+                    ctx.stats.switch(PxStats.DECODE)
+                try:
+                    if mapped is not None and mapped[:len(self.ULOG_MAGIC)] == self.ULOG_MAGIC:
+                        self.__processMapped(ctx, mapped)  # ULog is parsed serially
+                    elif mapped is not None and self.__use_index:
+                        self.__processIndexed(
+                            ctx, mapped, self.__getIndex(fn, mapped))
+                    elif mapped is not None and ctx.window is not None:
+                        self.__processWindow(ctx, mapped)
+                    elif mapped is not None and self.__parallel > 1 and not self.__debug_out and \
+                            self.__layout == self.LAYOUT_WIDE:
+                        self.__processParallel(ctx, fn, mapped)
+                    elif mapped is not None:
+                        self.__processMapped(ctx, mapped)
+                    else:  # Compressed logs, pipes, character devices and empty files
+                        self.__processChunked(ctx, ctx.source or f)
+                except PxWindowEnd:
+                    pass  # Rest of log is past time window
+                finally:
+                    if ctx.source is not None:
+                        ctx.source.close()
+            if ctx.resampler is not None:  # Output rows left in resampler
+                if ctx.stats is not None:
+                    ctx.stats.switch(PxStats.INTERPOLATE)
+                for row in ctx.resampler.flush():
+                    self.__printResampled(ctx, row)
+            if not ctx.output_ready:  # Log has no data messages, output gets headers only
+                if not ctx.msg_names:
+                    raise Exception("No messages in %s" % fn)
+                self.__startOutput(ctx)
+                if ctx.layout == self.LAYOUT_TABLES:
+                    for msg_name, slots in ctx.msg_slots.items():
+                        if slots[1] > slots[0]:
+                            self.__openTable(ctx, msg_name)
+            self.__flushRows(ctx)  # Write rows left
+            self.__checkpoint(ctx, ctx.file_size, True)
+        except PxCancelled:
+            if ctx.output_ready:
+                self.__flushRows(ctx)  # Keep rows decoded so far
+            raise
+        finally:
+            if ctx.writer is not None and ctx.output_ready:  # Close file
+                if ctx.stats is not None:
+                    ctx.stats.switch(PxStats.WRITE)
+                ctx.writer.close()
+        if ctx.stats is not None:
+            ctx.stats.stop()
+            ctx.stats.total_time = time.perf_counter() - start
+            self.stats = ctx.stats
+
+    def follow(self, fn, interval=1.0, callback=None, timeout=None):
+        """
+        Follow log file while it's being written, like tail -f. Bytes appended since
+        the last poll are decoded with FMT table and column values kept, an
+        incomplete message at the end waits for the rest of it. New rows go to
+        the output file, flushed after every poll, or to callback(rows) if it's
+        set. Polls every interval seconds until cancel token is cancelled or no
+        data arrives for timeout seconds
+        """
+
+        writer = PxCallbackWriter(callback) if callback is not None else self.__writer
+        ctx = PxContext(writer)
+        self.__writer = None  # Writer belongs to this run now
+        self.completed = 0
+        self.msg_count = 0
+        self.skipped = list()
+        self.stats = None
+        self.__initFilter(ctx)
+        if self.__window is not None:
+            if not self.__time_msg:
+                raise Exception("Time window requires time message")
+            ctx.window = self.__window
+        if self.__interpolation and self.__layout != self.LAYOUT_WIDE:
+            raise Exception("Interpolation requires wide layout")
+        bytes_read = 0
+        try:
+            with open(fn, "rb") as f:
+                if PxDecompressReader.detect(f) is not None:
+                    raise Exception("Compressed logs can't be followed")
+                idle_since = time.monotonic()
+                while True:
+                    ctx.file_size = os.fstat(f.fileno()).st_size
+                    parsed = self.__processChunked(ctx, f, bytes_read)
+                    if parsed > bytes_read:
+                        idle_since = time.monotonic()
+                    bytes_read = parsed
+                    if ctx.output_ready:  # Caught up with the log, pass new rows on
+                        self.__flushRows(ctx)
+                        if ctx.writer is not None:  # Debug output has no writer
+                            ctx.writer.flush()
+                    if timeout is not None and time.monotonic() - idle_since >= timeout:
+                        break
+                    time.sleep(interval)
+                    self.__checkpoint(ctx, bytes_read)
+        except (PxCancelled, PxWindowEnd):
+            pass  # Normal end of following
+        finally:
+            if ctx.output_ready:
+                if ctx.resampler is not None:  # Output rows left in resampler
+                    for row in ctx.resampler.flush():
+                        self.__printResampled(ctx, row)
+                self.__flushRows(ctx)
+                if ctx.writer is not None:
+                    ctx.writer.close()
+
+    def process_many(self, jobs, max_workers=None):
+        """
+        Convert many logs at once on a thread pool. jobs are (log file, output
+        file name, file type) tuples, every job runs on a copy of this parser with
+        its settings. Returns (log file, exception or None) for every job, in order
+        """
+
+        def run(job):
+            fn, file_name, file_type = job
+            parser = copy.copy(self)
+            try:
+                parser.set_output_file(file_name, file_type)
+                parser.process(fn)
+            except Exception as e:
+                return (fn, e)
+            return (fn, None)
+
+        with ThreadPoolExecutor(max_workers) as pool:
+            return list(pool.map(run, jobs))
+
+    def to_arrays(self, fn, columns=False):
+        """
+        Decode wanted messages of log file into NumPy arrays. Returns a structured
+        array per message name, or a dict of column arrays per message name if
+        columns is set. Fields with multipliers are scaled to float64. Message
+        offsets come from the index, without a saved one they are found by a
+        vectorized scan each call instead of saving a sidecar the caller didn't ask for
+        """
+
+        if np is None:
+            raise Exception("NumPy is required for to_arrays()")
+        ctx = PxContext()
+        self.__initFilter(ctx)
+        arrays = dict()
+        with open(fn, "rb") as f:
+            mapped = self.__mapFile(f) if PxDecompressReader.detect(f) is None else None
+            if mapped is None:
+                raise Exception("Can't decode %s: file can't be mapped" % fn)
+            with mapped:
+                if mapped[:len(self.ULOG_MAGIC)] == self.ULOG_MAGIC:
+                    return self.__ulogArrays(ctx, mapped, columns)
+                index = self.__getIndex(fn, mapped)
+                self.__loadFmtTable(ctx, index.fmt_records)
+                data = np.frombuffer(mapped, dtype=np.uint8)
+                for msg_type in ctx.msg_plans:
+                    offsets = index.offsets.get(msg_type)
+                    if offsets:
+                        msg_name, records = self.__decodeArray(
+                            ctx, data, msg_type, offsets, columns)
+                        arrays[msg_name] = records
+                del data  # Release mapping before closing it
+        return arrays
+
+    def __ulogArrays(self, ctx, mapped, columns):
+        """ Walk mapped ULog log file for offsets of wanted topics' data messages, decode them in bulk """
+
+        state = PxContext()
+        state.ulog_formats = dict()
+        layouts = dict()  # Msg id -> (topic name, names, formats, field offsets, length)
+        offsets = dict()  # Layout -> array of data message offsets, topic may be subscribed again
+
+        def subscribe(msg_id, msg_name, fields):
+            show_fields = self.__filterMsg(ctx, msg_name)
+            names = []
+            formats = []
+            field_offsets = []
+            pos = self.ULOG_MSG_HEADER_LEN + 2  # Payload starts with msg id
+            for code, label in fields:
+                if label is not None and show_fields and (show_fields == "*" or label in show_fields):
+                    names.append(label)
+                    formats.append("S" + code[:-1] if code.endswith("s") else
+                                   "S1" if code == "c" else "<" + code)
+                    field_offsets.append(pos)
+                pos += struct.calcsize("<" + code)
+            if names:  # Trailing padding may be left out of messages, so they end with the last field
+                layout = layouts[msg_id] = (msg_name, tuple(names), tuple(formats), tuple(field_offsets),
+                                            field_offsets[-1] + np.dtype(formats[-1]).itemsize)
+                offsets.setdefault(layout, array('Q'))
+            else:  # Topic isn't wanted
+                layouts.pop(msg_id, None)
+
+        buffer = memoryview(mapped)
+        try:
+            for msg_id, pointer in self.__walkULogBuffer(state, buffer, self.ULOG_HEADER_LEN, 0, True, subscribe):
+                layout = layouts.get(msg_id)
+                if layout is not None:
+                    offsets[layout].append(pointer)
+        finally:
+            state.buffer = bytearray()
+            buffer.release()
+        arrays = dict()
+        data = np.frombuffer(mapped, dtype=np.uint8)
+        for (msg_name, names, formats, field_offsets, msg_length), layout_offsets in offsets.items():
+            if layout_offsets and msg_name not in arrays:
+                arrays[msg_name] = self.__gatherArray(data, layout_offsets, list(names), list(formats),
+                                                      list(field_offsets), [None] * len(names), msg_length, columns)
+        del data  # Release mapping before closing it
+        return arrays
+
+    def __decodeArray(self, ctx, data, msg_type, offsets, columns):
+        """ Gather all messages of one type, decode them in bulk """
+
+        msg_length, msg_name, msg_format, msg_labels, msg_struct, msg_mults = ctx.msg_descrs[
+            msg_type]
+        show_fields = self.__filterMsg(ctx, msg_name)
+        names = []
+        formats = []
+        field_offsets = []
+        mults = []
+        pos = self.MSG_HEADER_LEN
+        for c, label, mult in zip(msg_format, msg_labels, msg_mults):
+            code = self.FORMAT_TO_STRUCT[c][0]
+            if show_fields == "*" or label in show_fields:
+                names.append(label)
+                formats.append(
+                    "S" + code[:-1] if code.endswith("s") else "<" + code)
+                field_offsets.append(pos)
+                mults.append(mult)
+            pos += struct.calcsize("<" + code)
+        return msg_name, self.__gatherArray(data, offsets, names, formats, field_offsets, mults, msg_length, columns)
+
+    def __gatherArray(self, data, offsets, names, formats, field_offsets, mults, msg_length, columns):
+        """ Copy messages at offsets out of data, get their fields as structured array or dict of columns """
+
+        dtype = np.dtype({"names": names, "formats": formats,
+                          "offsets": field_offsets, "itemsize": msg_length})
+
+        # Copy messages to one contiguous block, GATHER_BLOCK_SIZE at a time
+        starts = np.frombuffer(offsets, dtype=np.uint64).astype(np.intp)
+        span = np.arange(msg_length, dtype=np.intp)
+        raw = np.empty((len(starts), msg_length), dtype=np.uint8)
+        for i in range(0, len(starts), self.GATHER_BLOCK_SIZE):
+            block = starts[i:i + self.GATHER_BLOCK_SIZE]
+            raw[i:i + len(block)] = data[block[:, None] + span]
+        records = np.frombuffer(raw, dtype=dtype)
+
+        scaled = dict()
+        for name, mult in zip(names, mults):
+            if mult:  # apply multuplyer if needed
+                scaled[name] = records[name] * mult
+            else:
+                scaled[name] = np.ascontiguousarray(records[name])
+        if columns:
+            return scaled
+        result = np.empty(len(records), dtype=[
+                          (name, scaled[name].dtype) for name in names])
+        for name in names:
+            result[name] = scaled[name]
+        return result
+
+    def iter_messages(self, fn, types=None, fields=None):
+        """
+        Lazily decode log file, yield one record per data message. Records are
+        tuples of per-type classes generated from FMT messages, named after the
+        message. types limits message names, fields is a list of labels or a
+        dict of labels per message name. With a time window, records from the
+        first time message inside it to the last one are yielded. Labels which
+        aren't identifiers, like flattened ULog fields q[0], are renamed to
+        positional names, _labels of the record class keeps them
+        """
+
+        decoders = dict()
+        lengths = {self.MSG_TYPE_FORMAT: self.MSG_FORMAT_PACKET_LEN}
+        clock = None
+        if self.__window is not None:
+            if not self.__time_msg:
+                raise Exception("Time window requires time message")
+            clock = [None, None, None, self.__window[0] is None]  # Time type, struct, multiplier, inside
+        self.skipped = list()
+        with open(fn, "rb") as f:
+            compression = PxDecompressReader.detect(f)
+            if compression is not None:  # Decompressed on a background thread, read as a stream
+                with PxDecompressReader(f, compression) as source:
+                    yield from self.__iterChunked(source, decoders, lengths, types, fields, clock)
+                return
+            mapped = self.__mapFile(f) if self.__use_mmap else None
+            if mapped is not None:
+                with mapped:
+                    if mapped[:len(self.ULOG_MAGIC)] == self.ULOG_MAGIC:  # Parsed serially, like by process()
+                        buffer = memoryview(mapped)
+                        try:
+                            yield from self.__iterULogBuffer(buffer, self.ULOG_HEADER_LEN, 0, True,
+                                                             self.__ulogState(), decoders, types, fields, clock)
+                        finally:
+                            buffer.release()
+                        return
+                    start = 0
+                    if clock is not None and self.__window[0] is not None:
+                        head, head_lengths, data_start = self.__readHeader(mapped)
+                        start = self.__seekTime(
+                            mapped, head, head_lengths, data_start, self.__window[0])
+                        if start > data_start:  # Take FMT table up to seek point
+                            for record in head + [record for offset, record in
+                                                  self.__findFmtRecords(mapped, data_start, start)]:
+                                yield from self.__iterBuffer(record, 0, 0, True, decoders, lengths, types, fields, clock)
+                        else:
+                            start = 0
+                    buffer = memoryview(mapped)
+                    try:
+                        yield from self.__iterBuffer(buffer, start, 0, True, decoders, lengths, types, fields, clock)
+                    finally:
+                        buffer.release()
+                return
+            yield from self.__iterChunked(f, decoders, lengths, types, fields, clock)
+
+    def __iterChunked(self, f, decoders, lengths, types, fields, clock):
+        """ Yield records of log stream, reading it in BLOCK_SIZE chunks """
+
+        buffer = bytearray()
+        pointer = 0
         bytes_read = 0
+        state = None  # ULog formats and subscriptions
+        while True:
+            chunk = f.read(self.BLOCK_SIZE)
+            if len(chunk) == 0:
+                break
+            buffer = buffer[pointer:] + chunk
+            if not bytes_read and state is None and buffer[:len(self.ULOG_MAGIC)] == self.ULOG_MAGIC:
+                state = self.__ulogState()
+                buffer = buffer[self.ULOG_HEADER_LEN:]
+                bytes_read = self.ULOG_HEADER_LEN
+            if state is not None:
+                pointer = yield from self.__iterULogBuffer(buffer, 0, bytes_read, False, state,
+                                                           decoders, types, fields, clock)
+            else:
+                pointer = yield from self.__iterBuffer(buffer, 0, bytes_read, False, decoders, lengths, types, fields, clock)
+            if pointer < 0:
+                break  # Past time window
+            bytes_read += pointer
+
+    def __iterBuffer(self, buffer, pointer, offset, final, decoders, lengths, types, fields, clock=None):
+        """
+        Yield records of complete messages in buffer, return pointer where it stopped.
+        clock tracks time window across buffers, -1 is returned past its end
+        """
+
+        time_type = None
+        inside = True
+        if clock is not None:
+            time_type = clock[0]
+            inside = clock[3]
+            end = self.__window[1]
+        while len(buffer) - pointer >= self.MSG_HEADER_LEN:
+            head1 = buffer[pointer]
+            head2 = buffer[pointer+1]
+            msg_type = buffer[pointer+2]
+            msg_length = lengths.get(msg_type)
+            if head1 != self.MSG_HEAD1 or head2 != self.MSG_HEAD2 or msg_length is None:
+                if self.__correct_errors:  # If correction enabled, skip to next message
+                    resynced = self.__resync(
+                        buffer, pointer, offset, final, lengths)
+                    if resynced == pointer:
+                        break  # Wait for more data
+                    pointer = resynced
+                    continue
+                elif head1 != self.MSG_HEAD1 or head2 != self.MSG_HEAD2:
+                    raise Exception("Invalid header at %i (0x%X): %02X %02X, must be %02X %02X" % (
+                        offset + pointer, offset + pointer, head1, head2, self.MSG_HEAD1, self.MSG_HEAD2))
+                raise Exception("Unknown msg type: %i at %i (0x%X)" % (
+                    msg_type, offset + pointer, offset + pointer))
+            if len(buffer) - pointer < msg_length:
+                break  # Incomplete message, wait for more data
+            if msg_type == self.MSG_TYPE_FORMAT:
+                data = struct.unpack_from(
+                    self.MSG_FORMAT_STRUCT, buffer, pointer + self.MSG_HEADER_LEN)
+                if data[0] != self.MSG_TYPE_FORMAT:
+                    lengths[data[0]] = data[1]
+                    decoders[data[0]] = self.__compileRecord(
+                        data, types, fields)
+                    time_field = self.__timeField(
+                        data) if clock is not None else None
+                    if time_field:
+                        time_type = clock[0] = data[0]
+                        clock[1], clock[2] = time_field
+            else:
+                if msg_type == time_type:
+                    time_value = clock[1].unpack_from(
+                        buffer, pointer + self.MSG_HEADER_LEN)[0]
+                    if clock[2]:
+                        time_value *= clock[2]
+                    if end is not None and time_value > end:
+                        return -1
+                    if not inside:
+                        inside = clock[3] = time_value >= self.__window[0]
+                decoder = decoders.get(msg_type) if inside else None
+                if decoder is not None:
+                    msg_struct, msg_mults, record_class = decoder
+                    values = msg_struct.unpack_from(
+                        buffer, pointer + self.MSG_HEADER_LEN)
+                    if msg_mults:  # Scale values, convert strings
+                        values = [val * mult if mult else (self.__to_utf8(val) if type(val) is bytes else val)
+                                  for val, mult in zip(values, msg_mults)]
+                    yield record_class._make(values)
+            pointer += msg_length
+        return pointer
+
+    def summarize(self, fn, types=None, fields=None, quantiles=None):
+        """
+        Compute statistics of numeric fields in one streaming pass, without output
+        file. types and fields select fields like in iter_messages, quantiles are
+        reported ones. Returns PxSummary, its fields are named like columns
+        """
+
+        summary = PxSummary(quantiles)
+        batches = dict()  # Record class -> (pending records, [(field index, field summary)])
+        for record in self.iter_messages(fn, types, fields):
+            batch = batches.get(record.__class__)
+            if batch is None:  # First record of type, strings are left out
+                batch = batches[record.__class__] = ([], [
+                    (i, summary.field(record.__class__.__name__ + "_" + label))
+                    for i, label in enumerate(record._labels)
+                    if not isinstance(record[i], (str, bytes))])
+            records = batch[0]
+            records.append(record)
+            if len(records) >= self.SUMMARY_BATCH_SIZE:
+                self.__foldRecords(summary, batch)
+        for batch in batches.values():
+            self.__foldRecords(summary, batch)
+        return summary
+
+    def __foldRecords(self, summary, batch):
+        """ Fold pending records of a type into their field summaries """
+
+        records, field_summaries = batch
+        summary.msg_count += len(records)
+        if field_summaries and records:
+            columns = list(zip(*records))  # Transpose in one go
+            for i, field_summary in field_summaries:
+                field_summary.update(columns[i])
+        records.clear()
+
+    def __compileRecord(self, fmt_data, types, fields):
+        """ Get (struct, multipliers, record class) of message type, None if it isn't wanted """
+
+        msg_name = self.__to_utf8(fmt_data[2])
+        if types is not None and msg_name not in types:
+            return None
+        msg_format = self.__to_utf8(fmt_data[3])
+        msg_labels = self.__to_utf8(fmt_data[4]).split(",")
+        if isinstance(fields, dict):
+            show_fields = fields.get(msg_name, "*")
+        else:
+            show_fields = fields or "*"
+        plan_struct, plan_mults, plan_labels = self.__projectStruct(
+            msg_format, msg_labels, show_fields)
+        if not plan_labels:
+            return None
+        needs_convert = any(plan_mults) or "s" in plan_struct
+        return (struct.Struct(plan_struct), plan_mults if needs_convert else None,
+                self.__recordClass(msg_name, fmt_data[0], plan_labels))
+
+    def __recordClass(self, msg_name, msg_type, labels):
+        """ Get tuple-backed record class with a slot per field """
+
+        key = (msg_name, tuple(labels))
+        record_class = self.__record_classes.get(key)
+        if record_class is None:
+            record_class = namedtuple(msg_name if msg_name.isidentifier() else "MSG_%i" % msg_type,
+                                      labels, rename=True)
+            record_class._labels = key[1]  # Renamed fields keep their labels here
+            self.__record_classes.put(key, record_class)
+        return record_class
+
+    def __ulogState(self):
+        """ Get run context which keeps ULog formats and subscriptions of iteration """
+
+        state = PxContext()
+        state.ulog_formats = dict()
+        return state
+
+    def __iterULogBuffer(self, buffer, pointer, offset, final, state, decoders, types, fields, clock=None):
+        """
+        Yield records of complete ULog data messages in buffer, return pointer where
+        it stopped. decoders are kept by msg id, clock tracks time window like in
+        __iterBuffer
+        """
+
+        inside = True
+        if clock is not None:
+            inside = clock[3]
+            end = self.__window[1]
+
+        def subscribe(msg_id, msg_name, msg_fields):
+            decoders[msg_id] = self.__compileULogRecord(
+                msg_id, msg_name, msg_fields, types, fields, clock)
+
+        for msg_id, pointer in self.__walkULogBuffer(state, buffer, pointer, offset, final, subscribe):
+            if clock is not None and msg_id == clock[0]:
+                time_value = clock[1].unpack_from(
+                    buffer, pointer + self.ULOG_MSG_HEADER_LEN)[0]
+                if end is not None and time_value > end:
+                    return -1
+                if not inside:
+                    inside = clock[3] = time_value >= self.__window[0]
+            decoder = decoders.get(msg_id) if inside else None
+            if decoder is not None:
+                msg_struct, converts, record_class = decoder
+                values = msg_struct.unpack_from(
+                    buffer, pointer + self.ULOG_MSG_HEADER_LEN)
+                if converts:  # Convert strings
+                    values = [self.__to_utf8(val) if type(val) is bytes else val for val in values]
+                yield record_class._make(values)
+        return state.pointer
+
+    def __compileULogRecord(self, msg_id, msg_name, msg_fields, types, fields, clock):
+        """
+        Get (struct, converts strings, record class) of ULog topic instance, None if
+        it isn't wanted. Sets clock if topic has the time field
+        """
+
+        if types is not None and msg_name not in types:
+            show_fields = None
+        elif isinstance(fields, dict):
+            show_fields = fields.get(msg_name, "*")
+        else:
+            show_fields = fields or "*"
+        plan_struct = "<2x"  # Skip msg id
+        plan_labels = []
+        pad = 0
+        pos = 2
+        for code, label in msg_fields:
+            if clock is not None and label is not None and msg_name + "_" + label == self.__time_msg:
+                clock[0] = msg_id
+                clock[1] = struct.Struct("<%ix%s" % (pos, code))
+            size = struct.calcsize("<" + code)
+            if label is not None and show_fields and (show_fields == "*" or label in show_fields):
+                if pad:
+                    plan_struct += "%ix" % pad
+                    pad = 0
+                plan_struct += code
+                plan_labels.append(label)
+            else:  # Skip unused field, nothing after the last used one
+                pad += size
+            pos += size
+        if not plan_labels:
+            return None
+        return (struct.Struct(plan_struct), "s" in plan_struct or "c" in plan_struct,
+                self.__recordClass(msg_name, msg_id, plan_labels))
+
+    def __walkULogBuffer(self, state, buffer, pointer, offset, final, subscribe):
+        """
+        Yield (msg id, pointer) of complete ULog data messages in buffer, keep pointer
+        where it stopped in state. Formats and subscriptions are kept in state,
+        subscribe is called with (msg id, topic name, flattened fields) of every
+        subscription
+        """
+
+        state.buffer = buffer
+        topics = state.ulog_topics
+        while len(buffer) - pointer >= self.ULOG_MSG_HEADER_LEN:
+            msg_type = buffer[pointer + 2]
+            end = pointer + self.ULOG_MSG_HEADER_LEN + \
+                (buffer[pointer] | buffer[pointer + 1] << 8)
+            corrupted = state.ulog_lost or (msg_type not in self.ULOG_MSG_TYPES and self.__correct_errors)
+            if not corrupted and end > len(buffer):
+                break  # Incomplete message, wait for more data
+            if not corrupted and msg_type == self.ULOG_MSG_DATA:
+                msg_id = buffer[pointer + 3] | buffer[pointer + 4] << 8
+                if msg_id in topics:
+                    yield msg_id, pointer
+                elif self.__correct_errors:  # Most likely corrupted header
+                    corrupted = True
+                else:
+                    raise Exception("Unknown ULog msg id: %i at %i (0x%X)" % (
+                        msg_id, offset + pointer, offset + pointer))
+            elif not corrupted and msg_type == self.ULOG_MSG_FORMAT:
+                self.__parseULogFormat(state, pointer, end)
+            elif not corrupted and msg_type == self.ULOG_MSG_ADD_LOGGED:
+                start = pointer + self.ULOG_MSG_HEADER_LEN
+                name = self.__to_utf8(bytes(buffer[start + 3:end]))
+                if name in state.ulog_formats:
+                    msg_id = buffer[start + 1] | buffer[start + 2] << 8
+                    msg_name = "%s_%i" % (name, buffer[start]) if buffer[start] else name
+                    topics[msg_id] = msg_name
+                    subscribe(msg_id, msg_name, self.__flattenULog(state, name, ""))
+                elif self.__correct_errors:  # Most likely corrupted message
+                    corrupted = True
+                else:
+                    raise Exception("ULog topic without format at %i (0x%X)" % (
+                        offset + pointer, offset + pointer))
+            elif not corrupted and msg_type == self.ULOG_MSG_REMOVE_LOGGED:
+                topics.pop(buffer[pointer + 3] | buffer[pointer + 4] << 8, None)
+            if corrupted:
+                state.pointer = pointer
+                if not self.__skipCorruptedULog(state, offset, final):
+                    break  # Wait for more data
+                pointer = state.pointer
+                continue
+            pointer = end  # Other messages are skipped, so are unknown ones
+        state.pointer = pointer
+
+    def build_index(self, fn):
+        """ Scan log file, return PxIndex of its FMT table, message offsets and time messages """
+
+        index = PxIndex(fn, self.__time_msg)
+        self.skipped = list()
+        with open(fn, "rb") as f:
+            mapped = self.__mapFile(f) if PxDecompressReader.detect(f) is None else None
+            if mapped is None:
+                raise Exception("Can't index %s: file can't be mapped" % fn)
+            with mapped:
+                self.__scanIndex(memoryview(mapped), index)
+        return index
+
+    def __scanIndex(self, buffer, index):
+        """ Walk message headers of mapped log file, fill index """
+
+        if buffer[:len(self.ULOG_MAGIC)] == self.ULOG_MAGIC:
+            buffer.release()
+            raise Exception("ULog logs can't be indexed")
+        if np is not None and self.__scanIndexArrays(buffer, index):
+            buffer.release()
+            return
+        lengths = {self.MSG_TYPE_FORMAT: self.MSG_FORMAT_PACKET_LEN}
+        offsets = index.offsets
+        time_type = None
+        time_count = 0
+        pointer = 0
+        try:
+            while len(buffer) - pointer >= self.MSG_HEADER_LEN:
+                head1 = buffer[pointer]
+                head2 = buffer[pointer+1]
+                msg_type = buffer[pointer+2]
+                msg_length = lengths.get(msg_type)
+                if head1 != self.MSG_HEAD1 or head2 != self.MSG_HEAD2 or msg_length is None:
+                    if self.__correct_errors:  # If correction enabled, skip to next message
+                        pointer = self.__resync(
+                            buffer, pointer, 0, True, lengths)
+                        continue
+                    elif head1 != self.MSG_HEAD1 or head2 != self.MSG_HEAD2:
+                        raise Exception("Invalid header at %i (0x%X): %02X %02X, must be %02X %02X" % (
+                            pointer, pointer, head1, head2, self.MSG_HEAD1, self.MSG_HEAD2))
+                    raise Exception("Unknown msg type: %i at %i (0x%X)" % (
+                        msg_type, pointer, pointer))
+                if len(buffer) - pointer < msg_length:
+                    break  # Incomplete message at the end of file
+                if msg_type == self.MSG_TYPE_FORMAT:
+                    index.fmt_records.append(
+                        bytes(buffer[pointer:pointer + msg_length]))
+                    index.fmt_offsets.append(pointer)
+                    data = struct.unpack_from(
+                        self.MSG_FORMAT_STRUCT, buffer, pointer + self.MSG_HEADER_LEN)
+                    lengths[data[0]] = data[1]
+                    time_field = self.__timeField(data)
+                    if time_field:
+                        time_type = data[0]
+                        time_struct, time_mult = time_field
+                else:
+                    type_offsets = offsets.get(msg_type)
+                    if type_offsets is None:
+                        type_offsets = offsets[msg_type] = array('Q')
+                    type_offsets.append(pointer)
+                    if msg_type == time_type:
+                        if time_count % self.TIME_INDEX_STEP == 0:
+                            time_value = time_struct.unpack_from(
+                                buffer, pointer + self.MSG_HEADER_LEN)[0]
+                            index.add_time(
+                                time_value * time_mult if time_mult else time_value, pointer)
+                        time_count += 1
+                pointer += msg_length
+        finally:
+            buffer.release()
+
+    def __scanIndexArrays(self, buffer, index):
+        """
+        Fill index of mapped log file with numpy instead of walking headers one by one. Every
+        header of a known type is a candidate message, the one chain of candidates starting at
+        offset 0 is found by pointer jumping. Returns False leaving index empty if the chain
+        doesn't reach the end of file or disagrees with its FMT messages, the header walk then
+        reports or corrects the error
+        """
+
+        result = self.__chainMessages(buffer)
+        if result is None:
+            return False
+        path, path_types, lengths = result
+        fmt_path = path[path_types == self.MSG_TYPE_FORMAT]
+        fmt_records = [bytes(buffer[pointer:pointer + self.MSG_FORMAT_PACKET_LEN]) for pointer in fmt_path.tolist()]
+        fmt_data = [struct.unpack_from(self.MSG_FORMAT_STRUCT, record, self.MSG_HEADER_LEN) for record in fmt_records]
+        defined = dict()  # Msg type -> (length, FMT offset)
+        for pointer, data in zip(fmt_path.tolist(), fmt_data):
+            if data[0] in defined or (data[0] == self.MSG_TYPE_FORMAT and data[1] != self.MSG_FORMAT_PACKET_LEN):
+                return False  # Redefined type, lengths change along the file
+            defined[data[0]] = (data[1], pointer)
+        is_data = path_types != self.MSG_TYPE_FORMAT
+        data_path = path[is_data]
+        data_types = path_types[is_data]
+        order = np.argsort(data_types, kind="stable")
+        msg_types, starts = np.unique(data_types[order], return_index=True)
+        type_offsets = np.split(data_path[order], starts[1:])
+        for msg_type, offsets in zip(msg_types.tolist(), type_offsets):
+            msg_def = defined.get(msg_type)
+            if msg_def is None or offsets[0] < msg_def[1] or lengths[msg_type] != msg_def[0]:
+                return False  # Message before its FMT or chained by other length than its FMT says
+        time_fields = [(data[0], self.__timeField(data)) for data in fmt_data]
+        time_fields = [field for field in time_fields if field[1]]
+        if len(time_fields) > 1:
+            return False
+
+        index.fmt_records.extend(fmt_records)
+        index.fmt_offsets.extend(fmt_path.tolist())
+        by_type = dict(zip(msg_types.tolist(), type_offsets))
+        for msg_type in sorted(by_type, key=lambda t: by_type[t][0]):  # Types in order of first message
+            offsets = index.offsets[msg_type] = array('Q')
+            offsets.frombytes(by_type[msg_type].astype(np.uint64).tobytes())
+        if time_fields and time_fields[0][0] in by_type:
+            time_struct, time_mult = time_fields[0][1]
+            for pointer in by_type[time_fields[0][0]][::self.TIME_INDEX_STEP].tolist():
+                time_value = time_struct.unpack_from(buffer, pointer + self.MSG_HEADER_LEN)[0]
+                index.add_time(time_value * time_mult if time_mult else time_value, pointer)
+        return True
+
+    def __chainMessages(self, buffer):
+        """
+        Find chain of messages from offset 0 to end of mapped log file, return (offsets, types, lengths)
+        arrays or None, lengths are taken from FMT messages followed by another message or end of file
+        """
+
+        data = np.frombuffer(buffer, np.uint8)
+        file_size = len(data)
+        if file_size < self.MSG_HEADER_LEN:
+            return None
+        candidates = []
+        for start in range(0, file_size - self.MSG_HEADER_LEN + 1, self.SCAN_BLOCK_SIZE):
+            block = data[start:min(start + self.SCAN_BLOCK_SIZE + 2, file_size)]
+            candidates.append(np.flatnonzero((block[:-2] == self.MSG_HEAD1) & (block[1:-1] == self.MSG_HEAD2)) + start)
+        nodes = np.concatenate(candidates)
+        node_types = data[nodes + 2]
+        lengths = np.zeros(256, np.int64)  # Msg type -> length, 0 for unknown types
+        fmt_nodes = nodes[(node_types == self.MSG_TYPE_FORMAT) & (nodes + self.MSG_FORMAT_PACKET_LEN <= file_size)]
+        fmt_ends = fmt_nodes + self.MSG_FORMAT_PACKET_LEN
+        chained = (nodes[np.minimum(np.searchsorted(nodes, fmt_ends), len(nodes) - 1)] == fmt_ends) | (fmt_ends == file_size)
+        fmt_nodes = fmt_nodes[chained]
+        lengths[data[fmt_nodes + self.MSG_HEADER_LEN]] = data[fmt_nodes + self.MSG_HEADER_LEN + 1]
+        lengths[self.MSG_TYPE_FORMAT] = self.MSG_FORMAT_PACKET_LEN
+        ends = nodes + lengths[node_types]
+        known = ends > nodes
+        nodes, node_types, ends = nodes[known], node_types[known], ends[known]
+        complete = ends <= file_size
+        incomplete = nodes[~complete]  # Message cut by end of file can only be the last one
+        nodes, node_types, ends = nodes[complete], node_types[complete], ends[complete]
+        count = len(nodes)
+        if count == 0 or nodes[0] != 0:
+            return None
+
+        # Successor of every candidate, count for end of file, count + 1 for no message
+        succ = np.searchsorted(nodes, ends)
+        found = nodes[np.minimum(succ, count - 1)] == ends
+        at_end = ends > file_size - self.MSG_HEADER_LEN
+        if len(incomplete):
+            at_end |= incomplete[np.minimum(np.searchsorted(incomplete, ends), len(incomplete) - 1)] == ends
+        succ = np.where(found, succ, np.where(at_end, count, count + 1))
+        jump = np.append(succ, (count, count + 1))
+        rank = np.append(succ < count, (0, 0)).astype(np.int64)
+        while (jump[:count] < count).any():  # Pointer jumping: steps to end of chain
+            rank += rank[jump]
+            jump = jump[jump]
+        if jump[0] != count:
+            return None
+        # Chain from 0 has exactly one candidate per rank; candidates jumping into it share ranks with it
+        chain_len = int(rank[0]) + 1
+        rank = rank[:count]
+        members = np.flatnonzero((jump[:count] == count) & (rank < chain_len))
+        at_rank = np.empty(chain_len, np.int64)
+        at_rank[rank[members]] = members
+        shared = np.flatnonzero(np.bincount(rank[members], minlength=chain_len) > 1)
+        at_rank[chain_len - 1] = 0
+        for step in shared[::-1].tolist():  # Descending, the rank above is resolved already
+            if step < chain_len - 1:
+                at_rank[step] = succ[at_rank[step + 1]]
+        at_rank = at_rank[::-1]
+        return nodes[at_rank], node_types[at_rank], lengths
+
+    def __timeField(self, fmt_data):
+        """ Get (struct, multiplier) of time field if FMT message describes time message """
+
+        msg_name = self.__to_utf8(fmt_data[2])
+        if not self.__time_msg or not self.__time_msg.startswith(msg_name + "_"):
+            return None
+        msg_format = self.__to_utf8(fmt_data[3])
+        msg_labels = self.__to_utf8(fmt_data[4]).split(",")
+        label = self.__time_msg[len(msg_name) + 1:]
+        if label not in msg_labels:
+            return None
+        prefix = "<"
+        for c in msg_format[:msg_labels.index(label)]:
+            prefix += self.FORMAT_TO_STRUCT[c][0]
+        f = self.FORMAT_TO_STRUCT[msg_format[msg_labels.index(label)]]
+        return (struct.Struct("<%ix%s" % (struct.calcsize(prefix), f[0])), f[1])
+
+    def __getIndex(self, fn, mapped):
+        """ Load index of mapped log file, scan file if index is disabled or out of date """
+
+        index = PxIndex.load(
+            fn, self.__time_msg) if self.__use_index else None
+        if index is None:
+            index = PxIndex(fn, self.__time_msg)
+            self.__scanIndex(memoryview(mapped), index)
+            if self.__use_index:
+                index.save()
+        return index
+
+    def __loadFmtTable(self, ctx, records):
+        """ Parse stored FMT messages """
+
+        for record in records:
+            ctx.buffer = record
+            ctx.pointer = 0
+            self.__parseMsgDescr(ctx)
+        ctx.buffer = bytearray()
+
+    def __processIndexed(self, ctx, mapped, index):
+        """
+        Parse only wanted messages of mapped log file, going by their indexed offsets.
+        Columns are set up from FMT messages ahead of the first data message, later
+        FMT messages are parsed in file order among data messages
+        """
+
+        file_size = len(mapped)
+        data_start = min([offsets[0] for offsets in index.offsets.values() if offsets] or [file_size])
+        head = bisect.bisect_left(index.fmt_offsets, data_start)
+        self.__loadFmtTable(ctx, index.fmt_records[:head])
+        plans = ctx.msg_plans
+        later = index.fmt_offsets[head:]
+        defined = set(record[3] for record in index.fmt_records[head:])  # Types may be wanted once defined
+        start = 0
+        if ctx.window is not None and ctx.window[0] is not None:
+            start = max(index.seek_time(ctx.window[0]) - self.SEEK_MARGIN, 0)
+        wanted = [later]
+        for msg_type, offsets in index.offsets.items():
+            if msg_type in defined or (msg_type in plans and plans[msg_type][2] is not None):
+                # Last message before start fills in column values of the skipped part
+                first = max(bisect.bisect_left(offsets, start) - 1, 0)
+                wanted.append(islice(offsets, first, None))
+        parse_msg = self.__parseMsg if ctx.stats is None else self.__profileMsg
+        ctx.buffer = memoryview(mapped)
+        if ctx.stats is not None:
+            ctx.stats.add_buffer(file_size)
+        try:
+            if index.offsets:
+                self.__startOutput(ctx)
+            released = 0
+            for count, offset in enumerate(heapq.merge(*wanted)):
+                ctx.pointer = offset
+                msg_type = ctx.buffer[offset + 2]
+                if msg_type == self.MSG_TYPE_FORMAT:
+                    self.__parseMsgDescr(ctx)
+                    continue
+                msg_plan = plans.get(msg_type)
+                if msg_plan is not None and msg_plan[2] is not None:
+                    parse_msg(ctx, msg_plan)
+                    ctx.msgs_decoded += 1
+                if count % 65536 == 0:
+                    self.__checkpoint(ctx, offset)
+                    released = self.__releaseMapped(mapped, released, offset)  # Offsets only grow
+        finally:
+            ctx.buffer.release()
+            ctx.buffer = bytearray()
+            mapped.close()
+
+    def __processParallel(self, ctx, fn, mapped):
+        """
+        Decode byte ranges of mapped log file in worker processes. Ranges start on
+        verified message boundaries, their rows are merged back in file order
+        """
+
+        file_size = len(mapped)
+        try:
+            fmt_records = self.__findFmtRecords(mapped)
+            lengths = {self.MSG_TYPE_FORMAT: self.MSG_FORMAT_PACKET_LEN}
+            for offset, record in fmt_records:
+                lengths.setdefault(record[3], record[4])
+            data_start = self.__findSync(mapped, 0, lengths)
+            while data_start < file_size - 2 and mapped[data_start + 2] == self.MSG_TYPE_FORMAT:
+                data_start += self.MSG_FORMAT_PACKET_LEN  # Skip FMT messages ahead of data
+            bounds = [0]
+            for i in range(1, file_size // self.PARALLEL_RANGE_SIZE):
+                bound = self.__findSync(
+                    mapped, max(i * self.PARALLEL_RANGE_SIZE, data_start + 1), lengths)
+                if bound > bounds[-1] and bound < file_size:
+                    bounds.append(bound)
+            bounds.append(file_size)
+        except Exception:
+            mapped.close()
+            raise
+        if len(bounds) < 3 or data_start >= file_size:  # Too small to split
+            self.__processMapped(ctx, mapped)
+            return
+        mapped.close()
+
+        head = [record for offset, record in fmt_records if offset < data_start]
+        self.__loadFmtTable(ctx, head)
+        self.__initOutput(ctx)  # Initialize file
+        ctx.output_ready = True
+
+        worker = copy.copy(self)
+        worker.__writer = None
+        worker.__parallel = 0
+        worker.__progress_callback = None  # Main process reports and cancels
+        worker.__cancel_token = None
+        carried = ctx.values[:-1]  # Column values at range start
+        pending = deque()
+        with multiprocessing.Pool(self.__parallel) as pool:
+            for start, end in zip(bounds, bounds[1:]):
+                records = [record for offset, record in fmt_records
+                           if data_start <= offset < start]
+                pending.append((end, pool.apply_async(
+                    worker.decode_range, (fn, start, end, head, records))))
+                while len(pending) > self.__parallel * 2 or (pending and end == file_size):
+                    # Bound rows held in memory, merge all at the end
+                    merged, result = pending.popleft()
+                    self.__mergeRange(ctx, result, carried)
+                    self.__checkpoint(ctx, merged)
+
+    def decode_range(self, fn, start, end, head, records):
+        """
+        Parallel worker task. Decode messages of log file from start to end, with
+        columns set up by head FMT messages and FMT messages preceding the range in
+        records. Returns rows with None where a column isn't set inside the range,
+        values of all columns at the range end, skipped ranges, PxStats if enabled and
+        number of data messages decoded
+        """
+
+        ctx = PxContext()
+        self.skipped = list()
+        if self.__collect_stats:
+            ctx.stats = PxStats()
+            ctx.stats.start(PxStats.READ)
+        self.__initFilter(ctx)
+        ctx.raw_rows = []
+        self.__loadFmtTable(ctx, head)
+        self.__initColumns(ctx)
+        self.__loadFmtTable(ctx, records)
+        ctx.output_ready = True
+        with open(fn, "rb") as f:
+            mapped = self.__mapFile(f)
+        ctx.buffer = memoryview(mapped)
+        ctx.pointer = start
+        ctx.sync_limit = end
+        if ctx.stats is not None:
+            ctx.stats.add_buffer(end - start)
+            ctx.stats.switch(PxStats.DECODE)
+        try:
+            self.__parseBuffer(ctx, 0, end)
+        finally:
+            ctx.buffer.release()
+            ctx.buffer = bytearray()
+            mapped.close()
+        if ctx.stats is not None:
+            ctx.stats.stop()
+        return ctx.raw_rows, ctx.values[:-1], self.skipped, ctx.stats, ctx.msgs_decoded
+
+    def __mergeRange(self, ctx, pending, carried):
+        """ Wait for decoded range, fill columns unset in range from preceding ones, output rows of range """
+
+        if ctx.stats is None:
+            rows, state, skipped, stats, decoded = pending.get()
+        else:  # Worker times are counted by workers, main process waits
+            ctx.stats.switch(PxStats.WAIT)
+            rows, state, skipped, stats, decoded = pending.get()
+            ctx.stats.switch(PxStats.ASSEMBLE)
+            ctx.stats.merge(stats)
+        ctx.msgs_decoded += decoded
+        for start, length in skipped:
+            self.__addSkipped(start, length)
+        for row in rows:
+            if None in row:
+                row = [carried[i] if val is None else val for i,
+                       val in enumerate(row)]
+            self.__emitRow(ctx, row)
+        for i, val in enumerate(state):
+            if val is not None:
+                carried[i] = val
+        if ctx.stats is not None:
+            ctx.stats.switch(PxStats.DECODE)
+
+    def __findFmtRecords(self, mapped, start=0, stop=None):
+        """ Find FMT messages of mapped log file starting from start to stop, return (offset, record) pairs """
+
+        fmt_head = bytes((self.MSG_HEAD1, self.MSG_HEAD2, self.MSG_TYPE_FORMAT))
+        file_size = len(mapped)
+        if stop is None:
+            stop = file_size
+        records = []
+        pointer = mapped.find(fmt_head, start, stop)
+        while pointer >= 0:
+            end = pointer + self.MSG_FORMAT_PACKET_LEN
+            # Accept it if it's followed by another message or end of file
+            if end == file_size or (end < file_size - 1 and mapped[end] == self.MSG_HEAD1
+                                    and mapped[end + 1] == self.MSG_HEAD2):
+                records.append((pointer, mapped[pointer:end]))
+                pointer = mapped.find(fmt_head, end, stop)
+            else:
+                pointer = mapped.find(fmt_head, pointer + 1, stop)
+        return records
+
+    def __readHeader(self, mapped):
+        """ Read FMT messages at start of mapped log file, return them, their lengths and offset of first data message """
+
+        file_size = len(mapped)
+        records = []
+        lengths = {self.MSG_TYPE_FORMAT: self.MSG_FORMAT_PACKET_LEN}
+        pointer = 0
+        while (pointer + self.MSG_FORMAT_PACKET_LEN <= file_size and mapped[pointer] == self.MSG_HEAD1
+               and mapped[pointer + 1] == self.MSG_HEAD2 and mapped[pointer + 2] == self.MSG_TYPE_FORMAT):
+            record = mapped[pointer:pointer + self.MSG_FORMAT_PACKET_LEN]
+            records.append(record)
+            lengths[record[3]] = record[4]
+            pointer += self.MSG_FORMAT_PACKET_LEN
+        return records, lengths, pointer
+
+    def __seekTime(self, mapped, head, lengths, pointer, target):
+        """
+        Find message boundary up to SEEK_MARGIN bytes before the first time message at
+        or after target. Bisects mapped log file on verified message boundaries, so
+        only a few blocks around the probes are read. head are FMT messages of file
+        header, pointer is offset of first data message
+        """
+
+        time_type = None
+        for record in head:
+            data = struct.unpack_from(
+                self.MSG_FORMAT_STRUCT, record, self.MSG_HEADER_LEN)
+            time_field = self.__timeField(data)
+            if time_field:
+                time_type = data[0]
+                time_struct, time_mult = time_field
+        if time_type is None or target is None:
+            return pointer  # Can't seek, parse from the start
+        file_size = len(mapped)
+        lo = pointer
+        hi = file_size
+        while hi - lo > self.SEEK_MARGIN:
+            mid = (lo + hi) // 2
+            bound = self.__findSync(mapped, mid, lengths)
+            # Walk messages from boundary to the first time message
+            chain = bound
+            time_value = None
+            while time_value is None and chain + self.MSG_HEADER_LEN <= hi:
+                msg_length = lengths.get(mapped[chain + 2])
+                if (msg_length is None or chain + msg_length > file_size
+                        or mapped[chain] != self.MSG_HEAD1 or mapped[chain + 1] != self.MSG_HEAD2):
+                    break  # Broken chain, e.g. corrupted data
+                if mapped[chain + 2] == time_type:
+                    time_value = time_struct.unpack_from(
+                        mapped, chain + self.MSG_HEADER_LEN)[0]
+                    if time_mult:
+                        time_value *= time_mult
+                chain += msg_length
+            if time_value is not None and time_value < target:
+                lo = bound
+            else:
+                hi = mid
+        if lo - self.SEEK_MARGIN <= pointer:
+            return pointer
+        return self.__findSync(mapped, lo - self.SEEK_MARGIN, lengths)
+
+    def __processWindow(self, ctx, mapped):
+        """
+        Parse mapped log file from shortly before start of time window. Columns are
+        set up from FMT messages of file header like a full run, FMT messages between
+        header and seek point are found by bulk search
+        """
+
+        try:
+            head, lengths, data_start = self.__readHeader(mapped)
+            start = self.__seekTime(
+                mapped, head, lengths, data_start, ctx.window[0])
+            records = [record for offset, record in
+                       self.__findFmtRecords(mapped, data_start, start)]
+        except Exception:
+            mapped.close()
+            raise
+        seeds = []
+        if start > data_start:
+            self.__loadFmtTable(ctx, head)
+            self.__startOutput(ctx)
+            self.__loadFmtTable(ctx, records)
+            seeds = self.__findSeeds(ctx, mapped, data_start, start)
+        else:
+            start = 0  # Window starts close to data, parse all
+        self.__processMapped(ctx, mapped, start, seeds)
+
+    def __findSync(self, mapped, pointer, lengths):
+        """ Find first message boundary at or after pointer, followed by SYNC_CHECK_MSGS valid messages """
+
+        file_size = len(mapped)
+        head = bytes((self.MSG_HEAD1, self.MSG_HEAD2))
         while True:
+            pointer = mapped.find(head, pointer)
+            if pointer < 0:
+                return file_size
+            if self.__isBoundary(mapped, pointer, lengths):
+                return pointer
+            pointer += 1
+
+    def __isBoundary(self, mapped, pointer, lengths):
+        """ Check if pointer is followed by SYNC_CHECK_MSGS valid messages, or valid messages up to the end of file """
+
+        file_size = len(mapped)
+        for i in range(self.SYNC_CHECK_MSGS):
+            if pointer == file_size:
+                return True  # Chain reached end of file
+            msg_length = lengths.get(
+                mapped[pointer + 2]) if pointer + 2 < file_size else None
+            if msg_length is None or mapped[pointer] != self.MSG_HEAD1 or mapped[pointer + 1] != self.MSG_HEAD2:
+                return False
+            pointer += msg_length
+        return pointer <= file_size
+
+    def __findSeeds(self, ctx, mapped, lo, hi):
+        """
+        Find offsets of the last message of every wanted type between lo and hi, in
+        file order. Searched backwards from hi by bulk search, a match counts once
+        it's followed by a chain of valid messages
+        """
+
+        seeds = []
+        for msg_type, msg_plan in ctx.msg_plans.items():
+            if msg_type == self.MSG_TYPE_FORMAT or msg_plan[2] is None:
+                continue
+            head = bytes((self.MSG_HEAD1, self.MSG_HEAD2, msg_type))
+            pointer = hi - msg_plan[0]  # Message must end before hi
+            while pointer >= lo:
+                pointer = mapped.rfind(head, lo, pointer + len(head))
+                if pointer < 0:
+                    break
+                if self.__isBoundary(mapped, pointer, ctx.msg_lengths):
+                    seeds.append(pointer)
+                    break
+                pointer -= 1
+        seeds.sort()
+        return seeds
+
+    def __mapFile(self, f):
+        """ Map log file into memory, return None if it can't be mapped """
+
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, UnsupportedOperation):
+            return None
+
+    def __processMapped(self, ctx, mapped, start=0, seeds=()):
+        """
+        Parse log file in place through a single memoryview, from start to the end.
+        Messages at seeds offsets before start are parsed first, they fill in column
+        values the way the skipped part of the file would
+        """
+
+        file_size = len(mapped)
+        if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)  # Read ahead
+        ctx.buffer = memoryview(mapped)
+        if ctx.stats is not None:
+            ctx.stats.add_buffer(file_size)
+        try:
+            for seed in seeds:
+                ctx.pointer = seed
+                self.__parseMsg(ctx, ctx.msg_plans[ctx.buffer[seed + 2]])
+            ctx.pointer = start
+            released = 0
+            while self.__bytesLeft(ctx) >= self.MSG_HEADER_LEN:
+                limit = ctx.pointer + self.MAPPED_BLOCK_SIZE
+                if not self.__parseBuffer(ctx, 0, limit):
+                    break  # Incomplete message at the end of file
+                self.__checkpoint(ctx, ctx.pointer)
+                released = self.__releaseMapped(mapped, released, ctx.pointer)
+        finally:
+            ctx.buffer.release()
+            ctx.buffer = bytearray()
+            mapped.close()
+
+    def __releaseMapped(self, mapped, released, pointer):
+        """
+        Drop pages of mapped log file from released up to pointer, they're parsed
+        already. Keeps resident memory flat however big the file is. Returns new
+        released offset
+        """
+
+        if not hasattr(mapped, "madvise") or not hasattr(mmap, "MADV_DONTNEED"):
+            return released
+        parsed = pointer - pointer % mmap.PAGESIZE
+        if parsed > released:
+            mapped.madvise(mmap.MADV_DONTNEED, released, parsed - released)
+            released = parsed
+        return released
+
+    def __processChunked(self, ctx, f, bytes_read=0):
+        """
+        Parse log file from a stream, reading it in BLOCK_SIZE chunks until there's
+        no more data. Incomplete message at the end stays in buffer of run, so
+        reading can continue. Returns bytes parsed in total. Progress of compressed
+        logs is counted in compressed bytes
+        """
+
+        while True:
+            if ctx.stats is not None:
+                ctx.stats.switch(PxStats.READ)
             chunk = f.read(self.BLOCK_SIZE)  # Get chunk
             if len(chunk) == 0:  # Quit if block is empty
                 break
             # Add chunk to buffer
-            self.__buffer = self.__buffer[self.__pointer:] + chunk
-            self.__pointer = 0  # Rest pointer
-            while self.__bytesLeft() >= self.MSG_HEADER_LEN:  # If past header
-                head1 = self.__buffer[self.__pointer]
-                head2 = self.__buffer[self.__pointer+1]
-                if (head1 != self.MSG_HEAD1 or head2 != self.MSG_HEAD2):  # Check header integrity
-                    if self.__correct_errors:  # If correction enabled, skip chunk
-                        self.__pointer += 1
+            ctx.buffer = ctx.buffer[ctx.pointer:] + chunk
+            ctx.pointer = 0  # Rest pointer
+            if ctx.stats is not None:
+                ctx.stats.add_buffer(len(ctx.buffer))
+                ctx.stats.switch(PxStats.DECODE)
+            self.__parseBuffer(ctx, bytes_read, len(ctx.buffer), False)
+            bytes_read += ctx.pointer  # Move pointer
+            self.__checkpoint(ctx, bytes_read if ctx.source is None else ctx.source.bytes_in)
+        return bytes_read
+
+    def __checkpoint(self, ctx, bytes_done, final=False):
+        """ Update completion status between blocks, stop if run is cancelled, report progress if it's due """
+
+        if ctx.file_size:
+            self.completed = min(bytes_done / ctx.file_size * 100, 100)
+        if final:
+            self.completed = 100
+        elif self.__cancel_token is not None and self.__cancel_token.is_cancelled():
+            raise PxCancelled("Cancelled at %i of %i bytes" %
+                              (bytes_done, ctx.file_size))
+        if self.__progress_callback is None:
+            return
+        now = time.monotonic()
+        if self.__progress_step:
+            due = bytes_done - ctx.reported_bytes >= self.__progress_step
+        else:
+            due = now - ctx.reported_time >= self.__progress_interval
+        if not due and not final:
+            return
+        ctx.reported_time = now
+        ctx.reported_bytes = bytes_done
+        elapsed = now - ctx.started
+        bytes_per_s = bytes_done / elapsed if elapsed else 0.0
+        eta = None
+        if final:
+            eta = 0.0
+        elif ctx.file_size and bytes_per_s:
+            eta = (ctx.file_size - bytes_done) / bytes_per_s
+        self.__progress_callback(PxProgress(bytes_done, ctx.file_size, self.completed, bytes_per_s,
+                                            ctx.msgs_decoded / elapsed if elapsed else 0.0,
+                                            self.msg_count / elapsed if elapsed else 0.0, eta))
+
+    def __parseBuffer(self, ctx, offset, limit, final=True):
+        """
+        Parse messages starting before limit, return False if buffer ends with an
+        incomplete one. final is False if more data can follow the buffer
+        """
+
+        buffer = ctx.buffer
+        if ctx.ulog_formats is not None:
+            return self.__parseULogBuffer(ctx, offset, limit, final)
+        if offset == 0 and ctx.pointer == 0 and buffer[:len(self.ULOG_MAGIC)] == self.ULOG_MAGIC:
+            if len(buffer) < self.ULOG_HEADER_LEN:
+                return False  # Wait for rest of file header
+            ctx.ulog_formats = dict()
+            ctx.pointer = self.ULOG_HEADER_LEN
+            return self.__parseULogBuffer(ctx, offset, limit, final)
+        parse_msg = self.__parseMsg if ctx.stats is None else self.__profileMsg
+        while ctx.pointer < limit and len(buffer) - ctx.pointer >= self.MSG_HEADER_LEN:  # If past header
+            head1 = buffer[ctx.pointer]
+            head2 = buffer[ctx.pointer+1]
+            if (head1 != self.MSG_HEAD1 or head2 != self.MSG_HEAD2):  # Check header integrity
+                if self.__correct_errors:  # If correction enabled, skip to next message
+                    if not self.__skipCorrupted(ctx, offset, final):
+                        return False  # Wait for more data
+                    continue
+                else:  # If correction disabled, raise exception
+                    raise Exception("Invalid header at %i (0x%X): %02X %02X, must be %02X %02X" % (
+                        offset + ctx.pointer, offset + ctx.pointer, head1, head2, self.MSG_HEAD1, self.MSG_HEAD2))
+            # Get message type
+            msg_type = buffer[ctx.pointer + 2]
+            if msg_type == self.MSG_TYPE_FORMAT:  # If it's format description
+                if self.__bytesLeft(ctx) < self.MSG_FORMAT_PACKET_LEN:  # If remaining lenght less than format message
+                    return False  # Quit
+                if ctx.stats is not None:
+                    ctx.stats.add_message(
+                        msg_type, "FMT", self.MSG_FORMAT_PACKET_LEN)
+                self.__parseMsgDescr(ctx)  # Parse it
+            else:  # Parse data message
+                # Get message discription
+                msg_descr = ctx.msg_descrs.get(msg_type)
+                if msg_descr == None:
+                    if self.__correct_errors:  # Type unknown, most likely corrupted header
+                        if not self.__skipCorrupted(ctx, offset, final):
+                            return False  # Wait for more data
                         continue
-                    else:  # If correction disabled, raise exception
-                        raise Exception("Invalid header at %i (0x%X): %02X %02X, must be %02X %02X" % (
-                            bytes_read + self.__pointer, bytes_read + self.__pointer, head1, head2, self.MSG_HEAD1, self.MSG_HEAD2))
-                # Get message type
-                msg_type = self.__buffer[self.__pointer + 2]
-                if msg_type == self.MSG_TYPE_FORMAT:  # If it's format description
-                    if self.__bytesLeft() < self.MSG_FORMAT_PACKET_LEN:  # If remaining lenght less than format message
-                        break  # Quit
-                    self.__parseMsgDescr()  # Parse it
-                else:  # Parse data message
-                    # Get message discription
-                    msg_descr = self.__msg_descrs[msg_type]
-                    if msg_descr == None:
-                        # If type unknown, raise exception
-                        raise Exception("Unknown msg type: %i" % msg_type)
-                    msg_length = msg_descr[0]  # Set message length
-                    if self.__bytesLeft() < msg_length:
-                        break  # Quit if remaining length lesser than msg_length
-                    if first_data_msg:  # If it's first data message
-                        if not self.__debug_out:
-                            self.__initOutput()  # Initialize file
-                        first_data_msg = False
-                    # Get data from message by it's description
-                    self.__parseMsg(msg_descr)
-            bytes_read += self.__pointer  # Move pointer
-            self.completed = bytes_read / file_size * 100  # Update completion status
-            if not self.__debug_out and self.__time_msg != None and self.__txt_updated:  # Ignore this
-                self.__processData()  # Process data
-        f.close()  # Close log file
-        if type(self.__file) is Worksheet:  # If writing to .xlsx, close file
-            self.__workbook.close()
-
-    def __bytesLeft(self):
+                    # If type unknown, raise exception
+                    raise Exception("Unknown msg type: %i at %i (0x%X)" % (
+                        msg_type, offset + ctx.pointer, offset + ctx.pointer))
+                msg_length = msg_descr[0]  # Set message length
+                if self.__bytesLeft(ctx) < msg_length:
+                    return False  # Quit if remaining length lesser than msg_length
+                ctx.msgs_decoded += 1
+                if not ctx.output_ready:  # If it's first data message
+                    self.__startOutput(ctx)
+                msg_plan = ctx.msg_plans.get(msg_type)
+                if msg_plan is None:  # Filtered out, skip payload by length
+                    ctx.pointer += msg_length
+                    continue
+                # Get data from message by it's decode plan
+                parse_msg(ctx, msg_plan)
+        return True
+
+    def __parseULogBuffer(self, ctx, offset, limit, final):
+        """
+        Parse ULog messages starting before limit, return False if buffer ends with
+        an incomplete one. Data messages are decoded by plans of their subscriptions
+        """
+
+        buffer = ctx.buffer
+        plans = ctx.msg_plans
+        topics = ctx.ulog_topics
+        parse_msg = self.__parseMsg if ctx.stats is None else self.__profileMsg
+        while ctx.pointer < limit and len(buffer) - ctx.pointer >= self.ULOG_MSG_HEADER_LEN:
+            pointer = ctx.pointer
+            msg_type = buffer[pointer + 2]
+            end = pointer + self.ULOG_MSG_HEADER_LEN + \
+                (buffer[pointer] | buffer[pointer + 1] << 8)
+            if ctx.ulog_lost or (msg_type not in self.ULOG_MSG_TYPES and self.__correct_errors):
+                if not self.__skipCorruptedULog(ctx, offset, final):
+                    return False  # Wait for more data
+                continue
+            if end > len(buffer):
+                return False  # Incomplete message, wait for more data
+            if msg_type == self.ULOG_MSG_DATA:
+                msg_id = buffer[pointer + 3] | buffer[pointer + 4] << 8
+                if msg_id not in topics:
+                    if self.__correct_errors:  # Most likely corrupted header
+                        if not self.__skipCorruptedULog(ctx, offset, final):
+                            return False
+                        continue
+                    raise Exception("Unknown ULog msg id: %i at %i (0x%X)" % (
+                        msg_id, offset + pointer, offset + pointer))
+                ctx.msgs_decoded += 1
+                if not ctx.output_ready:  # If it's first data message
+                    self.__startOutput(ctx)
+                msg_plan = plans.get(msg_id)
+                if msg_plan is not None:
+                    parse_msg(ctx, msg_plan)
+            elif msg_type == self.ULOG_MSG_FORMAT:
+                self.__parseULogFormat(ctx, pointer, end)
+            elif msg_type == self.ULOG_MSG_ADD_LOGGED:
+                if not self.__parseULogSubscription(ctx, pointer, end):
+                    if self.__correct_errors:  # Most likely corrupted message
+                        if not self.__skipCorruptedULog(ctx, offset, final):
+                            return False
+                        continue
+                    raise Exception("ULog topic without format at %i (0x%X)" % (
+                        offset + pointer, offset + pointer))
+            elif msg_type == self.ULOG_MSG_REMOVE_LOGGED:
+                msg_id = buffer[pointer + 3] | buffer[pointer + 4] << 8
+                topics.pop(msg_id, None)
+                plans.pop(msg_id, None)
+            ctx.pointer = end  # Other messages are skipped, so are unknown ones
+        return True
+
+    def __skipCorruptedULog(self, ctx, offset, final):
+        """
+        Move pointer of run to next ULog sync message, return False if more data is
+        needed to find it. Run stays lost until it's found, nothing is parsed meanwhile
+        """
+
+        data = ctx.buffer.obj if isinstance(ctx.buffer, memoryview) else ctx.buffer  # Searchable
+        start = ctx.pointer
+        found = data.find(self.ULOG_SYNC_MAGIC, start + self.ULOG_MSG_HEADER_LEN +
+                          (0 if ctx.ulog_lost else 1))
+        if found >= 0:
+            pointer = found - self.ULOG_MSG_HEADER_LEN  # Sync message header
+            ctx.ulog_lost = False
+        elif final:
+            pointer = len(data)
+        else:  # Keep bytes which could start a sync message
+            pointer = max(start, len(data) - len(self.ULOG_SYNC_MAGIC) -
+                          self.ULOG_MSG_HEADER_LEN + 1)
+            ctx.ulog_lost = True
+        if pointer > start:
+            self.__addSkipped(offset + start, pointer - start)
+        ctx.pointer = pointer
+        return found >= 0 or pointer > start
+
+    def __parseULogFormat(self, ctx, pointer, end):
+        """ Save ULog message format, "name:type field;type field;..." """
+
+        text = self.__to_utf8(
+            bytes(ctx.buffer[pointer + self.ULOG_MSG_HEADER_LEN:end]))
+        name, _, fields = text.partition(":")
+        ctx.ulog_formats[name] = [field.split() for field in fields.split(";") if field.strip()]
+
+    def __parseULogSubscription(self, ctx, pointer, end):
+        """
+        Register topic instance logged under msg id, build its decode plan like for
+        a FMT message. Returns False if topic has no format
+        """
+
+        buffer = ctx.buffer
+        start = pointer + self.ULOG_MSG_HEADER_LEN
+        multi_id = buffer[start]
+        msg_id = buffer[start + 1] | buffer[start + 2] << 8
+        name = self.__to_utf8(bytes(buffer[start + 3:end]))
+        msg_name = "%s_%i" % (name, multi_id) if multi_id else name
+        if name not in ctx.ulog_formats:
+            return False
+        fields = self.__flattenULog(ctx, name, "")
+        msg_labels = [label for code, label in fields if label is not None]
+        if ctx.ulog_formats[name][-1][1].startswith("_padding"):
+            fields.pop()  # Trailing padding isn't logged
+        msg_length = self.ULOG_MSG_HEADER_LEN + 2 + \
+            struct.calcsize("<" + "".join(code for code, label in fields))
+        ctx.ulog_topics[msg_id] = msg_name
+        ctx.msg_labels[msg_name] = msg_labels
+        ctx.msg_names.append(msg_name)
+        if self.__debug_out and self.__filterMsg(ctx, msg_name) != None:
+            print("MSG FORMAT: id = %i, length = %i, name = %s, labels = %s" % (
+                msg_id, msg_length, msg_name, str(msg_labels)))
+        show_fields = self.__filterMsg(ctx, msg_name)
+        plan_struct = "<2x"  # Skip msg id
+        plan_keys = []
+        pad = 0
+        for code, label in fields:
+            if label is not None and show_fields and (show_fields == "*" or label in show_fields):
+                if pad:
+                    plan_struct += "%ix" % pad
+                    pad = 0
+                plan_struct += code
+                plan_keys.append(msg_name + "_" + label)
+            else:  # Skip unused field, nothing after the last used one
+                pad += struct.calcsize("<" + code)
+        if plan_keys:
+            ctx.msg_plans[msg_id] = self.__bindPlan(ctx, (msg_length, msg_name, struct.Struct(plan_struct),
+                                                          tuple((None, key) for key in plan_keys)))
+        else:  # Topic isn't wanted
+            self.__skipPlan(ctx, msg_id, msg_length, msg_name)
+        return True
+
+    def __flattenULog(self, ctx, type_name, prefix):
+        """ Get (struct code, label) of fields of ULog format, nested formats flattened. Padding has no label """
+
+        fields = []
+        for field_type, field_name in ctx.ulog_formats[type_name]:
+            count = None
+            if field_type.endswith("]"):  # Array, type[count]
+                field_type, _, count = field_type[:-1].partition("[")
+                count = int(count)
+            code = self.ULOG_TYPE_TO_STRUCT.get(field_type)
+            if code is None:  # Nested format
+                if field_type not in ctx.ulog_formats:
+                    raise Exception("Unknown ULog field type: %s in %s" % (
+                        field_type, type_name))
+                if count is None:
+                    fields += self.__flattenULog(ctx, field_type,
+                                                 prefix + field_name + ".")
+                else:
+                    for i in range(count):
+                        fields += self.__flattenULog(ctx, field_type,
+                                                     "%s%s[%i]." % (prefix, field_name, i))
+            elif field_name.startswith("_padding"):
+                fields.append(("%ix" % (struct.calcsize(code) * (count or 1)), None))
+            elif count is None:
+                fields.append((code, prefix + field_name))
+            elif field_type == "char":  # String
+                fields.append(("%is" % count, prefix + field_name))
+            else:
+                for i in range(count):
+                    fields.append((code, "%s%s[%i]" % (prefix, field_name, i)))
+        return fields
+
+    def __initFilter(self, ctx):
+        """ Fill msg_filter_map of run from __msg_filter """
+
+        ctx.msg_filter = list(self.__msg_filter)
+        for msg_name, show_fields in ctx.msg_filter:
+            ctx.msg_filter_map[msg_name] = show_fields
+
+    def __bytesLeft(self, ctx):
         """ Get amout of bytes left in file being processed """
 
-        return len(self.__buffer) - self.__pointer
+        return len(ctx.buffer) - ctx.pointer
 
-    def __filterMsg(self, msg_name):
+    def __skipCorrupted(self, ctx, offset, final):
+        """ Move pointer of run to next message, return False if more data is needed to find it """
+
+        pointer = self.__resync(
+            ctx.buffer, ctx.pointer, offset, final, ctx.msg_lengths, ctx.sync_limit)
+        if pointer == ctx.pointer:
+            return False
+        ctx.pointer = pointer
+        return True
+
+    def __resync(self, buffer, pointer, offset, final, lengths, stop=None):
+        """
+        Skip corrupted data at pointer. Searches for next header of known type which
+        is followed by another header, or by end of buffer if it's final. If stop is
+        set a message starts there, search ends at it. Returns pointer to continue
+        from, records skipped range
+        """
+
+        data = buffer.obj if isinstance(buffer, memoryview) else buffer  # Searchable
+        size = len(data)
+        sync = bytes((self.MSG_HEAD1, self.MSG_HEAD2))
+        start = pointer
+        search_end = size if stop is None else stop
+        candidate = data.find(sync, pointer + 1, search_end)
+        while True:
+            if stop is not None and candidate < 0:
+                pointer = stop  # Nothing to sync to before next message
+                break
+            if candidate < 0 or size - candidate < self.MSG_HEADER_LEN:
+                # No header left, skip all but bytes which could start one
+                pointer = size if final else max(pointer, size - 2)
+                break
+            msg_length = lengths.get(data[candidate + 2])
+            if msg_length is not None:
+                end = candidate + msg_length
+                if stop is not None and end > stop:
+                    pass  # Would overlap message at stop
+                elif end + 2 <= size:
+                    if data[end] == self.MSG_HEAD1 and data[end + 1] == self.MSG_HEAD2:
+                        pointer = candidate  # Next header lines up
+                        break
+                elif final:
+                    if end == size:
+                        pointer = candidate  # Last message of file
+                        break
+                else:  # Wait for more data to check candidate
+                    pointer = candidate - 1
+                    break
+            candidate = data.find(sync, candidate + 1, search_end)
+        if pointer > start:
+            self.__addSkipped(offset + start, pointer - start)
+        return pointer
+
+    def __addSkipped(self, start, length):
+        """ Record skipped range, merge it with previous one if they touch """
+
+        if self.skipped and sum(self.skipped[-1]) == start:
+            self.skipped[-1] = (self.skipped[-1][0], self.skipped[-1][1] + length)
+        else:
+            self.skipped.append((start, length))
+
+    def __filterMsg(self, ctx, msg_name):
         """ Create message filter """
 
         show_fields = "*"
-        if self.__msg_filter_map:
-            show_fields = self.__msg_filter_map.get(msg_name)
+        if ctx.msg_filter_map:
+            show_fields = ctx.msg_filter_map.get(msg_name)
         return show_fields
 
-    def __initOutput(self):
-        """ Create output file, write column headers """
+    def __startOutput(self, ctx):
+        """ Initialize output on first data message. Debug output has no file, its decode plans get no columns """
 
-        if not self.__msg_filter:  # If filter is empty, enable all messages
-            for msg_name in self.__msg_names:
-                self.__msg_filter.append((msg_name, "*"))
+        if self.__debug_out:
+            self.__bindPlans(ctx)
+        else:
+            self.__initOutput(ctx)  # Initialize file
+        ctx.output_ready = True
 
-        # Fill __txt_columns and __txt_data in accrodig to the __msg_filter
-        for msg_name, show_fields in self.__msg_filter:
-            if show_fields == "*":
-                show_fields = self.__msg_labels.get(msg_name, [])
-            self.__msg_filter_map[msg_name] = show_fields
-            for field in show_fields:
-                full_label = msg_name + "_" + field
-                self.__txt_columns.append(full_label)
-                self.__txt_data[full_label] = None
+    def __initOutput(self, ctx):
+        """ Create output file, write column headers """
 
-        # Fill in __msg_ignore_id in accroding to the __msg_ignore
-        for col in self.__txt_columns:
-            if col in self.__msg_ignore:  # If message col is in __msg_ignore
-                self.__msg_id_ignore.add(self.__txt_columns.index(col))
-        self.__time_msg_id = self.__txt_columns.index(self.__time_msg)
-        self.__msg_id_ignore.add(self.__time_msg_id)
+        self.__initColumns(ctx)
+
+        if self.__interpolation:
+            methods = []
+            for i, column in enumerate(ctx.txt_columns):
+                if column in self.__interp_methods:
+                    methods.append(self.__interp_methods[column])
+                elif i in ctx.msg_id_ignore:  # Ignored columns aren't interpolated
+                    methods.append(PxResampler.PREVIOUS)
+                else:
+                    methods.append(self.__interp_method)
+            ctx.resampler = PxResampler(
+                ctx.time_msg_id, self.__interp_period, methods)
 
         headers = []
 
         if self.__namespace:
-            for column in self.__txt_columns:  # Check every column
+            for column in ctx.txt_columns:  # Check every column
                 if column in self.__namespace:  # If it has a custom name, use it
                     headers.append(self.__namespace[column])
                 else:
-                    # If there doest have a custom name, use default from __txt_columns
+                    # If there doest have a custom name, use default from txt_columns
                     headers.append(column)
         else:
             # If __namesapce is empty, use default columns headers
-            headers = self.__txt_columns
+            headers = ctx.txt_columns
 
-        if type(self.__file) is TextIOWrapper:  # Output headers
-            print(self.__delim_char.join(headers), file=self.__file)
-        elif type(self.__file) is Worksheet:
-            for h in headers:
-                self.__file.write(0, headers.index(h), h)
-        else:
-            print(self.__delim_char.join(headers))
-
-    def __processData(self):
-        """ Convert to correct type, apply interpolation if needed """
-
-        data = []
-        for full_label in self.__txt_columns:  # Fill data from __txt_columns
-            # Get single string from data dictionary
-            val = self.__txt_data[full_label]
-            if val == None:  # If string is empty
-                print("set null")
-                val = self.__null_char  # Put null char in
-            else:  # If there is some data
-                if type(val) is int:
-                    val = int(val)
-                elif type(val) is float:
-                    val = float(val)
+        if ctx.writer is None:  # If no output file is set, write to stdout
+            ctx.writer = PxTextWriter(None, self.__delim_char)
+        if self.__layout == self.LAYOUT_WIDE:
+            ctx.writer.write_header(headers)  # Output headers
+            return
+        ctx.layout = self.__layout
+        ctx.headers = headers
+        if self.__layout == self.LAYOUT_LONG:
+            ctx.writer.write_header(
+                [headers[ctx.time_msg_id], "message", "field", "value"])
+
+    def __initColumns(self, ctx):
+        """ Fill output columns of run from FMT messages seen so far """
+
+        if not ctx.msg_filter:  # If filter is empty, enable all messages
+            for msg_name in ctx.msg_names:
+                ctx.msg_filter.append((msg_name, "*"))
+
+        # Fill txt_columns in accrodig to the msg_filter
+        for msg_name, show_fields in ctx.msg_filter:
+            if show_fields == "*":
+                show_fields = ctx.msg_labels.get(msg_name, [])
+            ctx.msg_filter_map[msg_name] = show_fields
+            if msg_name not in ctx.msg_slots:  # Fields of message have adjacent slots
+                ctx.msg_slots[msg_name] = (len(ctx.txt_columns), len(ctx.txt_columns) + len(show_fields),
+                                           tuple(show_fields))
+            for field in show_fields:
+                full_label = msg_name + "_" + field
+                if full_label == self.__time_msg:
+                    ctx.time_msg_name = msg_name  # Rows are emitted on this message
+                ctx.txt_columns.append(full_label)
+
+        # Fill in msg_id_ignore in accroding to the __msg_ignore
+        for col in ctx.txt_columns:
+            if col in self.__msg_ignore:  # If message col is in __msg_ignore
+                ctx.msg_id_ignore.add(ctx.txt_columns.index(col))
+        ctx.time_msg_id = ctx.txt_columns.index(self.__time_msg)
+        ctx.msg_id_ignore.add(ctx.time_msg_id)
+
+        # Narrow rows are stamped with message's own time field, or with time column if it has none
+        time_label = self.__time_msg[len(ctx.time_msg_name) + 1:]
+        for msg_name, slots in ctx.msg_slots.items():
+            start, end, labels = slots[:3]
+            time_slot = start + labels.index(time_label) if time_label in labels else ctx.time_msg_id
+            ctx.msg_slots[msg_name] = (start, end, labels, time_slot)
+        self.__bindPlans(ctx)
+
+    def __bindPlans(self, ctx):
+        """
+        Allocate a value slot per column and point decode plans of run at slots of
+        their fields. Unset slots hold null char, or None where rows are resampled
+        or merged later
+        """
+
+        ctx.txt_slots = {full_label: slot for slot, full_label in enumerate(ctx.txt_columns)}
+        fill = None if self.__interpolation or ctx.raw_rows is not None else self.__null_char
+        ctx.values = [fill] * len(ctx.txt_columns) + [None]
+        for msg_type, msg_plan in ctx.msg_plans.items():
+            ctx.msg_plans[msg_type] = self.__bindPlan(ctx, msg_plan)
+
+    def __bindPlan(self, ctx, msg_plan):
+        """
+        Get decode plan with a decoder writing to value slots of run in place of
+        its fields, unchanged until slots are allocated
+        """
+
+        msg_length, msg_name, msg_struct, msg_fields = msg_plan
+        if not ctx.values or msg_struct is None:
+            return msg_plan
+        scratch = len(ctx.values) - 1  # Fields of messages seen after columns were set up
+        kinds = self.__fieldKinds(msg_struct, msg_fields)
+        args = []
+        for kind, (mult, full_label) in zip(kinds, msg_fields):
+            args.append(ctx.txt_slots.get(full_label, scratch))
+            if kind == "m":
+                args.append(mult)
+        decoder = self.__decoderFactory(kinds)(msg_struct.unpack_from, *args)
+        return (msg_length, msg_name, msg_struct, decoder)
+
+    def __fieldKinds(self, msg_struct, msg_fields):
+        """ Get kind of every unpacked field: "m" is scaled by multiplier, "s" is a C string, "v" is taken as is """
+
+        codes = []
+        count = ""
+        for c in msg_struct.format[1:]:  # Byte order first
+            if c.isdigit():
+                count += c
+                continue
+            if c == "s":
+                codes.append(c)
+            elif c != "x":
+                codes.extend(c * int(count or 1))
+            count = ""
+        return tuple("m" if mult else "s" if code in "sc" else "v"
+                     for code, (mult, full_label) in zip(codes, msg_fields))
+
+    def __decoderFactory(self, kinds):
+        """
+        Get factory of decoders for messages with fields of kinds. Decoders are
+        generated: one unpack, then a store per field with scaling and string
+        trimming inlined. Factory takes unpack_from, then slot of every field and
+        multiplier of every scaled one
+        """
+
+        factory = self.__decoder_factories.get(kinds)
+        if factory is None:
+            args = []
+            stores = []
+            for i, kind in enumerate(kinds):
+                args.append("s%i" % i)
+                if kind == "m":
+                    args.append("m%i" % i)
+                    value = "v%i * m%i" % (i, i)
+                elif kind == "s":
+                    value = "str(v%i, 'ascii', 'replace').split('\\0')[0]" % i
                 else:
-                    val = str(val)
-            data.append(val)
+                    value = "v%i" % i
+                stores.append("        values[s%i] = %s\n" % (i, value))
+            source = ("def factory(unpack_from, %s):\n"
+                      "    def decode(buffer, pointer, values):\n"
+                      "        %s, = unpack_from(buffer, pointer)\n"
+                      "%s"
+                      "    return decode\n") % (", ".join(args),
+                                             ", ".join("v%i" % i for i in range(len(kinds))), "".join(stores))
+            namespace = dict()
+            exec(source, namespace)
+            factory = self.__decoder_factories.put(kinds, namespace["factory"])
+        return factory
 
-        if self.__interpolation:
-            if not self.__next_data:
-                self.__next_data = data[:]
-            else:  # If __next_data contains something
-                curr_data = self.__next_data[:]
-                prev_data = curr_data[:]
-                self.__next_data = data[:]  # Update __next_data
-                if self.__prev_data:
-                    time_diff = (
-                        (curr_data[self.__time_msg_id] - self.__prev_data[self.__time_msg_id]) // 1000)
-                    # Calculate a multiplier based on time difference for curr_data to reach a round digit time
-                    to_round_time = (100 - (time_diff % 100)) * 0.0001
-                    extra_msg_count = time_diff // 100
-                    for count in range(extra_msg_count):
-                        # If it's first extra message and time is not a round number
-                        if count == 0 and round(to_round_time, 2) > 0:
-                            # Multiply every string in list by to_round_time multiplier
-                            for i in range(len(curr_data)):
-                                try:
-                                    if type(curr_data[i]) is str or i in self.__msg_id_ignore or curr_data[i] == self.__prev_data[i]:
-                                        continue
-                                    elif self.__next_data[i] > curr_data[i]:
-                                        curr_data[i] += curr_data[i] * \
-                                            to_round_time
-                                    else:
-                                        curr_data[i] -= curr_data[i] * \
-                                            to_round_time
-                                except TypeError:
-                                    print(
-                                        curr_data[i], self.__next_data[i] if self.__next_data[i] else 'null')
-                            curr_data[self.__time_msg_id] = self.msg_count * 100
-                            self.__printData(curr_data)
-                        tmp = curr_data[:]  # Create a temporary data list
-                        for id in range(len(curr_data)):  # Interpolate data
-                            if type(tmp[id]) is str or id in self.__msg_id_ignore or self.__next_data[id] == curr_data[id]:
-                                continue
-                            elif self.__next_data[id] > curr_data[id]:
-                                tmp[id] = curr_data[id] + (
-                                    ((self.__next_data[id] - curr_data[id]) / extra_msg_count) * count)
-                            else:
-                                tmp[id] = curr_data[id] - (
-                                    ((curr_data[id] - self.__next_data[id]) / extra_msg_count) * count)
-                        tmp[self.__time_msg_id] = self.msg_count * 100
-                        self.__printData(tmp)  # Print data
-                else:  # If __prev_data empty
-                    # Calculate current time by multiplying amount of messages by clock time (100 ms)
-                    curr_data[self.__time_msg_id] = 0
-                    self.__printData(curr_data)  # Print data
-                self.__prev_data = prev_data[:]
+    def __processData(self, ctx):
+        """ Take row of current column values """
+
+        if ctx.window is not None and not self.__inWindow(ctx):
+            return
+        if ctx.stats is not None:
+            previous = ctx.stats.switch(PxStats.ASSEMBLE)
+        row = ctx.values[:-1]  # Snapshot without scratch slot
+        if ctx.raw_rows is not None:  # Parallel worker, rows are merged later
+            ctx.raw_rows.append(row)
         else:
-            self.__printData(data)
+            self.__emitRow(ctx, row)
+        if ctx.stats is not None:
+            ctx.stats.switch(previous)
 
-    def __parseMsgDescr(self):
-        """ Unpack message description, save to globals """
-        
-        data = struct.unpack(
-            self.MSG_FORMAT_STRUCT, self.__buffer[self.__pointer + 3: self.__pointer + self.MSG_FORMAT_PACKET_LEN])
-        msg_type = data[0]
+    def __inWindow(self, ctx):
+        """ Check if row at current time message is inside time window, end run past its end """
+
+        time_value = ctx.values[ctx.time_msg_id]
+        start, end = ctx.window
+        if end is not None and time_value > end:
+            raise PxWindowEnd()
+        return start is None or time_value >= start
+
+    def __emitRow(self, ctx, row):
+        """ Output row, apply interpolation if needed """
+
+        if ctx.resampler is not None:  # Resample raw values to constant clock
+            if ctx.stats is not None:
+                previous = ctx.stats.switch(PxStats.INTERPOLATE)
+            rows = ctx.resampler.add_row(row)
+            if ctx.stats is not None:
+                ctx.stats.switch(previous)
+            for resampled in rows:
+                self.__printResampled(ctx, resampled)
+            return
+        self.__printData(ctx, row)  # Unset values are null char already
+
+    def __emitNarrow(self, ctx, msg_name):
+        """ Output message as row of its table, or as a row per field in long layout """
+
+        if not ctx.clock_started:
+            if msg_name != ctx.time_msg_name:
+                return  # Time column isn't set yet
+            ctx.clock_started = True
+        slots = ctx.msg_slots.get(msg_name)
+        if slots is None:
+            return  # Message has no columns
+        start, end, labels, time_slot = slots
+        values = ctx.values
+        time_value = values[time_slot]
+        if ctx.window is not None:  # Rows are checked by their own time, run ends on time message past the end
+            window_start, window_end = ctx.window
+            if window_end is not None and msg_name == ctx.time_msg_name and values[ctx.time_msg_id] > window_end:
+                raise PxWindowEnd()
+            if ((window_start is not None and time_value < window_start)
+                    or (window_end is not None and time_value > window_end)):
+                return
+        if ctx.stats is not None:
+            previous = ctx.stats.switch(PxStats.ASSEMBLE)
+        if ctx.layout == self.LAYOUT_LONG:
+            for label, val in zip(labels, values[start:end]):
+                self.__printData(ctx, [time_value, msg_name, label, val])
+        else:
+            stamped = start <= time_slot < end  # Time field is among its own columns
+            table = ctx.tables.get(msg_name)
+            if table is None:  # First message of type, start its table
+                table = self.__openTable(ctx, msg_name)
+            rows = table[1]
+            if stamped:
+                rows.append(values[start:end])
+            else:
+                rows.append([time_value] + values[start:end])
+            if len(rows) >= self.WRITE_BATCH_SIZE:
+                self.__flushTable(ctx, table)
+            self.msg_count += 1
+        if ctx.stats is not None:
+            ctx.stats.switch(previous)
+
+    def __openTable(self, ctx, msg_name):
+        """ Open table of message type with its own columns, prefixed by time column if it has no time field """
+
+        start, end, labels, time_slot = ctx.msg_slots[msg_name]
+        headers = ctx.headers[start:end]
+        if not start <= time_slot < end:
+            headers = [ctx.headers[ctx.time_msg_id]] + headers
+        table = ctx.tables[msg_name] = [ctx.writer.open_table(msg_name, headers), []]
+        return table
+
+    def __printResampled(self, ctx, row):
+        """ Put null char in place of missing values, write row """
+
+        self.__printData(ctx,
+                         [self.__null_char if val is None else val for val in row])
+
+    def __parseMsgDescr(self, ctx):
+        """ Unpack message description, save to run context """
+
+        start = ctx.pointer + self.MSG_HEADER_LEN
+        fmt_key = bytes(ctx.buffer[start:start + self.MSG_FORMAT_PACKET_LEN - self.MSG_HEADER_LEN])
+        msg_type = fmt_key[0]
         if msg_type != self.MSG_TYPE_FORMAT:
-            msg_length = data[1]
-            msg_name = self.__to_utf8(data[2])
-            msg_format = self.__to_utf8(data[3])
-            msg_labels = self.__to_utf8(data[4]).split(",")
-            msg_struct = ""
-            msg_mults = []
-            for c in msg_format:
-                try:
-                    f = self.FORMAT_TO_STRUCT[c]
-                    msg_struct += f[0]
-                    msg_mults.append(f[1])
-                except KeyError as e:
-                    raise Exception("Unsupported format char: %s in message %s (%i)" % (
-                        c, msg_name, msg_type))
-            msg_struct = "<" + msg_struct   # force little-endian
-            self.__msg_descrs[msg_type] = (
-                msg_length, msg_name, msg_format, msg_labels, msg_struct, msg_mults)
-            self.__msg_labels[msg_name] = msg_labels
-            self.__msg_names.append(msg_name)
+            msg_descr = self.__descr_cache.get(fmt_key)
+            if msg_descr is None:  # First time this FMT message is seen
+                msg_descr = self.__describeMsg(fmt_key)
+                self.__descr_cache.put(fmt_key, msg_descr)
+            msg_length, msg_name, msg_format, msg_labels, msg_struct, msg_mults = msg_descr
+            ctx.msg_descrs[msg_type] = msg_descr
+            ctx.msg_lengths[msg_type] = msg_length
+            ctx.msg_labels[msg_name] = msg_labels
+            ctx.msg_names.append(msg_name)
+            self.__compilePlan(ctx, fmt_key, msg_descr)
             if self.__debug_out:
-                if self.__filterMsg(msg_name) != None:
+                if self.__filterMsg(ctx, msg_name) != None:
                     print("MSG FORMAT: type = %i, length = %i, name = %s, format = %s, labels = %s, struct = %s, mults = %s" % (
                         msg_type, msg_length, msg_name, msg_format, str(msg_labels), msg_struct, msg_mults))
-        self.__pointer += self.MSG_FORMAT_PACKET_LEN
-
-    def __parseMsg(self, msg_descr):
-        """ Get raw data from message """
-
-        msg_length, msg_name, msg_format, msg_labels, msg_struct, msg_mults = msg_descr
-        show_fields = self.__filterMsg(msg_name)  # Create filter
-
-        if show_fields:   # Parse data from file to list
-            data = list(struct.unpack(
-                msg_struct, self.__buffer[self.__pointer+self.MSG_HEADER_LEN:self.__pointer+msg_length]))
-
-            for i in range(len(data)):
-                if type(data[i]) is str:
-                    data[i] = self.__to_utf8(data[i])
-                if msg_mults[i]:
-                    data[i] *= msg_mults[i]  # apply multuplyer if needed
-                label = msg_labels[i]
-                if label in show_fields:  # If label is in filter
-                    # Add parsed raw data to __txt_data
-                    self.__txt_data[msg_name + "_" + label] = data[i]
-                    if self.__time_msg != None and msg_name != self.__time_msg:
-                        self.__txt_updated = True
-            if self.__time_msg == None:
-                self.__processData()
-
-        self.__pointer += msg_length
-
-    def __printData(self, data):
-        """ Write data to file/stdout """
-
-        data = list(map(lambda val: val.lstrip("b'").rstrip(
-            "'").rstrip("\\x00") if type(data) is str and "\\x00" in data else val, data))  # Clear null termination if needed
-
-        if type(self.__file) is TextIOWrapper:  # Convert to str, join with delim and write to file
-            print(self.__delim_char.join(list(map(str, data))), file=self.__file)
-
-        elif type(self.__file) is Worksheet:
-            for d in data:
-                self.__file.write(self.msg_count + 1, data.index(d), d)
-        else:  # If no output file is set, write to stdout
-            print(self.__delim_char.join(data))
+        ctx.pointer += self.MSG_FORMAT_PACKET_LEN
+
+    def __describeMsg(self, fmt_key):
+        """ Build message description from FMT message body """
+
+        data = struct.unpack_from(self.MSG_FORMAT_STRUCT, fmt_key)
+        msg_type = data[0]
+        msg_length = data[1]
+        msg_name = self.__to_utf8(data[2])
+        msg_format = self.__to_utf8(data[3])
+        msg_labels = self.__to_utf8(data[4]).split(",")
+        msg_struct = ""
+        msg_mults = []
+        for c in msg_format:
+            try:
+                f = self.FORMAT_TO_STRUCT[c]
+                msg_struct += f[0]
+                msg_mults.append(f[1])
+            except KeyError as e:
+                raise Exception("Unsupported format char: %s in message %s (%i)" % (
+                    c, msg_name, msg_type))
+        msg_struct = "<" + msg_struct   # force little-endian
+        return (msg_length, msg_name, msg_format, msg_labels, msg_struct, msg_mults)
+
+    def __compilePlan(self, ctx, fmt_key, msg_descr):
+        """ Build decode plan for projected fields of message type, if it's wanted """
+
+        msg_type = fmt_key[0]
+        msg_length, msg_name, msg_format, msg_labels = msg_descr[:4]
+        show_fields = self.__filterMsg(ctx, msg_name)
+        if not show_fields:  # Message type isn't wanted
+            self.__skipPlan(ctx, msg_type, msg_length, msg_name)
+            return
+        plan_key = (fmt_key, show_fields if show_fields ==
+                    "*" else tuple(show_fields))
+        msg_plan = self.__plan_cache.get(plan_key)
+        if msg_plan is None:
+            plan_struct, plan_mults, plan_labels = self.__projectStruct(
+                msg_format, msg_labels, show_fields)
+            plan_keys = [msg_name + "_" + label for label in plan_labels]
+            msg_plan = (msg_length, msg_name, struct.Struct(
+                plan_struct), tuple(zip(plan_mults, plan_keys))) if plan_labels else False
+            self.__plan_cache.put(plan_key, msg_plan)
+        if msg_plan:
+            ctx.msg_plans[msg_type] = self.__bindPlan(ctx, msg_plan)
+        else:  # None of wanted fields is in message
+            self.__skipPlan(ctx, msg_type, msg_length, msg_name)
+
+    def __skipPlan(self, ctx, msg_type, msg_length, msg_name):
+        """ Drop plan of unwanted message type. If stats are collected, use a plan without struct to count it """
+
+        if ctx.stats is None:
+            ctx.msg_plans.pop(msg_type, None)
+        else:
+            ctx.msg_plans[msg_type] = (msg_length, msg_name, None, ())
+
+    def __projectStruct(self, msg_format, msg_labels, show_fields):
+        """ Get struct string, multipliers and labels of projected fields """
+
+        plan_struct = "<"
+        plan_mults = []
+        plan_labels = []
+        for c, label in zip(msg_format, msg_labels):
+            f = self.FORMAT_TO_STRUCT[c]
+            if show_fields == "*" or label in show_fields:
+                plan_struct += f[0]
+                plan_mults.append(f[1])
+                plan_labels.append(label)
+            else:  # Skip unused field with pad bytes
+                plan_struct += "%ix" % struct.calcsize("<" + f[0])
+        return plan_struct, plan_mults, plan_labels
+
+    def __profileMsg(self, ctx, msg_plan):
+        """ Parse message, account its decode time and size to its type """
+
+        stats = ctx.stats
+        msg_type = ctx.buffer[ctx.pointer + 2]
+        if ctx.ulog_formats is not None:  # ULog data message, count by msg id
+            msg_type = ctx.buffer[ctx.pointer + 3] | ctx.buffer[ctx.pointer + 4] << 8
+        stats.switch(msg_type)
+        stats.add_message(msg_type, msg_plan[1], msg_plan[0])
+        if msg_plan[2] is None:  # Unwanted, skip payload by length
+            ctx.pointer += msg_plan[0]
+        else:
+            self.__parseMsg(ctx, msg_plan)
+        stats.switch(PxStats.DECODE)
+
+    def __parseMsg(self, ctx, msg_plan):
+        """ Get projected data from message """
+
+        msg_length, msg_name, msg_struct, decoder = msg_plan
+        decoder(ctx.buffer, ctx.pointer + self.MSG_HEADER_LEN, ctx.values)  # Put parsed data in its column slots
+        if ctx.layout is not None:
+            self.__emitNarrow(ctx, msg_name)  # Every message is output
+        elif self.__time_msg == None:
+            self.__processData(ctx)
+        elif msg_name == ctx.time_msg_name and not self.__debug_out:
+            self.__processData(ctx)  # Emit a row on every time message
+
+        ctx.pointer += msg_length
+
+    def __printData(self, ctx, data):
+        """ Add row to batch, pass batch to writer when it's full """
+
+        ctx.rows.append(data)
+        if len(ctx.rows) >= self.WRITE_BATCH_SIZE:
+            self.__flushRows(ctx)
         self.msg_count += 1
+
+    def __flushRows(self, ctx):
+        """ Write batched rows """
+
+        if ctx.rows:
+            if ctx.stats is not None:
+                previous = ctx.stats.switch(PxStats.WRITE)
+            ctx.writer.write_rows(ctx.rows)
+            ctx.rows = []
+            if ctx.stats is not None:
+                ctx.stats.switch(previous)
+        for table in ctx.tables.values():
+            self.__flushTable(ctx, table)
+
+    def __flushTable(self, ctx, table):
+        """ Write batched rows of table """
+
+        writer, rows = table
+        if rows:
+            if ctx.stats is not None:
+                previous = ctx.stats.switch(PxStats.WRITE)
+            writer.write_rows(rows)
+            table[1] = []
+            if ctx.stats is not None:
+                ctx.stats.switch(previous)
@@ -0,0 +1,91 @@
+import numpy as np
+
+
+class PxResampler:
+    """
+    Resamples rows of event driven data onto a constant time grid.
+    Rows are buffered and resampled BATCH_SIZE at a time, whole columns at once
+    """
+
+    LINEAR = "linear"  # Linear interpolation between neighbour rows
+    PREVIOUS = "previous"  # Last value at or before grid point
+    BATCH_SIZE = 4096
+
+    def __init__(self, time_id, period, methods, time_scale=1000):
+        """
+        time_id - index of time column, period - grid period in ms,
+        methods - fill method of every column, time_scale - time units per ms
+        """
+
+        self.__time_id = time_id
+        self.__period = period
+        self.__step = period * time_scale  # Grid period in time units
+        self.__methods = methods
+        self.__rows = []
+        self.__start = None  # Time of the first row
+        self.__count = 0  # Grid points emitted so far
+
+    def add_row(self, row):
+        """ Add row of raw values, return resampled rows which are ready """
+
+        if row[self.__time_id] is None:
+            return []
+        self.__rows.append(row)
+        if len(self.__rows) < self.BATCH_SIZE:
+            return []
+        return self.__resample(final=False)
+
+    def flush(self):
+        """ Resample all buffered rows, return them """
+
+        if not self.__rows:
+            return []
+        return self.__resample(final=True)
+
+    def __resample(self, final):
+        """ Resample buffered rows up to the last one, keep it for the next batch """
+
+        rows = self.__rows
+        times = np.array([row[self.__time_id] for row in rows], dtype=np.float64)
+        if self.__start is None:
+            self.__start = times[0]
+        end = times[-1]
+        # Grid points left to emit which lie inside buffered time range
+        last = int((end - self.__start) // self.__step)
+        if not final and self.__start + last * self.__step >= end:
+            last -= 1  # Point at the very end is emitted with the next batch
+        counts = np.arange(self.__count, last + 1)
+        grid = self.__start + counts * self.__step
+        self.__rows = rows[-1:]
+        if not len(grid):
+            return []
+
+        columns = list(zip(*rows))
+        out = []
+        for i, (column, method) in enumerate(zip(columns, self.__methods)):
+            if i == self.__time_id:
+                out.append((counts * self.__period).tolist())
+            else:
+                out.append(self.__fill(times, column, grid, method))
+        self.__count = last + 1
+        return [list(row) for row in zip(*out)]
+
+    def __fill(self, times, column, grid, method):
+        """ Get column values at grid points """
+
+        if method == self.LINEAR:
+            try:
+                values = np.array(column, dtype=np.float64)  # None -> NaN
+            except (TypeError, ValueError):  # Not numeric, fall back
+                values = None
+            if values is not None:
+                valid = ~np.isnan(values)
+                if not valid.any():
+                    return [None] * len(grid)
+                out = np.interp(grid, times[valid], values[valid]).astype(object)
+                out[grid < times[valid][0]] = None  # No value yet
+                return out.tolist()
+        ids = np.searchsorted(times, grid, side='right') - 1
+        values = np.empty(len(column), dtype=object)
+        values[:] = column
+        return values[ids].tolist()
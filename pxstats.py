@@ -0,0 +1,124 @@
+import time
+
+
+class PxStats:
+    """
+    Profile of one PxParser run. Time is accounted to one key at a time: a
+    pipeline stage or a message type being decoded. switch() moves the clock to
+    another key, so nested stages don't count twice. In parallel runs, times of
+    workers are added up, so stages can take longer than the run
+    """
+
+    READ = "read"  # File reading, mapping
+    DECODE = "decode"  # Message framing and unpacking, includes all message types
+    ASSEMBLE = "assemble"  # Building and converting rows
+    INTERPOLATE = "interpolate"  # Resampling rows
+    WRITE = "write"  # Writer backend
+    WAIT = "wait"  # Waiting for parallel workers, their stages are counted by them
+    STAGES = (READ, DECODE, ASSEMBLE, INTERPOLATE, WRITE)
+
+    def __init__(self):
+        self.file_size = 0
+        self.peak_buffer = 0  # Largest input buffer held at once, bytes
+        self.total_time = 0.0
+        self.__times = dict()  # Stage name or message type -> seconds
+        self.__msgs = dict()  # Message type -> [name, count, bytes]
+        self.__key = None
+        self.__since = 0.0
+
+    def start(self, key):
+        """ Start clock, account time to key """
+
+        self.__key = key
+        self.__since = time.perf_counter()
+
+    def switch(self, key):
+        """ Account time from now on to key, return key it was accounted to before """
+
+        now = time.perf_counter()
+        previous = self.__key
+        self.__times[previous] = self.__times.get(
+            previous, 0.0) + now - self.__since
+        self.__key = key
+        self.__since = now
+        return previous
+
+    def stop(self):
+        """ Stop clock """
+
+        if self.__key is not None:
+            self.switch(None)
+        self.__times.pop(None, None)
+
+    def add_message(self, msg_type, msg_name, msg_length):
+        """ Count message of type """
+
+        msg = self.__msgs.get(msg_type)
+        if msg is None:
+            msg = self.__msgs[msg_type] = [msg_name, 0, 0]
+        msg[1] += 1
+        msg[2] += msg_length
+
+    def add_buffer(self, size):
+        """ Record size of input buffer """
+
+        if size > self.peak_buffer:
+            self.peak_buffer = size
+
+    def merge(self, other):
+        """ Add counts and times of other run, e.g. of a parallel worker """
+
+        for key, seconds in other.__times.items():
+            self.__times[key] = self.__times.get(key, 0.0) + seconds
+        for msg_type, (msg_name, count, size) in other.__msgs.items():
+            msg = self.__msgs.get(msg_type)
+            if msg is None:
+                msg = self.__msgs[msg_type] = [msg_name, 0, 0]
+            msg[1] += count
+            msg[2] += size
+        self.add_buffer(other.peak_buffer)
+
+    def stages(self):
+        """ Get seconds spent in every stage """
+
+        stages = dict()
+        for stage in self.STAGES:
+            stages[stage] = self.__times.get(stage, 0.0)
+        stages[self.DECODE] += sum(self.__times.get(msg_type, 0.0)
+                                   for msg_type in self.__msgs)
+        if self.WAIT in self.__times:
+            stages[self.WAIT] = self.__times[self.WAIT]
+        return stages
+
+    def messages(self):
+        """ Get (type, name, count, bytes, decode seconds) of every message type, slowest first """
+
+        msgs = [(msg_type, msg_name, count, size, self.__times.get(msg_type, 0.0))
+                for msg_type, (msg_name, count, size) in self.__msgs.items()]
+        return sorted(msgs, key=lambda msg: (-msg[4], msg[0]))
+
+    def as_dict(self):
+        """ Get stats as JSON-friendly dict """
+
+        return {'file_size': self.file_size, 'peak_buffer': self.peak_buffer,
+                'total_time': self.total_time, 'stages': self.stages(),
+                'messages': [{'type': msg_type, 'name': msg_name, 'count': count, 'bytes': size,
+                              'decode_time': seconds}
+                             for msg_type, msg_name, count, size, seconds in self.messages()]}
+
+    def format(self):
+        """ Get stats as text table """
+
+        messages = self.messages()
+        width = max([12] + [len(msg[1]) for msg in messages])  # ULog topic names are long
+        lines = ["%.1f MB in %.3f s, peak buffer %.1f MB" % (
+            self.file_size / 1e6, self.total_time, self.peak_buffer / 1e6)]
+        for stage, seconds in self.stages().items():
+            lines.append("  %-*s %9.3f s %5.1f %%" % (
+                width, stage, seconds, seconds / self.total_time * 100 if self.total_time else 0))
+        lines.append("  %-*s %9s %12s %9s" %
+                     (width, "message", "count", "bytes", "decode s"))
+        for msg_type, msg_name, count, size, seconds in messages:
+            lines.append("  %-*s %9i %12i %9.3f" %
+                         (width, msg_name, count, size, seconds))
+        return "\n".join(lines)
@@ -0,0 +1,155 @@
+import math
+import operator
+import random
+
+
+class PxFieldSummary:
+    """
+    Streaming statistics of one field. Count, min, max, mean and variance are
+    exact, folded in batch by batch (Chan's parallel variance). Quantiles come
+    from a compacting sketch: every level holds up to SKETCH_SIZE values, a full
+    level is sorted and every other value moves up a level with twice the
+    weight. Memory grows with log of count, rank error stays around a percent
+    """
+
+    SKETCH_SIZE = 1024  # Values per sketch level
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.nan_count = 0  # NaN values, left out of everything else
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.__m2 = 0.0  # Sum of squared differences from mean
+        self.__levels = [[]]  # Values of level i weigh 2 ** i
+        self.__random = random.Random(0)  # Reproducible compaction
+
+    def update(self, values):
+        """ Add sequence of numeric values """
+
+        count = len(values)
+        if not count:
+            return
+        total = sum(values)
+        if total != total:  # NaN inside, filter only then
+            values = [value for value in values if value == value]
+            self.nan_count += count - len(values)
+            count = len(values)
+            if not count:
+                return
+            total = sum(values)
+        batch_mean = total / count
+        deviations = [value - batch_mean for value in values]
+        batch_m2 = sum(map(operator.mul, deviations, deviations))
+        combined = self.count + count
+        delta = batch_mean - self.mean
+        self.mean += delta * count / combined
+        self.__m2 += batch_m2 + delta * delta * self.count * count / combined
+        self.count = combined
+        batch_min = min(values)
+        batch_max = max(values)
+        if self.min is None or batch_min < self.min:
+            self.min = batch_min
+        if self.max is None or batch_max > self.max:
+            self.max = batch_max
+        self.__levels[0].extend(values)
+        self.__compact()
+
+    @property
+    def variance(self):
+        """ Sample variance, None for less than two values """
+
+        return self.__m2 / (self.count - 1) if self.count > 1 else None
+
+    @property
+    def std(self):
+        """ Sample standard deviation, None for less than two values """
+
+        variance = self.variance
+        return math.sqrt(variance) if variance is not None else None
+
+    def quantile(self, q):
+        """ Get approximate q-quantile, 0 <= q <= 1, None if there are no values """
+
+        return self.quantiles([q])[0]
+
+    def quantiles(self, qs):
+        """ Get approximate quantiles of list qs at once """
+
+        weighted = sorted((value, 1 << level) for level, values in enumerate(self.__levels)
+                          for value in values)
+        if not weighted:
+            return [None] * len(qs)
+        total = sum(weight for value, weight in weighted)
+        results = []
+        for q in qs:
+            rank = q * total
+            seen = 0
+            for value, weight in weighted:
+                seen += weight
+                if seen >= rank:
+                    break
+            results.append(value)
+        return results
+
+    def __compact(self):
+        """ Halve full levels into the level above """
+
+        levels = self.__levels
+        level = 0
+        while level < len(levels) and len(levels[level]) >= self.SKETCH_SIZE:
+            values = sorted(levels[level])
+            if len(values) % 2:  # Odd value stays, weights must add up
+                levels[level] = [values.pop(self.__random.randrange(len(values)))]
+            else:
+                levels[level] = []
+            if level + 1 == len(levels):
+                levels.append([])
+            levels[level + 1].extend(
+                values[self.__random.randrange(2)::2])
+            level += 1
+
+
+class PxSummary:
+    """ Field statistics of one log, see PxParser.summarize. fields maps full labels to PxFieldSummary """
+
+    QUANTILES = (0.05, 0.5, 0.95)  # Reported by format() and as_dict()
+
+    def __init__(self, quantiles=None):
+        self.quantiles = tuple(quantiles) if quantiles else self.QUANTILES
+        self.fields = dict()  # In order of first appearance
+        self.msg_count = 0
+
+    def field(self, label):
+        """ Get summary of field, create it if it's new """
+
+        summary = self.fields.get(label)
+        if summary is None:
+            summary = self.fields[label] = PxFieldSummary(label)
+        return summary
+
+    def as_dict(self):
+        """ Get statistics as JSON-friendly dict """
+
+        fields = dict()
+        for label, summary in self.fields.items():
+            fields[label] = {'count': summary.count, 'nan_count': summary.nan_count,
+                             'min': summary.min, 'max': summary.max,
+                             'mean': summary.mean if summary.count else None,
+                             'variance': summary.variance,
+                             'quantiles': dict(zip(self.quantiles, summary.quantiles(self.quantiles)))}
+        return {'messages': self.msg_count, 'fields': fields}
+
+    def format(self):
+        """ Get statistics as text table """
+
+        lines = ["%i messages" % self.msg_count,
+                 "  %-20s %9s %12s %12s %12s %12s" % ("field", "count", "min", "max", "mean", "std") +
+                 "".join(" %12s" % ("p%g" % (q * 100)) for q in self.quantiles)]
+        for label, summary in self.fields.items():
+            values = [summary.min, summary.max, summary.mean if summary.count else None,
+                      summary.std] + summary.quantiles(self.quantiles)
+            lines.append("  %-20s %9i" % (label, summary.count) +
+                         "".join(" %12s" % ("-" if value is None else "%.6g" % value) for value in values))
+        return "\n".join(lines)
@@ -0,0 +1,200 @@
+import io
+import os
+import re
+import sys
+import xlsxwriter
+from pxcompress import PxCompressWriter
+
+
+class PxWriter:
+    """
+    Output backend. PxParser writes column headers once, then batches of rows.
+    Table layouts write into separate tables opened by open_table()
+    """
+
+    def write_header(self, headers):
+        """ Write column headers """
+
+        raise NotImplementedError
+
+    def write_rows(self, rows):
+        """ Write batch of rows """
+
+        raise NotImplementedError
+
+    def open_table(self, name, headers):
+        """ Start a separate table with column headers, return PxWriter of its rows. Closed with this writer """
+
+        raise Exception("%s writes a single table" % self.__class__.__name__)
+
+    def flush(self):
+        """ Push rows written so far to their destination, e.g. between updates of a followed log """
+
+        pass
+
+    def close(self):
+        """ Flush and close output """
+
+        pass
+
+
+class PxCallbackWriter(PxWriter):
+    """
+    Passes batches of rows to callback(rows) instead of writing them, e.g. to a live view
+    """
+
+    def __init__(self, callback):
+        self.headers = None  # Column headers, set before the first batch
+        self.__callback = callback
+
+    def write_header(self, headers):
+        self.headers = list(headers)
+
+    def write_rows(self, rows):
+        self.__callback(rows)
+
+
+class PxTextWriter(PxWriter):
+    """
+    Delimited text (txt/csv) writer. Every batch of rows is written with a single
+    write(). Compressed output is compressed on a background thread. Tables go to
+    files named after the output file, e.g. log_GPS.csv next to log.csv. File is
+    created on first write, so table layouts don't leave an empty one
+    """
+
+    def __init__(self, file_name=None, delim_char='\t', float_format=None, compression=None):
+        """
+        Write to stdout if file_name isn't set. float_format is %-style, e.g. "%.6f".
+        compression is "gzip" or "xz", file_name should have its suffix then
+        """
+
+        self.__file_name = file_name
+        self.__compression = compression
+        self.__file = None
+        self.__delim_char = delim_char
+        self.__float_format = float_format
+        self.__tables = list()
+
+    def __open(self):
+        """ Create output file """
+
+        if self.__compression is not None and self.__file_name:
+            self.__file = io.TextIOWrapper(
+                PxCompressWriter(open(self.__file_name, "wb"), self.__compression))
+        else:
+            self.__file = open(self.__file_name, "w") if self.__file_name else sys.stdout
+
+    def write_header(self, headers):
+        if self.__file is None:
+            self.__open()
+        self.__file.write(self.__delim_char.join(headers) + "\n")
+
+    def write_rows(self, rows):
+        if self.__file is None:
+            self.__open()
+        delim = self.__delim_char
+        fmt = self.__float_format
+        if fmt is None:
+            lines = [delim.join(map(str, row)) for row in rows]
+        else:
+            lines = [delim.join([fmt % val if type(val) is float else str(val) for val in row])
+                     for row in rows]
+        lines.append("")  # Trailing newline
+        self.__file.write("\n".join(lines))
+
+    def open_table(self, name, headers):
+        if not self.__file_name:
+            raise Exception("Tables need an output file")
+        directory, base = os.path.split(self.__file_name)
+        suffix = PxCompressWriter.SUFFIXES.get(self.__compression, "")  # Table name goes before type and compression extensions
+        if not suffix or not base.endswith(suffix):
+            suffix = ""
+        stem, extension = os.path.splitext(base[:len(base) - len(suffix)])
+        table = PxTextWriter(os.path.join(directory, "%s_%s%s%s" % (stem, name, extension, suffix)),
+                             self.__delim_char, self.__float_format, self.__compression)
+        table.write_header(headers)
+        self.__tables.append(table)
+        return table
+
+    def flush(self):
+        for table in self.__tables:
+            table.flush()
+        if self.__file is not None:
+            self.__file.flush()
+
+    def close(self):
+        for table in self.__tables:
+            table.close()
+        if self.__file is sys.stdout:
+            self.__file.flush()
+        elif self.__file is not None:
+            self.__file.close()
+
+
+class PxXlsxWriter(PxWriter):
+    """
+    Excel workbook writer. Works in constant memory mode, rows are flushed to disk
+    as they're written. Continues on a new worksheet when a sheet is full. Tables
+    get sheets of their own in the same workbook
+    """
+
+    MAX_ROWS = 1048576  # Excel's worksheet row limit
+    MAX_SHEET_NAME = 31  # Excel's worksheet name limit
+    SHEET_NAME_INVALID = re.compile(r"[\[\]:*?/\\]")
+
+    def __init__(self, file_name=None, sheet_name=None, workbook=None):
+        """ Tables pass workbook of their writer. Sheets are added on first write """
+
+        self.__owner = workbook is None
+        self.__workbook = workbook if workbook is not None else xlsxwriter.Workbook(
+            file_name, {'nan_inf_to_errors': True, 'constant_memory': True})
+        self.__sheet_name = sheet_name
+        self.__sheet = None
+        self.__headers = None
+        self.__row = 0
+
+    def __addSheet(self):
+        """ Add next worksheet, named after table with a number if the name is taken """
+
+        if self.__sheet_name is None:
+            return self.__workbook.add_worksheet()
+        base = self.SHEET_NAME_INVALID.sub("_", self.__sheet_name)
+        name = base[:self.MAX_SHEET_NAME]
+        number = 1
+        while self.__workbook.get_worksheet_by_name(name) is not None:
+            number += 1
+            suffix = " (%i)" % number
+            name = base[:self.MAX_SHEET_NAME - len(suffix)] + suffix
+        return self.__workbook.add_worksheet(name)
+
+    def write_header(self, headers):
+        self.__headers = list(headers)
+        if self.__sheet is None:
+            self.__sheet = self.__addSheet()
+        self.__sheet.write_row(0, 0, self.__headers)
+        self.__row = 1
+
+    def write_rows(self, rows):
+        if self.__sheet is None:
+            self.__sheet = self.__addSheet()
+        sheet = self.__sheet
+        row_id = self.__row
+        for row in rows:
+            if row_id >= self.MAX_ROWS:  # Sheet is full, roll over
+                sheet = self.__sheet = self.__addSheet()
+                row_id = 0
+                if self.__headers is not None:
+                    sheet.write_row(0, 0, self.__headers)
+                    row_id = 1
+            sheet.write_row(row_id, 0, row)
+            row_id += 1
+        self.__row = row_id
+
+    def open_table(self, name, headers):
+        table = PxXlsxWriter(sheet_name=name, workbook=self.__workbook)
+        table.write_header(headers)
+        return table
+
+    def close(self):
+        if self.__owner:
+            self.__workbook.close()